@@ -19,17 +19,59 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///spendsmartusers.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Local category classifier (trained with `flask classifier train`)
+    app.config['LOCAL_CLASSIFIER_PATH'] = os.environ.get('LOCAL_CLASSIFIER_PATH')
+    app.config['LOCAL_CLASSIFIER_CUTOFF'] = float(os.environ.get('LOCAL_CLASSIFIER_CUTOFF', 0.8))
+    
+    # Gemini call limits (seconds); LLM_HEDGE_AFTER enables request hedging
+    app.config['LLM_TIMEOUT'] = float(os.environ.get('LLM_TIMEOUT', 10))
+    app.config['LLM_MAX_CONCURRENCY'] = int(os.environ.get('LLM_MAX_CONCURRENCY', 3))
+    if os.environ.get('LLM_HEDGE_AFTER'):
+        app.config['LLM_HEDGE_AFTER'] = float(os.environ['LLM_HEDGE_AFTER'])
+    # Calls between token/latency summary log lines (0 disables)
+    app.config['LLM_USAGE_LOG_EVERY'] = int(os.environ.get('LLM_USAGE_LOG_EVERY', 100))
+    
+    # Off-peak insights precomputation thread (or run `flask insights precompute` from cron)
+    app.config['INSIGHTS_PRECOMPUTE_ENABLED'] = os.environ.get('INSIGHTS_PRECOMPUTE_ENABLED', '').lower() in ('1', 'true')
+    app.config['INSIGHTS_PRECOMPUTE_WINDOW'] = os.environ.get('INSIGHTS_PRECOMPUTE_WINDOW', '01:00-06:00')
+    
     # Enable CORS for all routes
     CORS(app, origins=['http://localhost:5000', 'http://127.0.0.1:5000'])
     
     # Initialize extensions
-    from app.models import db, User
+    from app.models import db, User, Expense
     db.init_app(app)
     
     # Initialize Flask-Mail for email notifications
     from app.email_service import init_mail
     init_mail(app)
     
+    # Budget alert emails are delivered by a background queue
+    from app.email_queue import email_queue
+    email_queue.init_app(app)
+    
+    # Deadlines, concurrency limit and circuit breaker for Gemini calls
+    from app.llm_client import llm_client
+    llm_client.init_app(app)
+    
+    # Cache for AI categorization results
+    from app.categorization_cache import categorization_cache
+    categorization_cache.init_app(app)
+    from app.category_memory import category_memory
+    category_memory.init_app(app)
+    from app.typeahead import typeahead
+    typeahead.init_app(app)
+    
+    # AI insights cached per user and period until their expenses change
+    from app.insights_cache import insights_cache
+    insights_cache.init_app(app)
+    from app.insights_precompute import insights_precomputer
+    insights_precomputer.init_app(app)
+    
+    # Per-user daily spending series for charts and trends
+    from app.daily_spend import daily_spend_store
+    daily_spend_store.init_app(app)
+    
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -44,11 +86,29 @@ def create_app():
     # Create database tables
     with app.app_context():
         db.create_all()
+        # create_all skips indexes added to tables that already exist
+        for index in Expense.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        # Rollup tables added to an existing database start empty
+        from app.rollups import backfill_rollups
+        backfill_rollups()
     
     # Register blueprints
     from app.routes import main
     app.register_blueprint(main)
     
+    # Register maintenance CLI commands
+    from app.rollups import rollups_cli
+    app.cli.add_command(rollups_cli)
+    from app.email_queue import email_cli
+    app.cli.add_command(email_cli)
+    from app.categorization_cache import cache_cli
+    app.cli.add_command(cache_cli)
+    from app.local_classifier import classifier_cli
+    app.cli.add_command(classifier_cli)
+    from app.insights_precompute import insights_cli
+    app.cli.add_command(insights_cli)
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
@@ -0,0 +1,33 @@
+"""
+Database-side aggregation helpers for expense statistics
+
+These functions push SUM/COUNT/GROUP BY work into the database and return
+plain tuples, so callers never hydrate Expense ORM objects just
+to add up amounts.
+"""
+from sqlalchemy import func
+from app.models import db, Expense
+
+
+def category_breakdown(user_id, *criteria):
+    """
+    Per-category count and sum of a user's expenses
+
+    Args:
+        user_id: Owner of the expenses
+        *criteria: Extra SQLAlchemy filter expressions on Expense
+
+    Returns:
+        List of (category, count, total_amount) tuples, largest total first
+    """
+    total = func.sum(Expense.amount)
+    rows = db.session.query(
+        Expense.category,
+        func.count(Expense.id),
+        total
+    ).filter(
+        Expense.user_id == user_id, *criteria
+    ).group_by(Expense.category).order_by(total.desc()).all()
+
+    return [(category, int(count), float(amount)) for category, count, amount in rows]
+
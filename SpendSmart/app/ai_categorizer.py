@@ -5,24 +5,65 @@ import os
 import json
 from typing import Optional, Dict, Any
 
-# Try to import google.generativeai, fallback if not available
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+from app.keyword_matcher import KeywordMatcher
+from app.gemini_models import GEMINI_AVAILABLE, CATEGORIZATION_MODEL, get_model
+from app.llm_client import llm_client
+
+if not GEMINI_AVAILABLE:
     print("Warning: google-generativeai not available. AI categorization will use fallback methods.")
 
 class AICategorizer:
-    def __init__(self, api_key: str):
-        """Initialize the AI categorizer with Gemini API key"""
+    # Weight of one keyword hit per category; food keywords win ties so
+    # dishes are not misread as other categories
+    CATEGORY_WEIGHTS = {'Food & Dining': 1.2, 'Others': 0.5}
+    
+    # Items packed into one prompt by categorize_batch
+    BATCH_SIZE = 25
+    
+    # Greedy decoding, so the same item is scored the same way every time
+    SCORING_CONFIG = {'temperature': 0}
+    
+    # Categories less likely than this are not offered as suggestions
+    MIN_SUGGESTION_PROBABILITY = 0.05
+    
+    # Category guide opening every categorization prompt. The pinned SDK
+    # has no system_instruction, so it is sent as the same fixed prefix of
+    # the single and batch prompts instead.
+    INSTRUCTIONS = (
+        "Categorize personal expenses (amounts in Rs.). Categories:\n"
+        "Food & Dining: anything eaten or drunk - restaurants, groceries, delivery, snacks, sweets, "
+        "Indian dishes (biryani, paneer tikka, dosa, gulab jamun)\n"
+        "Transportation: cabs, auto, bus, train, metro, fuel, parking, flights\n"
+        "Shopping: stores, online shopping, clothes, shoes, electronics\n"
+        "Entertainment: movies, streaming, games, concerts, sports, shows\n"
+        "Bills & Utilities: electricity, water, internet, mobile recharge, rent, insurance\n"
+        "Healthcare: doctor, pharmacy, medicines, dental, checkups\n"
+        "Education: courses, books, tuition, fees, training\n"
+        "Others: anything else"
+    )
+    
+    def __init__(self, api_key: str, cache=None, classifier=None, classifier_cutoff: float = 0.8, llm=None):
+        """
+        Initialize the AI categorizer with Gemini API key
+        
+        Args:
+            api_key: Gemini API key (None for rule-based only)
+            cache: Optional CategorizationCache for model results
+            classifier: Optional LocalClassifier consulted before the LLM
+            classifier_cutoff: Minimum local confidence; below it the item
+                is escalated to the LLM
+            llm: LLMClient for model calls (defaults to the shared client)
+        """
         self.api_key = api_key
+        self.cache = cache
+        self.classifier = classifier
+        self.classifier_cutoff = classifier_cutoff
+        self.llm = llm or llm_client
         self.model = None
         
         if GEMINI_AVAILABLE and api_key:
             try:
-                genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-2.5-flash')
+                self.model = get_model(CATEGORIZATION_MODEL, api_key)
             except Exception as e:
                 print(f"Failed to initialize Gemini API: {e}")
                 self.model = None
@@ -51,81 +92,309 @@ class AICategorizer:
                 'chinese', 'italian', 'mexican', 'thai', 'continental', 'fast food', 'street food'
             ],
             'Transportation': ['transport', 'uber', 'taxi', 'bus', 'train', 'metro', 'gas', 'fuel', 'parking', 'toll', 'flight', 'car', 'ola', 'auto', 'rickshaw'],
-            'Shopping': ['shop', 'store', 'mall', 'amazon', 'flipkart', 'clothes', 'shoes', 'electronics', 'retail', 'purchase', 'buy', 'myntra'],
+            'Shopping': ['shop', 'shopping', 'store', 'mall', 'amazon', 'flipkart', 'clothes', 'shoes', 'electronics', 'retail', 'purchase', 'buy', 'myntra'],
             'Entertainment': ['entertainment', 'netflix', 'movie', 'cinema', 'theater', 'theatre', 'game', 'gaming', 'sports', 'concert', 'show', 'prime', 'hotstar'],
             'Bills & Utilities': ['bill', 'utility', 'electric', 'electricity', 'water', 'internet', 'phone', 'mobile', 'rent', 'mortgage', 'insurance', 'recharge'],
             'Healthcare': ['health', 'medical', 'doctor', 'pharmacy', 'medicine', 'hospital', 'clinic', 'dental', 'dentist', 'checkup'],
             'Education': ['education', 'school', 'college', 'course', 'book', 'tuition', 'learning', 'training', 'class', 'study'],
             'Others': ['other', 'misc', 'miscellaneous']
         }
+        
+        # Compiled once; scans text for every keyword in a single pass
+        self.matcher = KeywordMatcher(self.categories, self.CATEGORY_WEIGHTS)
     
-    def categorize_expense(self, item_name: str, amount: float = None) -> Dict[str, Any]:
+    def score_expense(self, item_name: str, amount: float = None) -> Dict[str, Any]:
         """
-        Categorize an expense using AI
+        Score every category for an expense in one pass
+        
+        A confident local prediction, a cached result or a single model
+        call yields a probability for all categories; without a model the
+        keyword rules (then the local classifier) are used.
+        categorize_expense and get_suggested_categories are views of this
+        result, so both cost at most one model call per item.
         
         Args:
             item_name: The name/description of the expense
             amount: Optional amount for context
             
         Returns:
-            Dict with category, confidence, and reasoning
+            Dict with 'scores' (every category as category/probability/reason,
+            most likely first, probabilities summing to 1), 'reasoning' for
+            the top category and 'method'
         """
         # If AI model is not available, use fallback
         if not self.model:
-            return self._fallback_categorization(item_name)
+            return self._score_with_rules([item_name])[0]
+        
+        # Confident local predictions never reach the LLM
+        local = self._local_scores([item_name])[0]
+        if local:
+            return local
+        
+        if self.cache:
+            cached = self.cache.get('scores', item_name, amount)
+            if cached is not None:
+                return cached
         
         try:
             # Create a prompt for the AI
             prompt = self._create_categorization_prompt(item_name, amount)
             
-            # Get AI response
-            response = self.model.generate_content(prompt)
+            # Get AI response; temperature 0 so repeated items score the same
+            response_text = self.llm.generate(
+                self.model, prompt, call_site='categorize', generation_config=self.SCORING_CONFIG
+            )
             
             # Parse the response
-            result = self._parse_ai_response(response.text)
+            scored = self._parse_ai_response(response_text)
+            
+            # Keep only answers that came from the model
+            if self.cache and scored['method'] in ('ai', 'ai_keyword'):
+                self.cache.put('scores', item_name, amount, scored)
             
-            return result
+            return scored
             
         except Exception as e:
             print(f"AI categorization error: {e}")
             # Fallback to rule-based categorization
-            return self._fallback_categorization(item_name)
+            return self._rule_scores(item_name)
     
-    def _create_categorization_prompt(self, item_name: str, amount: float = None) -> str:
-        """Create a prompt for the AI model"""
-        amount_context = f" (Amount: Rs. {amount})" if amount else ""
+    def categorize_expense(self, item_name: str, amount: float = None) -> Dict[str, Any]:
+        """
+        Categorize an expense using AI
         
-        prompt = f"""
-        Categorize this expense item: "{item_name}"{amount_context}
+        Args:
+            item_name: The name/description of the expense
+            amount: Optional amount for context
+            
+        Returns:
+            Dict with category, confidence, and reasoning
+        """
+        return self.top_category(self.score_expense(item_name, amount))
+    
+    def get_suggested_categories(self, item_name: str, amount: float = None) -> list:
+        """Get multiple category suggestions for an item"""
+        return self.suggestions(self.score_expense(item_name, amount))
+    
+    @staticmethod
+    def top_category(scored: Dict[str, Any]) -> Dict[str, Any]:
+        """Single-category view of a score_expense result"""
+        top = scored['scores'][0]
+        return {
+            'category': top['category'],
+            'confidence': top['probability'],
+            'reasoning': scored['reasoning'],
+            'method': scored['method']
+        }
+    
+    @classmethod
+    def suggestions(cls, scored: Dict[str, Any]) -> list:
+        """Top-3 view of a score_expense result, leaving out unlikely categories"""
+        return [
+            {'category': entry['category'], 'confidence': entry['probability'], 'reason': entry['reason']}
+            for entry in scored['scores'][:3]
+            if entry['probability'] >= cls.MIN_SUGGESTION_PROBABILITY
+        ]
+    
+    def _distribution(self, probabilities: Dict[str, float], reasons: Dict[str, str],
+                      reasoning: str, method: str) -> Dict[str, Any]:
+        """
+        Build a score_expense result from raw category weights
         
-        Available categories:
-        - Food & Dining: ALL food items including restaurants, cafes, groceries, food delivery, snacks, desserts, beverages, Indian food (biryani, curry, paneer, tikka, dosa, samosa, gulab jamun, etc.), international cuisines, fast food, street food, sweets, meals, dining out
-        - Transportation: uber, ola, taxi, auto, rickshaw, bus, train, metro, gas, fuel, parking, public transport, flights
-        - Shopping: retail stores, online shopping (Amazon, Flipkart, Myntra), clothes, shoes, electronics, accessories
-        - Entertainment: movies, games, streaming services (Netflix, Prime, Hotstar), concerts, sports events, shows
-        - Bills & Utilities: electricity, water, internet, phone/mobile recharge, rent, insurance
-        - Healthcare: medical expenses, pharmacy, medicines, doctor visits, dental, health checkups
-        - Education: courses, books, tuition, school/college fees, study materials, training
-        - Others: anything that doesn't fit the above categories
+        Unknown categories and negative weights are dropped and the rest
+        normalized; categories without a weight score 0. Ties keep the
+        category order, so results are deterministic.
+        """
+        weights = {
+            category: max(float(probabilities.get(category) or 0), 0.0)
+            for category in self.categories
+        }
+        total = sum(weights.values())
+        if total <= 0:
+            raise ValueError("No category has a positive score")
+        
+        order = list(self.categories)
+        ranked = sorted(order, key=lambda category: (-weights[category], order.index(category)))
+        default_reason = reasons.get(ranked[0]) or reasoning
+        return {
+            'scores': [
+                {
+                    'category': category,
+                    'probability': round(weights[category] / total, 3),
+                    'reason': reasons.get(category) or default_reason
+                }
+                for category in ranked
+            ],
+            'reasoning': reasoning,
+            'method': method
+        }
+    
+    def _single_answer_scores(self, category: str, confidence: float, reasoning: str, method: str) -> Dict[str, Any]:
+        """Scores for an answer naming one category; the rest is spread evenly"""
+        confidence = min(max(confidence, 0.0), 1.0)
+        others = [name for name in self.categories if name != category]
+        probabilities = {name: (1 - confidence) / len(others) for name in others}
+        probabilities[category] = confidence
+        return self._distribution(probabilities, {}, reasoning, method)
+    
+    def categorize_with_rules(self, item_names: list) -> list:
+        """
+        Categorize many items without API calls
+        
+        Uses the keyword rules, and the local classifier for items no
+        keyword matches.
+        
+        Args:
+            item_names: Expense names/descriptions
+            
+        Returns:
+            List of results in the same order, as returned by categorize_expense
+        """
+        return [self.top_category(scored) for scored in self._score_with_rules(item_names)]
+    
+    def _score_with_rules(self, item_names: list) -> list:
+        """Rule scores per item, replaced by confident local ones where no keyword matched"""
+        results = [self._rule_scores(item_name) for item_name in item_names]
+        unmatched = [position for position, result in enumerate(results) if result['method'] == 'fallback']
+        if unmatched and self.classifier:
+            local = self._local_scores([item_names[position] for position in unmatched])
+            for position, result in zip(unmatched, local):
+                if result:
+                    results[position] = result
+        return results
+    
+    def _local_scores(self, item_names: list) -> list:
+        """Local classifier scores, or None where it is missing or unsure"""
+        if not self.classifier or not item_names:
+            return [None] * len(item_names)
         
-        IMPORTANT: 
-        - ANY food item (including Indian dishes like paneer tikka, chicken soup, gulab jamun, biryani, etc.) should be categorized as "Food & Dining"
-        - Be very specific: if it's something people eat or drink, it's "Food & Dining"
+        reason = 'Learned from previously categorized expenses'
+        results = []
+        for row in self.classifier.predict_proba(item_names):
+            if row.max() <= 0 or row.max() < self.classifier_cutoff:
+                results.append(None)
+            else:
+                probabilities = dict(zip(self.classifier.classes, row.tolist()))
+                results.append(self._distribution(probabilities, {}, reason, 'local_model'))
+        return results
+    
+    def _local_categorizations(self, item_names: list) -> list:
+        """Local classifier results, or None where it is missing or unsure"""
+        return [scored and self.top_category(scored) for scored in self._local_scores(item_names)]
+    
+    def categorize_batch(self, items: list, batch_size: int = None) -> list:
+        """
+        Categorize many items with one model call per batch
         
-        Respond with ONLY a JSON object in this exact format:
-        {{
-            "category": "Category Name",
-            "confidence": 0.95,
-            "reasoning": "Brief explanation of why this category was chosen"
-        }}
+        Confident local predictions and cached items are answered without a
+        call; the rest are packed up to batch_size per prompt. Items the model skips or answers invalidly
+        fall back to the keyword rules individually.
         
-        Be precise and choose the most appropriate category. Confidence should be between 0.0 and 1.0.
+        Args:
+            items: List of (item_name, amount) tuples; amount may be None
+            batch_size: Items per prompt (default BATCH_SIZE)
+            
+        Returns:
+            List of results in the same order, as returned by categorize_expense
         """
+        if not self.model:
+            return self.categorize_with_rules([item_name for item_name, _ in items])
+        
+        batch_size = batch_size or self.BATCH_SIZE
+        results = self._local_categorizations([item_name for item_name, _ in items])
+        pending = []
+        for position, (item_name, amount) in enumerate(items):
+            if results[position]:
+                continue
+            cached = self.cache.get('scores', item_name, amount) if self.cache else None
+            if cached is not None:
+                results[position] = self.top_category(cached)
+            else:
+                pending.append(position)
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            answers = self._request_batch([items[position] for position in chunk])
+            for offset, position in enumerate(chunk):
+                item_name, amount = items[position]
+                result = answers.get(offset)
+                if result is None:
+                    result = self._fallback_categorization(item_name)
+                elif self.cache:
+                    self.cache.put('scores', item_name, amount, self._single_answer_scores(
+                        result['category'], result['confidence'], result['reasoning'], result['method']
+                    ))
+                results[position] = result
+        
+        return results
+    
+    def _request_batch(self, items: list) -> Dict[int, Dict[str, Any]]:
+        """Ask the model for one batch; returns {index: result} for valid answers"""
+        try:
+            response_text = self.llm.generate(self.model, self._create_batch_prompt(items), call_site='categorize_batch')
+            return self._parse_batch_response(response_text, len(items))
+        except Exception as e:
+            print(f"AI batch categorization error: {e}")
+            return {}
+    
+    def _create_batch_prompt(self, items: list) -> str:
+        """Create one prompt listing every item of a batch"""
+        numbered = [
+            {'index': index, 'item': item_name, **({'amount': amount} if amount else {})}
+            for index, (item_name, amount) in enumerate(items)
+        ]
+        
+        return (
+            f"{self.INSTRUCTIONS}\n"
+            f"Items: {json.dumps(numbered, ensure_ascii=False, separators=(',', ':'))}\n"
+            'Reply with only a JSON array, one object per item: '
+            '[{"index":0,"category":"Food & Dining","confidence":0.95,"reasoning":"brief reason"}]'
+        )
+    
+    def _parse_batch_response(self, response_text: str, count: int) -> Dict[int, Dict[str, Any]]:
+        """Parse a batch response, keeping only well-formed answers"""
+        cleaned_text = response_text.strip()
+        start = cleaned_text.find('[')
+        end = cleaned_text.rfind(']') + 1
+        if start == -1 or end <= start:
+            return {}
+        
+        try:
+            entries = json.loads(cleaned_text[start:end])
+        except ValueError:
+            return {}
+        
+        answers = {}
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                index = int(entry['index'])
+                category = entry['category']
+                confidence = float(entry.get('confidence', 0.8))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < count and category in self.categories and index not in answers:
+                answers[index] = {
+                    'category': category,
+                    'confidence': confidence,
+                    'reasoning': entry.get('reasoning', 'AI categorization'),
+                    'method': 'ai'
+                }
+        return answers
+    
+    def _create_categorization_prompt(self, item_name: str, amount: float = None) -> str:
+        """Create a prompt for the AI model"""
+        amount_context = f" (Rs. {amount})" if amount else ""
         
-        return prompt
+        return (
+            f"{self.INSTRUCTIONS}\n"
+            f'Score every category for item: "{item_name}"{amount_context}\n'
+            'Reply with only JSON; scores sum to 1, reasons only for likely categories: '
+            '{"scores":{"Food & Dining":0.9,"Shopping":0.06,"Others":0.04},'
+            '"reasons":{"Food & Dining":"why it fits"},"reasoning":"why the top category"}'
+        )
     
     def _parse_ai_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse the AI response and extract category information"""
+        """Parse the AI response into category scores"""
         try:
             # Clean the response text
             cleaned_text = response_text.strip()
@@ -139,134 +408,71 @@ class AICategorizer:
                 result = json.loads(json_str)
                 
                 # Validate the result
-                if 'category' in result and 'confidence' in result:
-                    return {
-                        'category': result['category'],
-                        'confidence': float(result['confidence']),
-                        'reasoning': result.get('reasoning', 'AI categorization'),
-                        'method': 'ai'
-                    }
+                if isinstance(result.get('scores'), dict):
+                    reasons = result.get('reasons') if isinstance(result.get('reasons'), dict) else {}
+                    return self._distribution(
+                        result['scores'], reasons, result.get('reasoning', 'AI categorization'), 'ai'
+                    )
+                
+                # A single answer, as in the older response format
+                if result.get('category') in self.categories and 'confidence' in result:
+                    return self._single_answer_scores(
+                        result['category'], float(result['confidence']),
+                        result.get('reasoning', 'AI categorization'), 'ai'
+                    )
             
             # If JSON parsing fails, try to extract category from text
             return self._extract_category_from_text(cleaned_text)
             
         except Exception as e:
             print(f"Error parsing AI response: {e}")
-            return self._fallback_categorization("")
+            return self._rule_scores("")
     
     def _extract_category_from_text(self, text: str) -> Dict[str, Any]:
         """Extract category from unstructured AI response"""
-        text_lower = text.lower()
-        
-        # Look for category mentions
-        for category, keywords in self.categories.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    return {
-                        'category': category,
-                        'confidence': 0.8,
-                        'reasoning': f'Matched keyword: {keyword}',
-                        'method': 'ai_keyword'
-                    }
+        ranked = self.matcher.rank(text)
+        if ranked:
+            return self._single_answer_scores(
+                ranked[0].category, 0.8, f'Matched keyword: {ranked[0].keywords[0]}', 'ai_keyword'
+            )
         
-        return self._fallback_categorization("")
+        return self._rule_scores("")
     
-    def _fallback_categorization(self, item_name: str) -> Dict[str, Any]:
-        """Fallback rule-based categorization with better food detection"""
-        item_lower = item_name.lower().strip()
+    def _rule_scores(self, item_name: str) -> Dict[str, Any]:
+        """
+        Keyword-rule scores with better food detection
         
-        # Priority check for Food & Dining (check first to avoid misclassification)
-        food_keywords = self.categories.get('Food & Dining', [])
-        for keyword in food_keywords:
-            if keyword in item_lower:
-                return {
-                    'category': 'Food & Dining',
-                    'confidence': 0.85,
-                    'reasoning': f'Food item detected: {keyword}',
-                    'method': 'rule_based'
-                }
+        The best match gets 0.85 (food) or 0.7; other matched categories
+        share the rest by keyword weight, or it is spread evenly when only
+        one category matched.
+        """
+        ranked = self.matcher.rank(item_name)
         
-        # Check other categories
-        for category, keywords in self.categories.items():
-            if category == 'Food & Dining':
-                continue  # Already checked
-            
-            for keyword in keywords:
-                if keyword in item_lower:
-                    return {
-                        'category': category,
-                        'confidence': 0.7,
-                        'reasoning': f'Rule-based match: {keyword}',
-                        'method': 'rule_based'
-                    }
+        if not ranked:
+            return self._distribution(
+                {'Others': 0.5, 'Food & Dining': 0.3, 'Shopping': 0.2},
+                {'Others': 'No specific match found', 'Food & Dining': 'Common category', 'Shopping': 'Common category'},
+                'No specific match found', 'fallback'
+            )
         
-        return {
-            'category': 'Others',
-            'confidence': 0.5,
-            'reasoning': 'No specific match found',
-            'method': 'fallback'
-        }
-    
-    def get_suggested_categories(self, item_name: str) -> list:
-        """Get multiple category suggestions for an item"""
-        # If AI model is not available, use fallback
-        if not self.model:
-            return self._fallback_suggestions(item_name)
+        top = ranked[0]
+        if top.category == 'Food & Dining':
+            confidence, reasoning = 0.85, f'Food item detected: {top.keywords[0]}'
+        else:
+            confidence, reasoning = 0.7, f'Rule-based match: {top.keywords[0]}'
+        if len(ranked) == 1:
+            return self._single_answer_scores(top.category, confidence, reasoning, 'rule_based')
         
-        try:
-            prompt = f"""
-            For the expense item "{item_name}", suggest the top 3 most likely categories.
-            
-            Available categories: Food & Dining, Transportation, Shopping, Entertainment, Bills & Utilities, Healthcare, Education, Others
-            
-            Respond with a JSON array of objects:
-            [
-                {{"category": "Category Name", "confidence": 0.9, "reason": "Why this category fits"}},
-                {{"category": "Category Name", "confidence": 0.7, "reason": "Why this category fits"}},
-                {{"category": "Category Name", "confidence": 0.5, "reason": "Why this category fits"}}
-            ]
-            """
-            
-            response = self.model.generate_content(prompt)
-            
-            # Parse response
-            cleaned_text = response.text.strip()
-            if '[' in cleaned_text and ']' in cleaned_text:
-                start = cleaned_text.find('[')
-                end = cleaned_text.rfind(']') + 1
-                json_str = cleaned_text[start:end]
-                
-                suggestions = json.loads(json_str)
-                return suggestions[:3]  # Return top 3
-            
-        except Exception as e:
-            print(f"Error getting suggestions: {e}")
-        
-        # Fallback to simple suggestions
-        return self._fallback_suggestions(item_name)
+        runners_up = sum(entry.score for entry in ranked[1:])
+        probabilities = {entry.category: (1 - confidence) * entry.score / runners_up for entry in ranked[1:]}
+        probabilities[top.category] = confidence
+        reasons = {entry.category: f'Matched keyword: {entry.keywords[0]}' for entry in ranked}
+        return self._distribution(probabilities, reasons, reasoning, 'rule_based')
+    
+    def _fallback_categorization(self, item_name: str) -> Dict[str, Any]:
+        """Fallback rule-based categorization with better food detection"""
+        return self.top_category(self._rule_scores(item_name))
     
     def _fallback_suggestions(self, item_name: str) -> list:
         """Fallback suggestions based on keywords"""
-        item_lower = item_name.lower()
-        suggestions = []
-        
-        # Find matching categories
-        for category, keywords in self.categories.items():
-            for keyword in keywords:
-                if keyword in item_lower:
-                    suggestions.append({
-                        'category': category,
-                        'confidence': 0.8,
-                        'reason': f'Matched keyword: {keyword}'
-                    })
-                    break
-        
-        # If no matches, return default suggestions
-        if not suggestions:
-            suggestions = [
-                {'category': 'Others', 'confidence': 0.5, 'reason': 'No specific match found'},
-                {'category': 'Food & Dining', 'confidence': 0.3, 'reason': 'Common category'},
-                {'category': 'Shopping', 'confidence': 0.2, 'reason': 'Common category'}
-            ]
-        
-        return suggestions[:3]
+        return self.suggestions(self._rule_scores(item_name))
@@ -3,28 +3,31 @@ AI-powered financial insights and pattern recognition
 """
 import os
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Any, Optional
-from collections import defaultdict
 
-# Try to import google.generativeai, fallback if not available
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+from app.gemini_models import GEMINI_AVAILABLE, INSIGHTS_MODEL, get_model
+from app.llm_client import llm_client
+from app.spending_columns import SpendingColumns, day_number
+from app.trends import trend_report
+
+if not GEMINI_AVAILABLE:
     print("Warning: google-generativeai not available. AI insights will use fallback methods.")
 
+def is_fallback(result: Dict[str, Any]) -> bool:
+    """Whether insights are the rule-based stand-in for a model answer (not worth caching)"""
+    return result.get('source') == 'fallback'
+
 class AIInsightsGenerator:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, llm=None):
         """Initialize the AI insights generator"""
         self.api_key = api_key
+        self.llm = llm or llm_client
         self.model = None
         
         if GEMINI_AVAILABLE and api_key:
             try:
-                genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-2.5-flash')
+                self.model = get_model(INSIGHTS_MODEL, api_key)
             except Exception as e:
                 print(f"Failed to initialize Gemini API for insights: {e}")
                 self.model = None
@@ -34,23 +37,22 @@ class AIInsightsGenerator:
         Generate AI-powered financial insights
         
         Args:
-            expenses: List of expense records
+            expenses: List of expense records, or SpendingColumns
             time_period: Analysis period ("week", "month", "all")
             
         Returns:
-            Dict with insights, recommendations, and patterns
+            Dict with insights, recommendations, and patterns; 'source' is
+            'fallback' when they are rule-based because the model was
+            unavailable or gave no usable answer
         """
-        if not expenses:
+        if not len(expenses):
             return self._empty_insights()
         
-        # Filter expenses by time period
-        filtered_expenses = self._filter_by_period(expenses, time_period)
-        
-        if not filtered_expenses:
+        # Filter expenses by time period and calculate basic analytics
+        columns = self._columns(expenses).for_period(time_period)
+        if not len(columns):
             return self._empty_insights()
-        
-        # Calculate basic analytics
-        analytics = self._calculate_analytics(filtered_expenses, time_period)
+        analytics = columns.analytics(time_period)
         
         # Generate AI insights if model is available
         if self.model:
@@ -63,6 +65,7 @@ class AIInsightsGenerator:
                     'recommendations': ai_insights['recommendations'],
                     'patterns': ai_insights['patterns'],
                     'alerts': self._generate_budget_alerts(analytics),
+                    'source': 'fallback' if is_fallback(ai_insights) else 'ai',
                     'generated_at': datetime.now().isoformat()
                 }
             except Exception as e:
@@ -71,79 +74,20 @@ class AIInsightsGenerator:
         else:
             return self._fallback_insights(analytics)
     
-    def _filter_by_period(self, expenses: List[Dict], period: str) -> List[Dict]:
-        """Filter expenses by time period"""
-        now = datetime.now()
-        
-        if period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
-        else:  # all
+    @staticmethod
+    def _columns(expenses) -> SpendingColumns:
+        """Expenses as SpendingColumns (converted from records if needed)"""
+        if isinstance(expenses, SpendingColumns):
             return expenses
-        
-        filtered = []
-        for expense in expenses:
-            expense_date = datetime.strptime(expense['date'], '%Y-%m-%d')
-            if expense_date >= start_date:
-                filtered.append(expense)
-        
-        return filtered
-    
-    def _calculate_analytics(self, expenses: List[Dict], period: str) -> Dict[str, Any]:
-        """Calculate spending analytics"""
-        total_amount = sum(expense['amount'] for expense in expenses)
-        
-        # Category breakdown
-        category_totals = defaultdict(float)
-        category_counts = defaultdict(int)
-        
-        for expense in expenses:
-            category = expense['category']
-            amount = expense['amount']
-            category_totals[category] += amount
-            category_counts[category] += 1
-        
-        # Calculate percentages
-        category_percentages = {}
-        for category, amount in category_totals.items():
-            category_percentages[category] = (amount / total_amount * 100) if total_amount > 0 else 0
-        
-        # Daily spending pattern
-        daily_spending = defaultdict(float)
-        for expense in expenses:
-            date = expense['date']
-            daily_spending[date] += expense['amount']
-        
-        # Average spending per day
-        avg_daily = total_amount / len(daily_spending) if daily_spending else 0
-        
-        # Top spending categories
-        top_categories = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        return {
-            'total_amount': round(total_amount, 2),
-            'total_expenses': len(expenses),
-            'category_breakdown': dict(category_totals),
-            'category_percentages': category_percentages,
-            'category_counts': dict(category_counts),
-            'daily_spending': dict(daily_spending),
-            'avg_daily_spending': round(avg_daily, 2),
-            'top_categories': top_categories,
-            'period': period,
-            'date_range': {
-                'start': min(expense['date'] for expense in expenses) if expenses else None,
-                'end': max(expense['date'] for expense in expenses) if expenses else None
-            }
-        }
+        return SpendingColumns.from_records(expenses)
     
     def _generate_ai_insights(self, analytics: Dict, period: str) -> Dict[str, Any]:
         """Generate AI-powered insights using Gemini"""
         prompt = self._create_insights_prompt(analytics, period)
         
         try:
-            response = self.model.generate_content(prompt)
-            return self._parse_ai_response(response.text)
+            response_text = self.llm.generate(self.model, prompt, call_site='insights')
+            return self._parse_ai_response(response_text)
         except Exception as e:
             print(f"AI insights generation error: {e}")
             return self._fallback_insights(analytics)
@@ -152,50 +96,22 @@ class AIInsightsGenerator:
         """Create prompt for AI insights generation"""
         total_amount = analytics['total_amount']
         category_percentages = analytics['category_percentages']
-        top_categories = analytics['top_categories']
         avg_daily = analytics['avg_daily_spending']
         
-        prompt = f"""
-        Analyze this spending data for the past {period} and provide CONCISE financial insights:
-        
-        Total Spending: ${total_amount}
-        Average Daily Spending: ${avg_daily}
-        Top Categories: {', '.join([f"{cat}: {amount:.1f}%" for cat, amount in top_categories])}
-        
-        Category Breakdown:
-        {json.dumps(category_percentages, indent=2)}
-        
-        IMPORTANT: Keep each point under 100 characters. Be brief and direct.
-        
-        Provide:
-        1. 2-3 SHORT key insights (what stands out in spending)
-        2. 2-3 BRIEF actionable recommendations (how to improve)
-        3. 1-2 CONCISE patterns (spending behaviors)
-        
-        Respond in JSON format:
-        {{
-            "insights": [
-                "Brief insight 1",
-                "Brief insight 2"
-            ],
-            "recommendations": [
-                "Quick actionable tip 1",
-                "Quick actionable tip 2"
-            ],
-            "patterns": [
-                "Short pattern 1",
-                "Short pattern 2"
-            ]
-        }}
-        
-        RULES:
-        - Each point: 60-100 characters max
-        - Use simple language
-        - Be specific with numbers/percentages
-        - Focus on the most impactful insights
-        """
+        # Largest share first, so the breakdown doubles as the top categories
+        breakdown = {
+            category: round(percentage, 1)
+            for category, percentage in sorted(category_percentages.items(), key=lambda entry: -entry[1])
+        }
         
-        return prompt
+        return (
+            f"Analyze this spending for the past {period}.\n"
+            f"Total: {total_amount:.2f}; average per day: {avg_daily:.2f}\n"
+            f"Category shares (%): {json.dumps(breakdown, separators=(',', ':'))}\n"
+            "Give 2-3 key insights, 2-3 actionable recommendations and 1-2 spending patterns. "
+            "Each point 60-100 characters, simple language, specific numbers.\n"
+            'Reply with only JSON: {"insights":["..."],"recommendations":["..."],"patterns":["..."]}'
+        )
     
     def _parse_ai_response(self, response_text: str) -> Dict[str, Any]:
         """Parse AI response and extract insights"""
@@ -255,7 +171,8 @@ class AIInsightsGenerator:
         return {
             'insights': insights,
             'recommendations': recommendations,
-            'patterns': patterns
+            'patterns': patterns,
+            'source': 'fallback'
         }
     
     def _generate_budget_alerts(self, analytics: Dict) -> List[Dict[str, Any]]:
@@ -305,51 +222,12 @@ class AIInsightsGenerator:
             'generated_at': datetime.now().isoformat()
         }
     
-    def get_spending_trends(self, expenses: List[Dict], days: int = 30) -> Dict[str, Any]:
-        """Analyze spending trends over time"""
-        if not expenses:
-            return {'trend': 'stable', 'change': 0, 'message': 'No data available'}
-        
-        # Sort expenses by date
-        sorted_expenses = sorted(expenses, key=lambda x: x['date'])
-        
-        if len(sorted_expenses) < 2:
-            return {'trend': 'stable', 'change': 0, 'message': 'Insufficient data for trend analysis'}
-        
-        # Calculate daily spending
-        daily_totals = defaultdict(float)
-        for expense in sorted_expenses:
-            daily_totals[expense['date']] += expense['amount']
-        
-        # Calculate trend
-        dates = sorted(daily_totals.keys())
-        if len(dates) < 2:
-            return {'trend': 'stable', 'change': 0, 'message': 'Insufficient data for trend analysis'}
-        
-        # Simple trend calculation (first half vs second half)
-        mid_point = len(dates) // 2
-        first_half = sum(daily_totals[date] for date in dates[:mid_point])
-        second_half = sum(daily_totals[date] for date in dates[mid_point:])
-        
-        if first_half == 0:
-            change_percent = 100 if second_half > 0 else 0
-        else:
-            change_percent = ((second_half - first_half) / first_half) * 100
-        
-        if change_percent > 10:
-            trend = 'increasing'
-            message = f'Spending increased by {change_percent:.1f}%'
-        elif change_percent < -10:
-            trend = 'decreasing'
-            message = f'Spending decreased by {abs(change_percent):.1f}%'
-        else:
-            trend = 'stable'
-            message = f'Spending is relatively stable ({change_percent:.1f}% change)'
+    def daily_trends(self, daily_totals, start) -> Dict[str, Any]:
+        """
+        Analyze spending trends from zero-filled per-day totals (see trends.trend_report)
         
-        return {
-            'trend': trend,
-            'change': round(change_percent, 1),
-            'message': message,
-            'first_half_total': round(first_half, 2),
-            'second_half_total': round(second_half, 2)
-        }
+        Args:
+            daily_totals: Spending per day, oldest first
+            start: Date of daily_totals[0]
+        """
+        return trend_report(daily_totals, day_number(start))
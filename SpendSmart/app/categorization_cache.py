@@ -0,0 +1,287 @@
+"""
+Two-tier cache for AI categorization results
+
+Results are keyed on the normalized item text plus an amount bucket, so
+'Chai', 'chai ' and 'CHAI!' share one entry across all users. Tier one is
+an in-process LRU with a TTL; tier two is the categorization_cache table,
+which survives restarts and is shared by every worker process. Only
+answers that came from the model are cached, so Gemini latency and quota
+are paid once per distinct string. Database hits are counted in memory and
+written with the next stored result or prune, so a lookup never commits
+the caller's session.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, CategorizationCacheEntry
+from app.text_normalize import normalize_item
+
+DEFAULT_MEMORY_SIZE = 2048
+DEFAULT_MEMORY_TTL = 3600
+DEFAULT_DB_TTL_DAYS = 30
+DEFAULT_DB_MAX_ROWS = 100000
+
+# Table size is checked once per this many stored results
+PRUNE_EVERY = 100
+
+ITEM_KEY_LENGTH = 200
+
+
+def amount_bucket(amount):
+    """
+    Bucket an amount by powers of two (-1 when there is no amount)
+
+    Amounts in the same bucket (e.g. 64-127) share a cached category; the
+    amount only nudges the model, so exact values are not worth a miss.
+    """
+    if amount in (None, ''):
+        return -1
+    try:
+        return int(abs(float(amount))).bit_length()
+    except (TypeError, ValueError):
+        return -1
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with per-entry expiry"""
+
+    def __init__(self, max_size=DEFAULT_MEMORY_SIZE, ttl=DEFAULT_MEMORY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Value for key, or None if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CategorizationCache:
+    """Memory LRU in front of the categorization_cache table"""
+
+    def __init__(self):
+        self.memory = LRUCache()
+        self.db_ttl = timedelta(days=DEFAULT_DB_TTL_DAYS)
+        self.db_max_rows = DEFAULT_DB_MAX_ROWS
+        self._counter_lock = threading.Lock()
+        self._writes = 0
+        # key -> (hits, latest hit time) not yet written to the table
+        self._pending_hits = {}
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.db_evictions = 0
+
+    def init_app(self, app):
+        """Configure tiers from CATEGORIZATION_CACHE_* app settings"""
+        app.config.setdefault('CATEGORIZATION_CACHE_SIZE', DEFAULT_MEMORY_SIZE)
+        app.config.setdefault('CATEGORIZATION_CACHE_TTL', DEFAULT_MEMORY_TTL)
+        app.config.setdefault('CATEGORIZATION_CACHE_DB_TTL_DAYS', DEFAULT_DB_TTL_DAYS)
+        app.config.setdefault('CATEGORIZATION_CACHE_DB_MAX_ROWS', DEFAULT_DB_MAX_ROWS)
+        self.memory = LRUCache(app.config['CATEGORIZATION_CACHE_SIZE'], app.config['CATEGORIZATION_CACHE_TTL'])
+        self.db_ttl = timedelta(days=app.config['CATEGORIZATION_CACHE_DB_TTL_DAYS'])
+        self.db_max_rows = app.config['CATEGORIZATION_CACHE_DB_MAX_ROWS']
+
+    def _count(self, counter):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def make_key(kind, item_name, amount=None):
+        """(kind, normalized item, amount bucket) cache key"""
+        return kind, normalize_item(item_name)[:ITEM_KEY_LENGTH], amount_bucket(amount)
+
+    def get(self, kind, item_name, amount=None):
+        """
+        Cached result for an item, checking memory then the database
+
+        Returns:
+            The stored result, or None on a miss
+        """
+        key = self.make_key(kind, item_name, amount)
+        if not key[1]:
+            return None
+
+        result = self.memory.get(key)
+        if result is not None:
+            self._count('memory_hits')
+            return result
+
+        entry = db.session.get(CategorizationCacheEntry, key)
+        if entry is None or entry.created_at < datetime.utcnow() - self.db_ttl:
+            self._count('misses')
+            return None
+
+        self._count('db_hits')
+        result = json.loads(entry.result)
+        self.memory.put(key, result)
+        with self._counter_lock:
+            hits, _last_hit_at = self._pending_hits.get(key, (0, None))
+            self._pending_hits[key] = (hits + 1, datetime.utcnow())
+        return result
+
+    def _write_hits(self):
+        """Add counted database hits to their rows in the current session (no commit)"""
+        with self._counter_lock:
+            pending, self._pending_hits = self._pending_hits, {}
+        for (kind, item_key, bucket), (hits, last_hit_at) in pending.items():
+            db.session.execute(
+                update(CategorizationCacheEntry).where(
+                    CategorizationCacheEntry.kind == kind,
+                    CategorizationCacheEntry.item_key == item_key,
+                    CategorizationCacheEntry.amount_bucket == bucket
+                ).values(
+                    hit_count=CategorizationCacheEntry.hit_count + hits,
+                    last_hit_at=last_hit_at
+                ).execution_options(synchronize_session=False)
+            )
+
+    def peek(self, kind, item_name, amount=None):
+        """Cached result from the memory tier only (no database read)"""
+        key = self.make_key(kind, item_name, amount)
+        if not key[1]:
+            return None
+        result = self.memory.get(key)
+        if result is not None:
+            self._count('memory_hits')
+        return result
+
+    def put(self, kind, item_name, amount, result):
+        """Store a model result in both tiers (commits)"""
+        key = self.make_key(kind, item_name, amount)
+        if not key[1]:
+            return
+
+        self.memory.put(key, result)
+        try:
+            entry = db.session.get(CategorizationCacheEntry, key)
+            if entry is None:
+                entry = CategorizationCacheEntry(kind=key[0], item_key=key[1], amount_bucket=key[2])
+                db.session.add(entry)
+            entry.result = json.dumps(result)
+            entry.created_at = entry.last_hit_at = datetime.utcnow()
+            self._write_hits()
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same key first
+            db.session.rollback()
+            return
+
+        with self._counter_lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """
+        Delete expired rows and the least recently hit rows over the limit
+
+        Returns:
+            Number of rows deleted
+        """
+        # Least recently hit is judged with this process's hits included
+        self._write_hits()
+        removed = db.session.execute(
+            delete(CategorizationCacheEntry).where(
+                CategorizationCacheEntry.created_at < datetime.utcnow() - self.db_ttl
+            )
+        ).rowcount
+
+        excess = db.session.query(CategorizationCacheEntry).count() - self.db_max_rows
+        if excess > 0:
+            cutoff = db.session.query(CategorizationCacheEntry.last_hit_at).order_by(
+                CategorizationCacheEntry.last_hit_at
+            ).offset(excess - 1).limit(1).scalar()
+            removed += db.session.execute(
+                delete(CategorizationCacheEntry).where(CategorizationCacheEntry.last_hit_at <= cutoff)
+            ).rowcount
+
+        db.session.commit()
+        with self._counter_lock:
+            self.db_evictions += removed
+        return removed
+
+    def clear(self):
+        """Empty both tiers"""
+        self.memory.clear()
+        db.session.execute(delete(CategorizationCacheEntry))
+        db.session.commit()
+
+    def stats(self):
+        """Hit/miss/eviction counters for this process"""
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'memory_evictions': self.memory.evictions,
+            'memory_expirations': self.memory.expirations,
+            'db_evictions': self.db_evictions
+        }
+
+
+categorization_cache = CategorizationCache()
+
+
+cache_cli = AppGroup('categorize-cache', help='Inspect and maintain the AI categorization cache.')
+
+
+@cache_cli.command('stats')
+def stats_command():
+    """Show stored entries and most reused items."""
+    rows = db.session.query(CategorizationCacheEntry).count()
+    click.echo(f'{rows} cached results')
+    top = CategorizationCacheEntry.query.order_by(CategorizationCacheEntry.hit_count.desc()).limit(10)
+    for entry in top:
+        click.echo(f'  {entry.hit_count:>6} hits  {entry.kind:<11} {entry.item_key}')
+
+
+@cache_cli.command('prune')
+def prune_command():
+    """Delete expired entries and trim the table to its row limit."""
+    click.echo(f'Removed {categorization_cache.prune()} cached results')
+
+
+@cache_cli.command('clear')
+def clear_command():
+    """Delete every cached result."""
+    categorization_cache.clear()
+    click.echo('Categorization cache cleared')
@@ -0,0 +1,208 @@
+"""
+Per-user memory of how each item has been categorized
+
+Users re-enter the same merchants all the time. CategoryMemory maps a
+user's normalized item names to the categories they were filed under, so
+the most frequent one can be suggested before the keyword rules, the local
+classifier or Gemini are consulted. A user's index is loaded from their
+expenses on first use, updated in place by the expense write routes, and
+reloaded after max_age seconds so other worker processes' writes show up.
+Both the number of users and the items per user are bounded, with least
+recently used entries evicted first.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy import func
+
+from app.models import db, Expense
+from app.text_normalize import normalize_item
+
+DEFAULT_MAX_USERS = 1000
+DEFAULT_MAX_ITEMS_PER_USER = 500
+DEFAULT_MAX_AGE = 300
+
+# Confidence reported for a category the user always picks
+MAX_CONFIDENCE = 0.99
+
+
+class _UserIndex:
+    """One user's normalized item -> Counter of categories, in LRU order"""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.loaded_at = time.monotonic()
+        self.evictions = 0
+
+    def add(self, key, category, count):
+        counts = self.items.get(key)
+        if counts is None:
+            if count <= 0:
+                return
+            counts = self.items[key] = Counter()
+        counts[category] += count
+        if counts[category] <= 0:
+            del counts[category]
+        if not counts:
+            del self.items[key]
+            return
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+
+class CategoryMemory:
+    """Bounded per-user index of past categorizations"""
+
+    def __init__(self, max_users=DEFAULT_MAX_USERS, max_items_per_user=DEFAULT_MAX_ITEMS_PER_USER,
+                 max_age=DEFAULT_MAX_AGE):
+        self.max_users = max_users
+        self.max_items_per_user = max_items_per_user
+        self.max_age = max_age
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.user_evictions = 0
+
+    def init_app(self, app):
+        """Read CATEGORY_MEMORY_* app settings"""
+        self.max_users = app.config.setdefault('CATEGORY_MEMORY_MAX_USERS', DEFAULT_MAX_USERS)
+        self.max_items_per_user = app.config.setdefault('CATEGORY_MEMORY_MAX_ITEMS', DEFAULT_MAX_ITEMS_PER_USER)
+        self.max_age = app.config.setdefault('CATEGORY_MEMORY_MAX_AGE', DEFAULT_MAX_AGE)
+
+    def _load(self, user_id):
+        """Build a user's index from their expenses, most recently used items last"""
+        rows = db.session.query(
+            Expense.item,
+            Expense.category,
+            func.count(Expense.id),
+            func.max(Expense.date)
+        ).filter(
+            Expense.user_id == user_id
+        ).group_by(Expense.item, Expense.category).order_by(func.max(Expense.date))
+
+        index = _UserIndex(self.max_items_per_user)
+        for item, category, count, _last_used in rows:
+            key = normalize_item(item)
+            if key:
+                index.add(key, category, count)
+        return index
+
+    def _index(self, user_id, load=True):
+        """A user's index, loading it (and evicting other users) if needed"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and time.monotonic() - index.loaded_at > self.max_age:
+                del self._users[user_id]
+                index = None
+            if index is not None:
+                self._users.move_to_end(user_id)
+                return index
+        if not load:
+            return None
+
+        index = self._load(user_id)
+        with self._lock:
+            self._users[user_id] = index
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.user_evictions += 1
+        return index
+
+    def lookup(self, user_id, item_name, load=True):
+        """
+        The category this user most often filed an item under
+
+        Args:
+            load: Read the user's expenses if their index is not in memory;
+                with load=False such users just get None
+
+        Returns:
+            Result dict shaped like AICategorizer.categorize_expense
+            (method 'user_history'), or None if the item is new to them
+        """
+        key = normalize_item(item_name)
+        if not key:
+            return None
+        index = self._index(user_id, load)
+        if index is None:
+            return None
+        with self._lock:
+            counts = index.items.get(key)
+            if not counts:
+                return None
+            index.items.move_to_end(key)
+            category, count = counts.most_common(1)[0]
+            total = sum(counts.values())
+
+        times = 'once' if count == 1 else f'{count} times'
+        return {
+            'category': category,
+            'confidence': round(min(count / total, MAX_CONFIDENCE), 2),
+            'reasoning': f'You filed "{key}" under {category} {times}',
+            'method': 'user_history'
+        }
+
+    def complete(self, user_id, prefix, limit=5):
+        """
+        Items of an already loaded user that start with a normalized prefix
+
+        Returns:
+            Up to limit (item, category) pairs, most recently used first
+        """
+        index = self._index(user_id, load=False)
+        if index is None or not prefix:
+            return []
+        matches = []
+        with self._lock:
+            for key in reversed(index.items):
+                if key.startswith(prefix):
+                    matches.append((key, index.items[key].most_common(1)[0][0]))
+                    if len(matches) == limit:
+                        break
+        return matches
+
+    def record(self, user_id, item_name, category, count=1):
+        """
+        Count (or with count=-1, uncount) a categorization after commit
+
+        Users whose index is not loaded are skipped; their next lookup
+        reads the committed rows anyway.
+        """
+        key = normalize_item(item_name)
+        if not key:
+            return
+        index = self._index(user_id, load=False)
+        if index is None:
+            return
+        with self._lock:
+            index.add(key, category, count)
+
+    def loaded(self, user_id):
+        """Whether a user's index is in memory"""
+        with self._lock:
+            return user_id in self._users
+
+    def warm(self, user_id):
+        """Load a user's index ahead of their first lookup"""
+        self._index(user_id)
+
+    def forget(self, user_id):
+        """Drop a user's index (e.g. after a bulk write) so it reloads"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self):
+        """Loaded users, remembered items and eviction counters"""
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'items': sum(len(index.items) for index in self._users.values()),
+                'user_evictions': self.user_evictions,
+                'item_evictions': sum(index.evictions for index in self._users.values())
+            }
+
+
+category_memory = CategoryMemory()
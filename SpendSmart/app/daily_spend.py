@@ -0,0 +1,179 @@
+"""
+Per-user daily spending with prefix sums for chart windows
+
+The spending charts and the trend report ask for per-day totals over a
+window every time the user switches period. DailySpendStore keeps each
+user's recent daily_spending rows (the last history_days days) in memory
+as sorted day numbers with a running total, so any window's total is two
+binary searches and a subtraction and a zero-filled day series costs one
+step per day shown. A user's series is loaded on first use; daily_spending
+changes committed by this process are applied to it directly, and it is
+reloaded after max_age seconds so other worker processes' writes show up.
+The number of users held is bounded, least recently used first.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, timedelta
+from itertools import accumulate
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import db, DailySpending
+
+DEFAULT_MAX_USERS = 1000
+DEFAULT_MAX_AGE = 300
+# Covers the longest chart window: the trends report's 366 days, or the year so far
+DEFAULT_HISTORY_DAYS = 366
+
+# session.info key for daily_spending changes awaiting commit
+PENDING_CHANGES = 'daily_spend_changes'
+
+
+class DailySeries:
+    """One user's spending days (ordinals, ascending) and prefix sums"""
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: (date, total_amount) pairs in date order
+        """
+        self.days = [day.toordinal() for day, _ in rows]
+        self.totals = [total for _, total in rows]
+        self.prefix = [0.0] + list(accumulate(self.totals))
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.days)
+
+    def _span(self, start, end):
+        """Index range of the days in [start, end]"""
+        return (bisect.bisect_left(self.days, start.toordinal()),
+                bisect.bisect_right(self.days, end.toordinal()))
+
+    def total(self, start, end):
+        """Spending from start to end, both inclusive (0 when end is before start)"""
+        low, high = self._span(start, end)
+        return self.prefix[high] - self.prefix[low] if high > low else 0.0
+
+    def filled(self, start, end):
+        """Per-day totals from start to end inclusive, 0.0 for days without spending"""
+        values = [0.0] * ((end - start).days + 1)
+        low, high = self._span(start, end)
+        first = start.toordinal()
+        for position in range(low, high):
+            values[self.days[position] - first] = self.totals[position]
+        return values
+
+    def month_totals(self, year, until=None):
+        """Spending per calendar month of a year, January first, up to `until` if given"""
+        totals = []
+        for month in range(1, 13):
+            start = date(year, month, 1)
+            end = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+            totals.append(self.total(start, min(end, until) if until else end))
+        return totals
+
+    def changed(self, deltas):
+        """
+        A copy with amounts added to some days' totals, keeping loaded_at
+
+        Args:
+            deltas: (date, amount) pairs; days whose total reaches zero are dropped
+        """
+        totals = dict(zip(self.days, self.totals))
+        for day, amount in deltas:
+            totals[day.toordinal()] = totals.get(day.toordinal(), 0.0) + amount
+        # Expense amounts are positive, so anything under half a paisa is float noise
+        series = DailySeries([(date.fromordinal(day), total)
+                              for day, total in sorted(totals.items()) if abs(total) >= 0.005])
+        series.loaded_at = self.loaded_at
+        return series
+
+
+class DailySpendStore:
+    """Bounded per-user cache of DailySeries"""
+
+    def __init__(self, max_users=DEFAULT_MAX_USERS, max_age=DEFAULT_MAX_AGE, history_days=DEFAULT_HISTORY_DAYS):
+        self.max_users = max_users
+        self.max_age = max_age
+        self.history_days = history_days
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.loads = 0
+
+    def init_app(self, app):
+        """Read DAILY_SPEND_* app settings"""
+        self.max_users = app.config.setdefault('DAILY_SPEND_MAX_USERS', DEFAULT_MAX_USERS)
+        self.max_age = app.config.setdefault('DAILY_SPEND_MAX_AGE', DEFAULT_MAX_AGE)
+        self.history_days = app.config.setdefault('DAILY_SPEND_HISTORY_DAYS', DEFAULT_HISTORY_DAYS)
+
+    def series(self, user_id):
+        """A user's DailySeries for the last history_days days, loading it if needed"""
+        with self._lock:
+            series = self._users.get(user_id)
+            if series is not None and time.monotonic() - series.loaded_at <= self.max_age:
+                self._users.move_to_end(user_id)
+                return series
+            writes = self._writes
+
+        rows = db.session.query(DailySpending.day, DailySpending.total_amount).filter(
+            DailySpending.user_id == user_id,
+            DailySpending.day >= date.today() - timedelta(days=self.history_days - 1)
+        ).order_by(DailySpending.day).all()
+        series = DailySeries(rows)
+        with self._lock:
+            self.loads += 1
+            # A write committed while loading may be missing from rows
+            if writes != self._writes:
+                return series
+            self._users[user_id] = series
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return series
+
+    def apply(self, changes):
+        """
+        Add committed daily_spending changes to the series held in memory
+
+        Args:
+            changes: (user_id, date, amount) triples
+        """
+        by_user = defaultdict(list)
+        for user_id, day, amount in changes:
+            by_user[user_id].append((day, amount))
+        with self._lock:
+            self._writes += 1
+            for user_id, deltas in by_user.items():
+                series = self._users.get(user_id)
+                if series is not None:
+                    self._users[user_id] = series.changed(deltas)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._writes += 1
+
+
+daily_spend_store = DailySpendStore()
+
+
+def record_daily_change(user_id, day, amount):
+    """Note a daily_spending change in the current transaction; the store gets it on commit"""
+    db.session.info.setdefault(PENDING_CHANGES, []).append((user_id, day, amount))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_changes(session):
+    changes = session.info.pop(PENDING_CHANGES, None)
+    if changes:
+        daily_spend_store.apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_rolled_back_changes(session, previous_transaction):
+    session.info.pop(PENDING_CHANGES, None)
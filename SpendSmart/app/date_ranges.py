@@ -0,0 +1,41 @@
+"""
+Half-open date ranges for index-friendly expense queries
+
+Filtering with `date >= start AND date < end` lets the database walk the
+(user_id, date) index; wrapping the column in extract() or strftime() forces
+it to evaluate every row of the user instead.
+"""
+from datetime import datetime, timedelta
+
+# Length of each rolling period in days, counted back from today
+PERIOD_DAYS = {
+    'week': 7,
+    'month': 30,
+    'year': 365
+}
+
+
+def period_range(period, today=None):
+    """
+    Get the [start, end) dates of a rolling period ending today
+
+    Args:
+        period: 'week', 'month' or 'year' (unknown values mean 'week')
+        today: Reference date (defaults to the current date)
+
+    Returns:
+        Tuple of (cutoff date, day after today)
+    """
+    today = today or datetime.now().date()
+    days = PERIOD_DAYS.get(period, PERIOD_DAYS['week'])
+    return today - timedelta(days=days), today + timedelta(days=1)
+
+
+def date_range_criteria(column, start, end):
+    """
+    Build half-open range predicates for a date column
+
+    Returns:
+        Tuple of filter expressions: (column >= start, column < end)
+    """
+    return column >= start, column < end
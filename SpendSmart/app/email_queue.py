@@ -0,0 +1,292 @@
+"""
+Background delivery queue for budget alert emails
+
+The request path only writes an EmailOutbox row, in the same transaction
+that sets the budget's warning_email_sent / exceeded_email_sent flag, so an
+alert is enqueued at most once per budget. A dispatcher thread claims due
+rows and hands them to a small worker pool; failed sends are retried with
+exponential backoff until MAIL_QUEUE_MAX_ATTEMPTS is reached. Each worker
+sends its share of a pass as one batch over a pooled SMTP session.
+
+A row is claimed by flipping its status from 'pending' to 'sending' with a
+conditional UPDATE, so several processes can share the outbox without
+sending the same email twice. The claim is a lease: next_attempt_at is
+pushed MAIL_QUEUE_SENDING_TIMEOUT seconds ahead, and a row still in
+'sending' after that (its process crashed mid-send) is claimed again, so
+such an email may be sent twice but is never lost. A batch whose delivery
+raises is put back to 'pending' at once. The dispatcher starts with the
+first request a process serves, so rows left from before a restart are
+delivered without waiting for a new alert.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import or_, update
+
+from app.models import db, EmailOutbox
+from app.email_service import smtp_pool, build_budget_exceeded_message, build_budget_warning_message
+
+# kind -> message builder called with the stored payload as keyword arguments
+EMAIL_BUILDERS = {
+    'exceeded': build_budget_exceeded_message,
+    'warning': build_budget_warning_message
+}
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_SECONDS = 30
+DEFAULT_POLL_SECONDS = 15
+DEFAULT_SENDING_TIMEOUT = 600
+
+# Rows claimed per dispatcher pass
+CLAIM_BATCH_SIZE = 50
+
+
+def enqueue_budget_email(budget, kind, **payload):
+    """
+    Add a budget alert to the outbox and mark it sent on the budget
+
+    Runs in the caller's session and does not commit; committing makes the
+    flag and the outbox row visible together. Call email_queue.wake() after
+    the commit to deliver without waiting for the next poll.
+
+    Args:
+        budget: Budget the alert is for
+        kind: 'warning' or 'exceeded'
+        **payload: Keyword arguments for the matching sender
+    """
+    if kind not in EMAIL_BUILDERS:
+        raise ValueError(f"Unknown email kind: {kind}")
+
+    db.session.add(EmailOutbox(
+        user_id=budget.user_id,
+        budget_id=budget.id,
+        kind=kind,
+        payload=json.dumps(payload),
+        next_attempt_at=datetime.utcnow()
+    ))
+    setattr(budget, f'{kind}_email_sent', True)
+
+
+def retry_delay(attempts, base_seconds):
+    """Backoff before the next attempt after `attempts` failures"""
+    return timedelta(seconds=base_seconds * 2 ** (attempts - 1))
+
+
+class EmailQueue:
+    """Dispatcher thread plus worker pool delivering EmailOutbox rows"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._dispatcher = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read queue settings; threads start with the first request (outside tests) or wake()"""
+        self.app = app
+        app.config.setdefault('MAIL_QUEUE_WORKERS', DEFAULT_WORKERS)
+        app.config.setdefault('MAIL_QUEUE_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        app.config.setdefault('MAIL_QUEUE_RETRY_BASE_SECONDS', DEFAULT_RETRY_BASE_SECONDS)
+        app.config.setdefault('MAIL_QUEUE_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+        app.config.setdefault('MAIL_QUEUE_SENDING_TIMEOUT', DEFAULT_SENDING_TIMEOUT)
+
+        # Deliver rows queued before a restart; checked per request because
+        # TESTING is only known once the app is configured, and CLI commands
+        # never start the threads
+        @app.before_request
+        def start_dispatcher():
+            if not app.testing and (self._dispatcher is None or not self._dispatcher.is_alive()):
+                self.wake()
+
+    def wake(self):
+        """Start the dispatcher if needed and ask it to look for due rows"""
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['MAIL_QUEUE_WORKERS'],
+                    thread_name_prefix='email-worker'
+                )
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_forever, name='email-dispatcher', daemon=True
+                )
+                self._dispatcher.start()
+        self._wakeup.set()
+
+    def _dispatch_forever(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    claimed = self.claim_due()
+                # One batch (and so one SMTP session) per worker
+                workers = self.app.config['MAIL_QUEUE_WORKERS']
+                for start in range(workers):
+                    batch = claimed[start::workers]
+                    if batch:
+                        self._executor.submit(self._deliver_in_context, batch)
+                smtp_pool.prune_idle()
+            except Exception as e:
+                print(f"✗ Email dispatcher error: {e}")
+            self._wakeup.wait(self.app.config['MAIL_QUEUE_POLL_SECONDS'])
+
+    def _deliver_in_context(self, outbox_ids):
+        with self.app.app_context():
+            try:
+                self.deliver_batch(outbox_ids)
+            except Exception as e:
+                print(f"✗ Error delivering queued emails {outbox_ids}: {e}")
+
+    def claim_due(self, limit=CLAIM_BATCH_SIZE):
+        """
+        Claim pending rows whose next attempt is due, and 'sending' rows
+        whose lease ran out
+
+        Returns:
+            List of claimed EmailOutbox ids (now in 'sending' status)
+        """
+        now = datetime.utcnow()
+        due = db.session.query(EmailOutbox.id, EmailOutbox.status, EmailOutbox.next_attempt_at).filter(
+            or_(EmailOutbox.status == 'pending', EmailOutbox.status == 'sending'),
+            EmailOutbox.next_attempt_at <= now
+        ).order_by(EmailOutbox.next_attempt_at).limit(limit).all()
+
+        lease_until = now + timedelta(seconds=self.app.config['MAIL_QUEUE_SENDING_TIMEOUT'])
+        claimed = []
+        for outbox_id, status, next_attempt_at in due:
+            if status == 'sending':
+                print(f"✗ Reclaiming email outbox {outbox_id} left in 'sending'")
+            # Matching the read status and time lets only one process win
+            result = db.session.execute(
+                update(EmailOutbox).where(
+                    EmailOutbox.id == outbox_id,
+                    EmailOutbox.status == status,
+                    EmailOutbox.next_attempt_at == next_attempt_at
+                ).values(status='sending', next_attempt_at=lease_until).execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(outbox_id)
+        db.session.commit()
+        return claimed
+
+    def release(self, outbox_ids):
+        """Put claimed rows back to 'pending' for the next pass (commits)"""
+        db.session.execute(
+            update(EmailOutbox).where(
+                EmailOutbox.id.in_(outbox_ids),
+                EmailOutbox.status == 'sending'
+            ).values(status='pending', next_attempt_at=datetime.utcnow()).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def deliver_batch(self, outbox_ids):
+        """
+        Send claimed rows over one SMTP session and record each outcome
+
+        If delivery raises, the rows are released back to 'pending' before
+        the error propagates.
+
+        Returns:
+            Number of emails sent
+        """
+        try:
+            return self._deliver(outbox_ids)
+        except Exception:
+            db.session.rollback()
+            self.release(outbox_ids)
+            raise
+
+    def _deliver(self, outbox_ids):
+        entries = EmailOutbox.query.filter(
+            EmailOutbox.id.in_(outbox_ids),
+            EmailOutbox.status == 'sending'
+        ).order_by(EmailOutbox.id).all()
+
+        outcomes = []
+        messages = []
+        for entry in entries:
+            try:
+                messages.append(EMAIL_BUILDERS[entry.kind](**json.loads(entry.payload)))
+                outcomes.append([entry, None])
+            except Exception as e:
+                outcomes.append([entry, e])
+
+        results = iter(smtp_pool.send_batch(messages))
+        for outcome in outcomes:
+            if outcome[1] is None:
+                outcome[1] = next(results)
+
+        for entry, error in outcomes:
+            self._record_attempt(entry, error)
+        db.session.commit()
+        return sum(1 for _entry, error in outcomes if error is None)
+
+    def _record_attempt(self, entry, error):
+        """Mark a row sent, or schedule a retry / give up after an error"""
+        entry.attempts += 1
+        if error is None:
+            entry.status = 'sent'
+            entry.sent_at = datetime.utcnow()
+            entry.last_error = None
+            return
+
+        print(f"✗ Error sending {entry.kind} email (outbox {entry.id}): {error}")
+        entry.last_error = str(error)[:500]
+        if entry.attempts >= self.app.config['MAIL_QUEUE_MAX_ATTEMPTS']:
+            entry.status = 'failed'
+        else:
+            entry.status = 'pending'
+            entry.next_attempt_at = datetime.utcnow() + retry_delay(
+                entry.attempts, self.app.config['MAIL_QUEUE_RETRY_BASE_SECONDS']
+            )
+
+    def process_due(self):
+        """
+        Claim and deliver due rows in the calling thread
+
+        Returns:
+            Tuple of (sent, attempted)
+        """
+        claimed = self.claim_due()
+        sent = self.deliver_batch(claimed) if claimed else 0
+        return sent, len(claimed)
+
+
+email_queue = EmailQueue()
+
+
+email_cli = AppGroup('email-outbox', help='Inspect and deliver queued budget alert emails.')
+
+
+@email_cli.command('drain')
+def drain_command():
+    """Deliver every due email in the foreground."""
+    total_sent = total_attempted = 0
+    while True:
+        sent, attempted = email_queue.process_due()
+        if not attempted:
+            break
+        total_sent += sent
+        total_attempted += attempted
+    click.echo(f'Sent {total_sent} of {total_attempted} due emails')
+
+
+@email_cli.command('requeue')
+@click.option('--failed', is_flag=True, help='Also retry rows that ran out of attempts.')
+def requeue_command(failed):
+    """Return rows stuck in 'sending' (and optionally 'failed') to the queue."""
+    statuses = ['sending', 'failed'] if failed else ['sending']
+    result = db.session.execute(
+        update(EmailOutbox).where(EmailOutbox.status.in_(statuses)).values(
+            status='pending', attempts=0, next_attempt_at=datetime.utcnow()
+        )
+    )
+    db.session.commit()
+    click.echo(f'Requeued {result.rowcount} emails')
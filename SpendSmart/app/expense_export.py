@@ -0,0 +1,142 @@
+"""
+Streaming export of a user's expenses as CSV, NDJSON or Parquet
+
+Rows are read with yield_per as plain column tuples and written to the
+response in batches, so memory stays bounded by the batch size regardless
+of how many expenses the account holds.
+"""
+import csv
+import io
+import json
+
+# Try to import pyarrow for Parquet export, fallback if not available
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+from app.models import db, Expense
+
+# Rows fetched per database round trip and written per response chunk
+EXPORT_BATCH_SIZE = 1000
+
+# Rows per Parquet row group (each group is flushed to the response)
+PARQUET_ROW_GROUP_SIZE = 10000
+
+EXPORT_COLUMNS = ['id', 'date', 'item', 'category', 'amount']
+
+
+def export_query(user_id, criteria):
+    """Column-tuple query over a user's expenses in chronological order"""
+    return db.session.query(
+        Expense.id,
+        Expense.date,
+        Expense.item,
+        Expense.category,
+        Expense.amount
+    ).filter(
+        Expense.user_id == user_id, *criteria
+    ).order_by(Expense.date, Expense.id).yield_per(EXPORT_BATCH_SIZE)
+
+
+def _batches(query, size):
+    """Group query rows into lists of at most size rows"""
+    batch = []
+    for row in query:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_csv(query):
+    """Yield CSV text, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for batch in _batches(query, EXPORT_BATCH_SIZE):
+        for expense_id, expense_date, item, category, amount in batch:
+            writer.writerow([expense_id, expense_date.isoformat(), item, category, f'{amount:.2f}'])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_ndjson(query):
+    """Yield newline-delimited JSON, one chunk per batch of rows"""
+    for batch in _batches(query, EXPORT_BATCH_SIZE):
+        yield ''.join(
+            json.dumps({
+                'id': expense_id,
+                'date': expense_date.isoformat(),
+                'item': item,
+                'category': category,
+                'amount': float(amount)
+            }) + '\n'
+            for expense_id, expense_date, item, category, amount in batch
+        )
+
+
+class _ResponseSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_parquet(query):
+    """Yield a Parquet file, one chunk per row group"""
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('item', pa.string()),
+        ('category', pa.string()),
+        ('amount', pa.float64())
+    ])
+    sink = _ResponseSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    for batch in _batches(query, PARQUET_ROW_GROUP_SIZE):
+        columns = list(zip(*batch))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        ))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+# format -> (generator, mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+    'parquet': (export_parquet, 'application/vnd.apache.parquet', 'parquet')
+}
@@ -0,0 +1,148 @@
+"""
+Filtering, keyset pagination and streaming for expense list endpoints
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from app.models import Expense
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Rows fetched per round trip when streaming
+STREAM_BATCH_SIZE = 500
+
+
+def _parse_date_arg(args, name, errors):
+    """Parse an optional YYYY-MM-DD query parameter"""
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        errors.append(f"{name} must be in YYYY-MM-DD format")
+        return None
+
+
+def _parse_amount_arg(args, name, errors):
+    """Parse an optional numeric query parameter"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        errors.append(f"{name} must be a valid number")
+        return None
+
+
+def parse_expense_filters(args):
+    """
+    Build Expense filter criteria from request query parameters
+
+    Supported parameters: category, start_date and end_date (inclusive,
+    YYYY-MM-DD), min_amount and max_amount.
+
+    Returns:
+        Tuple of (criteria list, error messages list)
+    """
+    criteria = []
+    errors = []
+
+    category = args.get('category')
+    if category:
+        criteria.append(Expense.category == category)
+
+    start_date = _parse_date_arg(args, 'start_date', errors)
+    end_date = _parse_date_arg(args, 'end_date', errors)
+    if start_date:
+        criteria.append(Expense.date >= start_date)
+    if end_date:
+        criteria.append(Expense.date < end_date + timedelta(days=1))
+
+    min_amount = _parse_amount_arg(args, 'min_amount', errors)
+    max_amount = _parse_amount_arg(args, 'max_amount', errors)
+    if min_amount is not None:
+        criteria.append(Expense.amount >= min_amount)
+    if max_amount is not None:
+        criteria.append(Expense.amount <= max_amount)
+
+    return criteria, errors
+
+
+def parse_page_size(args):
+    """Get the requested page size, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(expense):
+    """Encode the (date, id) position of an expense as an opaque cursor"""
+    raw = f"{expense.date.isoformat()}|{expense.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_str, expense_id = raw.split('|')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(expense_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def newest_first(query):
+    """Order an expense query by the keyset (date, id), newest first"""
+    return query.order_by(Expense.date.desc(), Expense.id.desc())
+
+
+def after_cursor(cursor):
+    """Criterion selecting rows that sort after a cursor in newest_first order"""
+    cursor_date, cursor_id = decode_cursor(cursor)
+    return or_(
+        Expense.date < cursor_date,
+        and_(Expense.date == cursor_date, Expense.id < cursor_id)
+    )
+
+
+def fetch_page(query, limit):
+    """
+    Fetch one keyset page from an ordered query
+
+    Returns:
+        Tuple of (expenses, next_cursor); next_cursor is None on the last page
+    """
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def stream_ndjson(query):
+    """Yield one JSON document per expense, newline separated"""
+    for expense in query.yield_per(STREAM_BATCH_SIZE):
+        yield json.dumps(expense.to_dict()) + '\n'
+
+
+def stream_json(query):
+    """Yield a {"success", "data", "count"} JSON document in chunks"""
+    yield '{"success": true, "data": ['
+    count = 0
+    for expense in query.yield_per(STREAM_BATCH_SIZE):
+        yield (',' if count else '') + json.dumps(expense.to_dict())
+        count += 1
+    yield f'], "count": {count}}}'
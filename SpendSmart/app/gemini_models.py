@@ -0,0 +1,71 @@
+"""
+Registry of configured Gemini model objects
+
+Importing google.generativeai takes about half a second, so it is deferred
+until a model is first needed instead of being paid by every worker at
+startup (and by rule-only deployments that never call Gemini). Models are
+created once per name and shared by all requests; GenerativeModel holds no
+per-request state, and calls go through llm_client for deadlines and
+concurrency limits.
+"""
+import importlib.util
+import os
+import threading
+
+CATEGORIZATION_MODEL = 'gemini-2.5-flash'
+INSIGHTS_MODEL = 'gemini-2.5-flash'
+RECEIPT_MODEL = 'gemini-2.0-flash-exp'
+
+# Checked without importing the SDK; find_spec raises when the parent
+# google package itself is missing
+try:
+    GEMINI_AVAILABLE = importlib.util.find_spec('google.generativeai') is not None
+except ModuleNotFoundError:
+    GEMINI_AVAILABLE = False
+
+_models = {}
+_configured_key = None
+_lock = threading.Lock()
+
+
+def get_model(model_name, api_key=None):
+    """
+    Shared GenerativeModel for a model name
+
+    The SDK holds one global API key, so configuring a different key drops
+    the models created under the previous one.
+
+    Args:
+        model_name: Gemini model name, e.g. CATEGORIZATION_MODEL
+        api_key: API key (defaults to GEMINI_API_KEY)
+
+    Returns:
+        The model, or None if there is no key or the SDK is not installed
+    """
+    global _configured_key
+    api_key = api_key or os.environ.get('GEMINI_API_KEY')
+    if not api_key or not GEMINI_AVAILABLE:
+        return None
+
+    model = _models.get(model_name)
+    if model is not None and _configured_key == api_key:
+        return model
+
+    with _lock:
+        import google.generativeai as genai
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+            _models.clear()
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+def reset():
+    """Forget configured models (e.g. after rotating the API key)"""
+    global _configured_key
+    with _lock:
+        _models.clear()
+        _configured_key = None
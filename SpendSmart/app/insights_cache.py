@@ -0,0 +1,187 @@
+"""
+Cached AI insights keyed on a fingerprint of the user's spending data
+
+Generating insights loads every expense and makes a Gemini call, yet the
+insights panel is reopened far more often than the data changes.
+InsightsCache keeps the last result per (user, period) together with a
+fingerprint of the user's expenses -- row count, amount sum and latest
+updated_at, read with one aggregate query -- and the day it was computed,
+since week and month windows move at midnight. A result is served while
+both still match. The expense write routes invalidate a user's entries
+directly; the fingerprint also catches writes made by other worker
+processes. With stale-while-revalidate enabled, an outdated entry is
+served at once while a background job recomputes it.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sqlalchemy import func
+
+from app.ai_insights import is_fallback
+from app.models import db, Expense
+
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_AGE = 86400
+DEFAULT_WORKERS = 1
+
+
+def make_fingerprint(count, total, updated_at):
+    """Fingerprint from a user's row count, amount sum and latest updated_at"""
+    return count, round(total or 0, 2), updated_at.isoformat() if updated_at else None
+
+
+def data_fingerprint(user_id):
+    """(row count, amount sum, latest updated_at) of a user's expenses"""
+    return make_fingerprint(*db.session.query(
+        func.count(Expense.id),
+        func.sum(Expense.amount),
+        func.max(Expense.updated_at)
+    ).filter(Expense.user_id == user_id).one())
+
+
+class InsightsCache:
+    """Per-(user, period) insights results, revalidated by data fingerprint"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE,
+                 stale_while_revalidate=False, workers=DEFAULT_WORKERS):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.workers = workers
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        """Read INSIGHTS_CACHE_* app settings"""
+        self.max_entries = app.config.setdefault('INSIGHTS_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        self.max_age = app.config.setdefault('INSIGHTS_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+        self.stale_while_revalidate = app.config.setdefault('INSIGHTS_CACHE_STALE_WHILE_REVALIDATE', False)
+        self.workers = app.config.setdefault('INSIGHTS_CACHE_WORKERS', DEFAULT_WORKERS)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _store(self, key, fingerprint, result):
+        with self._lock:
+            self._entries[key] = {
+                'fingerprint': fingerprint,
+                'day': date.today(),
+                'stored_at': time.monotonic(),
+                'result': result
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _compute(self, key, compute, fingerprint=None):
+        """
+        Compute and store an entry
+
+        The fingerprint is read first (or passed in by a lookup that just
+        read it), so writes made while computing leave the entry outdated.
+        """
+        if fingerprint is None:
+            fingerprint = data_fingerprint(key[0])
+        result = compute()
+        # Rule-based fallbacks are cheap and should not hide the AI answer
+        # once Gemini is reachable again
+        if not is_fallback(result):
+            self._store(key, fingerprint, result)
+        return result
+
+    def _refresh(self, app, key, compute):
+        """Recompute an entry on the background pool, once per key at a time"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='insights')
+            executor = self._executor
+
+        def run():
+            try:
+                with app.app_context():
+                    self._compute(key, compute)
+            except Exception as e:
+                print(f"Background insights refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._count('refreshes')
+        executor.submit(run)
+
+    def get_or_compute(self, app, user_id, period, compute):
+        """
+        Cached insights for a user and period, computing them on a miss
+
+        Args:
+            app: Flask app, for background refreshes
+            user_id: Owner of the expenses
+            period: Insights period ('week', 'month', 'all')
+            compute: Callable returning fresh insights; must not depend on
+                the request, as it may run in the background
+
+        Returns:
+            (result, status) where status is 'hit', 'miss' or 'stale'
+        """
+        key = (user_id, period)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        fingerprint = None
+        if entry is not None and time.monotonic() - entry['stored_at'] <= self.max_age:
+            if entry['fingerprint'] is not None and entry['day'] == date.today():
+                fingerprint = data_fingerprint(user_id)
+                if entry['fingerprint'] == fingerprint:
+                    self._count('hits')
+                    return entry['result'], 'hit'
+            if self.stale_while_revalidate:
+                self._count('stale_hits')
+                self._refresh(app, key, compute)
+                return entry['result'], 'stale'
+
+        self._count('misses')
+        return self._compute(key, compute, fingerprint), 'miss'
+
+    def invalidate(self, user_id):
+        """Mark a user's entries outdated after an expense write"""
+        with self._lock:
+            for (owner, _period), entry in self._entries.items():
+                if owner == user_id:
+                    entry['fingerprint'] = None
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'invalidations': self.invalidations,
+                'stale_while_revalidate': self.stale_while_revalidate
+            }
+
+
+insights_cache = InsightsCache()
@@ -0,0 +1,302 @@
+"""
+Stored AI insights and their off-peak precomputation
+
+Generated insights are kept in the stored_insights table with the data
+fingerprint they were computed from, shared by every worker process and
+surviving restarts; a stored result is served while the fingerprint still
+matches and it was computed today.
+
+InsightsPrecomputer fills that table ahead of time for active users (those
+who wrote expenses in the last INSIGHTS_PRECOMPUTE_ACTIVE_DAYS days).
+Users whose expenses changed since their stored result come first, then
+those whose result is only from an earlier day; within each group, the
+most recently active go first. It runs as a background thread during an
+off-peak window (INSIGHTS_PRECOMPUTE_ENABLED) or from cron through
+`flask insights precompute`, with at most INSIGHTS_PRECOMPUTE_WORKERS
+generations in flight.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app.ai_insights import is_fallback
+from app.insights_cache import data_fingerprint, make_fingerprint
+from app.models import db, Expense, StoredInsights
+from app.spending_columns import SpendingColumns
+
+DEFAULT_WINDOW = '01:00-06:00'
+DEFAULT_WORKERS = 1
+DEFAULT_INTERVAL = 900
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_ACTIVE_DAYS = 30
+DEFAULT_PERIODS = ('week', 'month')
+
+# Job priorities, lowest first
+CHANGED = 0
+OUTDATED = 1
+
+
+def load_insights_expenses(user_id):
+    """A user's expenses for AIInsightsGenerator, as columns"""
+    return SpendingColumns.for_user(user_id)
+
+
+def fingerprint_key(fingerprint):
+    """Stored form of a data fingerprint"""
+    return json.dumps(list(fingerprint))
+
+
+def stored_insights(user_id, period, fingerprint):
+    """The stored result for a user and period if computed today from the same data, else None"""
+    row = db.session.get(StoredInsights, (user_id, period))
+    if row is None or row.computed_on != date.today() or row.fingerprint != fingerprint_key(fingerprint):
+        return None
+    return json.loads(row.result)
+
+
+def store_insights(user_id, period, fingerprint, result, source):
+    """Save a result for a user and period (commits)"""
+    try:
+        row = db.session.get(StoredInsights, (user_id, period))
+        if row is None:
+            row = StoredInsights(user_id=user_id, period=period)
+            db.session.add(row)
+        row.fingerprint = fingerprint_key(fingerprint)
+        row.computed_on = date.today()
+        row.result = json.dumps(result)
+        row.source = source
+        row.updated_at = datetime.utcnow()
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same user and period first
+        db.session.rollback()
+
+
+def insights_for(generator, user_id, period, source='request'):
+    """
+    A user's insights, read from stored_insights or generated and stored
+
+    Rule-based fallbacks (source 'fallback') are returned but not stored,
+    so the AI answer replaces them once Gemini is reachable again.
+
+    Returns:
+        (result, 'stored' or 'generated')
+    """
+    # Fingerprint first, so writes made while generating leave the row outdated
+    fingerprint = data_fingerprint(user_id)
+    result = stored_insights(user_id, period, fingerprint)
+    if result is not None:
+        return result, 'stored'
+
+    result = generator.generate_insights(load_insights_expenses(user_id), period)
+    if not is_fallback(result):
+        store_insights(user_id, period, fingerprint, result, source)
+    return result, 'generated'
+
+
+def due_jobs(periods, active_days, limit=None, today=None):
+    """
+    (user_id, period) pairs whose stored insights are missing or outdated
+
+    Args:
+        periods: Insights periods to keep stored
+        active_days: Only users with expenses written in this many days
+        limit: Most pairs to return
+        today: Day stored results must be from (defaults to date.today())
+
+    Returns:
+        Pairs in priority order: changed data first, then results from an
+        earlier day, most recently active users first within each
+    """
+    today = today or date.today()
+    active = db.session.query(
+        Expense.user_id,
+        func.count(Expense.id),
+        func.sum(Expense.amount),
+        func.max(Expense.updated_at)
+    ).group_by(Expense.user_id).having(
+        func.max(Expense.updated_at) >= datetime.utcnow() - timedelta(days=active_days)
+    ).all()
+    stored = {
+        (user_id, period): (fingerprint, computed_on)
+        for user_id, period, fingerprint, computed_on in db.session.query(
+            StoredInsights.user_id, StoredInsights.period,
+            StoredInsights.fingerprint, StoredInsights.computed_on
+        ).filter(StoredInsights.period.in_(periods))
+    }
+
+    jobs = []
+    for user_id, count, total, updated_at in active:
+        current = fingerprint_key(make_fingerprint(count, total, updated_at))
+        for period in periods:
+            fingerprint, computed_on = stored.get((user_id, period), (None, None))
+            if fingerprint != current:
+                priority = CHANGED
+            elif computed_on != today:
+                priority = OUTDATED
+            else:
+                continue
+            jobs.append((priority, updated_at or datetime.min, user_id, period))
+
+    jobs.sort(key=lambda job: job[1], reverse=True)
+    jobs.sort(key=lambda job: job[0])
+    return [(user_id, period) for _priority, _updated_at, user_id, period in jobs[:limit]]
+
+
+def parse_window(text):
+    """(start, end) times of an 'HH:MM-HH:MM' window, or None for no window"""
+    if not text:
+        return None
+    start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in text.split('-'))
+    return start, end
+
+
+def in_window(window, now):
+    """Whether a datetime falls in a window; windows may wrap past midnight"""
+    if window is None:
+        return True
+    start, end = window
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def insights_generator():
+    """The app's AI insights generator, or None without a Gemini key"""
+    from app.routes import get_ai_insights
+    return get_ai_insights()
+
+
+class InsightsPrecomputer:
+    """Fills stored_insights for active users, in passes of bounded concurrency"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.window = parse_window(DEFAULT_WINDOW)
+        self.workers = DEFAULT_WORKERS
+        self.interval = DEFAULT_INTERVAL
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.active_days = DEFAULT_ACTIVE_DAYS
+        self.periods = DEFAULT_PERIODS
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read INSIGHTS_PRECOMPUTE_* app settings and start the thread if enabled"""
+        self.app = app
+        self.enabled = app.config.setdefault('INSIGHTS_PRECOMPUTE_ENABLED', False)
+        self.window = parse_window(app.config.setdefault('INSIGHTS_PRECOMPUTE_WINDOW', DEFAULT_WINDOW))
+        self.workers = app.config.setdefault('INSIGHTS_PRECOMPUTE_WORKERS', DEFAULT_WORKERS)
+        self.interval = app.config.setdefault('INSIGHTS_PRECOMPUTE_INTERVAL', DEFAULT_INTERVAL)
+        self.batch_size = app.config.setdefault('INSIGHTS_PRECOMPUTE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.active_days = app.config.setdefault('INSIGHTS_PRECOMPUTE_ACTIVE_DAYS', DEFAULT_ACTIVE_DAYS)
+        self.periods = tuple(app.config.setdefault('INSIGHTS_PRECOMPUTE_PERIODS', DEFAULT_PERIODS))
+        if self.enabled:
+            self.start()
+
+    def start(self):
+        """Start the scheduler thread; its first pass comes one interval later"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_forever, name='insights-precompute', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_forever(self):
+        while not self._stop.wait(self.interval):
+            if not in_window(self.window, datetime.now()):
+                continue
+            try:
+                with self.app.app_context():
+                    generator = insights_generator()
+                    if generator is None:
+                        print("Insights precompute skipped: GEMINI_API_KEY is not set")
+                        continue
+                    summary = self.run_once(generator)
+                if summary['due']:
+                    print(f"Insights precompute: {summary}")
+            except Exception as e:
+                print(f"✗ Insights precompute error: {e}")
+
+    def _run_job(self, app, generator, user_id, period):
+        with app.app_context():
+            try:
+                result, outcome = insights_for(generator, user_id, period, source='precompute')
+            except Exception as e:
+                print(f"✗ Error precomputing {period} insights for user {user_id}: {e}")
+                return 'failed'
+            if outcome == 'stored':
+                return 'skipped'
+            return 'fallback' if is_fallback(result) else 'generated'
+
+    def run_once(self, generator, limit=None):
+        """
+        Generate and store insights for the most urgent due users
+
+        Args:
+            generator: AIInsightsGenerator to use
+            limit: Most (user, period) pairs to generate; defaults to
+                INSIGHTS_PRECOMPUTE_BATCH_SIZE
+
+        Returns:
+            Dict counting due pairs and their outcomes: 'generated',
+            'fallback' (not stored), 'skipped' (stored meanwhile by a
+            request) and 'failed'
+        """
+        app = current_app._get_current_object()
+        jobs = due_jobs(self.periods, self.active_days, limit or self.batch_size)
+        summary = {'due': len(jobs), 'generated': 0, 'fallback': 0, 'skipped': 0, 'failed': 0}
+        if not jobs:
+            return summary
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='insights-precompute') as executor:
+            outcomes = executor.map(lambda job: self._run_job(app, generator, *job), jobs)
+            for outcome in outcomes:
+                summary[outcome] += 1
+        return summary
+
+
+insights_precomputer = InsightsPrecomputer()
+
+
+insights_cli = AppGroup('insights', help='Precompute and inspect stored AI insights.')
+
+
+@insights_cli.command('precompute')
+@click.option('--limit', type=int, default=None, help='Most user/period pairs to generate.')
+def precompute_command(limit):
+    """Generate insights for active users whose stored results are outdated."""
+    generator = insights_generator()
+    if generator is None:
+        raise click.ClickException('GEMINI_API_KEY is not set')
+    summary = insights_precomputer.run_once(generator, limit)
+    click.echo(
+        f'Generated {summary["generated"]} of {summary["due"]} due insights '
+        f'({summary["fallback"]} fallback, {summary["skipped"]} already stored, {summary["failed"]} failed)'
+    )
+    if summary['failed']:
+        raise click.ClickException(f'{summary["failed"]} insights failed')
+
+
+@insights_cli.command('status')
+def status_command():
+    """Show stored results and how many are due."""
+    jobs = due_jobs(insights_precomputer.periods, insights_precomputer.active_days)
+    rows = db.session.query(StoredInsights.source, func.count()).group_by(StoredInsights.source).all()
+    click.echo(f'{sum(count for _source, count in rows)} stored insights '
+               f'({", ".join(f"{count} {source}" for source, count in rows) or "none"})')
+    click.echo(f'{len(jobs)} due for {", ".join(insights_precomputer.periods)}')
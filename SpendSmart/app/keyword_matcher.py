@@ -0,0 +1,102 @@
+"""
+Compiled keyword matcher for rule-based categorization
+
+All category keywords are folded into one word-bounded regular expression
+shaped like a prefix trie (e.g. 'cha(?:i|at|pati)'); one scan of the text
+returns every keyword hit.
+"""
+import re
+from collections import namedtuple
+from typing import Dict, List
+
+# One keyword occurrence; start is the offset in the lowercased text
+KeywordHit = namedtuple('KeywordHit', ['keyword', 'category', 'weight', 'start'])
+
+# Category ranking: total weight of its hits plus the keywords that matched
+CategoryScore = namedtuple('CategoryScore', ['category', 'score', 'keywords'])
+
+# Plural forms accepted after a keyword ('books', 'buses')
+_PLURAL_SUFFIX = r'(?:e?s)?'
+
+
+def _trie_pattern(words):
+    """Regex source matching exactly the given words, factored by prefix"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # A keyword ends here; longer keywords are tried first (greedy)
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Precompiled word-boundary matcher over per-category keyword lists"""
+
+    def __init__(self, keywords_by_category: Dict[str, List[str]], weights: Dict[str, float] = None):
+        """
+        Args:
+            keywords_by_category: Category name -> keywords (any case)
+            weights: Category name -> weight of one hit (default 1.0)
+        """
+        self.category_order = list(keywords_by_category)
+        self.weights = {category: (weights or {}).get(category, 1.0) for category in self.category_order}
+
+        self.keyword_categories = {}
+        for category, keywords in keywords_by_category.items():
+            for keyword in keywords:
+                categories = self.keyword_categories.setdefault(keyword.lower(), [])
+                if category not in categories:
+                    categories.append(category)
+
+        self.pattern = re.compile(
+            r'\b(' + _trie_pattern(self.keyword_categories) + ')' + _PLURAL_SUFFIX + r'\b'
+        )
+
+    def find(self, text: str) -> List[KeywordHit]:
+        """Every keyword hit in text, in order of appearance"""
+        return [
+            KeywordHit(match.group(1), category, self.weights[category], match.start())
+            for match in self.pattern.finditer(text.lower())
+            for category in self.keyword_categories[match.group(1)]
+        ]
+
+    def rank(self, text: str) -> List[CategoryScore]:
+        """
+        Categories with at least one hit, best first
+
+        Ties keep the order categories were given in.
+        """
+        keywords = self.pattern.findall(text.lower())
+        if not keywords:
+            return []
+
+        scores = {}
+        for keyword in keywords:
+            for category in self.keyword_categories[keyword]:
+                score = scores.get(category)
+                if score is None:
+                    scores[category] = [self.weights[category], [keyword]]
+                else:
+                    score[0] += self.weights[category]
+                    if keyword not in score[1]:
+                        score[1].append(keyword)
+
+        if len(scores) == 1:
+            (category, (score, matched)), = scores.items()
+            return [CategoryScore(category, score, matched)]
+
+        ranked = [CategoryScore(category, *scores[category]) for category in self.category_order if category in scores]
+        ranked.sort(key=lambda entry: entry.score, reverse=True)
+        return ranked
@@ -0,0 +1,376 @@
+"""
+Shared client for Gemini calls with deadlines, load shedding and a breaker
+
+generate_content is a blocking call with no timeout; a stalled request
+would pin a gunicorn thread until the worker is killed. LLMClient runs each
+call on a small worker pool and waits at most the call's deadline, caps
+how many calls are in flight at once, and stops calling the model for a
+while when most recent calls failed, so callers drop to their rule-based
+fallbacks immediately. Slow calls can optionally be hedged with a second
+request, and per-call-site latency histograms and token counts are kept for
+/api/llm/stats and summarized in the log every LLM_USAGE_LOG_EVERY calls.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_CONCURRENCY = 3
+DEFAULT_ACQUIRE_TIMEOUT = 1.0
+DEFAULT_BREAKER_WINDOW = 20
+DEFAULT_BREAKER_MIN_CALLS = 5
+DEFAULT_BREAKER_FAILURE_RATE = 0.5
+DEFAULT_BREAKER_RESET_SECONDS = 30.0
+DEFAULT_USAGE_LOG_EVERY = 100
+
+# Token estimates for responses without usage metadata (the pinned SDK
+# version does not expose it): about four characters per text token, and
+# the fixed cost Gemini charges per image
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def estimate_tokens(contents):
+    """Rough token count of a prompt, or of a list of text and image parts"""
+    if isinstance(contents, str):
+        return -(-len(contents) // CHARS_PER_TOKEN)
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) for part in contents)
+    return IMAGE_TOKENS
+
+
+def response_usage(response, contents, text):
+    """
+    (prompt tokens, output tokens, estimated) for one response
+
+    Uses the response's usage metadata when the SDK reports it and falls
+    back to estimate_tokens otherwise.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    output_tokens = getattr(usage, 'candidates_token_count', None)
+    if isinstance(prompt_tokens, int) and isinstance(output_tokens, int):
+        return prompt_tokens, output_tokens, False
+    return estimate_tokens(contents), estimate_tokens(text), True
+
+
+class LLMError(Exception):
+    """A model call failed"""
+
+
+class LLMTimeoutError(LLMError):
+    """A model call missed its deadline"""
+
+
+class LLMUnavailableError(LLMError):
+    """The call was not attempted: breaker open or too many calls in flight"""
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (not thread-safe; callers lock)"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (capped at the max seen)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+
+        buckets = {f'le_{bound * 1000:g}ms': count for bound, count in zip(self.bounds, self.counts)}
+        buckets['over'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'p50_ms': ms(self.quantile(0.5)),
+            'p95_ms': ms(self.quantile(0.95)),
+            'p99_ms': ms(self.quantile(0.99)),
+            'max_ms': ms(self.max),
+            'buckets': buckets
+        }
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over the last `window` calls
+
+    Closed: calls flow. Open: calls are refused until reset_seconds pass.
+    Half-open: one probe call is let through; its outcome closes or reopens.
+    """
+
+    def __init__(self, window=DEFAULT_BREAKER_WINDOW, min_calls=DEFAULT_BREAKER_MIN_CALLS,
+                 failure_rate=DEFAULT_BREAKER_FAILURE_RATE, reset_seconds=DEFAULT_BREAKER_RESET_SECONDS):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_seconds = reset_seconds
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.opened_at = None
+        self.trips = 0
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                # One probe per reset period, in case an earlier probe never reported
+                self.state = 'half_open'
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == 'half_open':
+                if ok:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (self.state == 'closed' and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes.clear()
+
+
+class LLMClient:
+    """Deadline-bounded, concurrency-limited gateway for model calls"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, hedge_after=None, breaker=None):
+        """
+        Args:
+            timeout: Default per-call deadline in seconds
+            max_concurrency: Model calls allowed in flight, hedges included
+            acquire_timeout: Longest wait for a free slot before giving up
+            hedge_after: Seconds after which a still-running call is raced
+                by a second identical request (None disables hedging)
+            breaker: CircuitBreaker shared by every call site
+        """
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._calls = 0
+        self.usage_log_every = DEFAULT_USAGE_LOG_EVERY
+        self.configure(timeout, max_concurrency, acquire_timeout, hedge_after, breaker)
+
+    def configure(self, timeout=DEFAULT_TIMEOUT, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                  acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, hedge_after=None, breaker=None):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        if getattr(self, '_executor', None):
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+
+    def init_app(self, app):
+        """Configure from LLM_* app settings"""
+        app.config.setdefault('LLM_TIMEOUT', DEFAULT_TIMEOUT)
+        app.config.setdefault('LLM_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)
+        app.config.setdefault('LLM_ACQUIRE_TIMEOUT', DEFAULT_ACQUIRE_TIMEOUT)
+        app.config.setdefault('LLM_HEDGE_AFTER', None)
+        app.config.setdefault('LLM_BREAKER_MIN_CALLS', DEFAULT_BREAKER_MIN_CALLS)
+        app.config.setdefault('LLM_BREAKER_FAILURE_RATE', DEFAULT_BREAKER_FAILURE_RATE)
+        app.config.setdefault('LLM_BREAKER_RESET_SECONDS', DEFAULT_BREAKER_RESET_SECONDS)
+        self.usage_log_every = app.config.setdefault('LLM_USAGE_LOG_EVERY', DEFAULT_USAGE_LOG_EVERY)
+        self.configure(
+            timeout=app.config['LLM_TIMEOUT'],
+            max_concurrency=app.config['LLM_MAX_CONCURRENCY'],
+            acquire_timeout=app.config['LLM_ACQUIRE_TIMEOUT'],
+            hedge_after=app.config['LLM_HEDGE_AFTER'],
+            breaker=CircuitBreaker(
+                min_calls=app.config['LLM_BREAKER_MIN_CALLS'],
+                failure_rate=app.config['LLM_BREAKER_FAILURE_RATE'],
+                reset_seconds=app.config['LLM_BREAKER_RESET_SECONDS']
+            )
+        )
+
+    @staticmethod
+    def _call(model, contents, options):
+        """One model call; returns (text, usage)"""
+        response = model.generate_content(contents, **options)
+        text = response.text
+        return text, response_usage(response, contents, text)
+
+    def _submit(self, model, contents, options):
+        """Start one attempt; its slot is released when the model returns"""
+        try:
+            future = self._executor.submit(self._call, model, contents, options)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def generate(self, model, contents, call_site='default', timeout=None, generation_config=None):
+        """
+        Call model.generate_content within a deadline
+
+        A call that misses its deadline keeps its worker (and slot) until
+        the model returns, so stalls shed load instead of piling up.
+
+        Args:
+            model: Gemini GenerativeModel (or anything with generate_content)
+            contents: Prompt or content list
+            call_site: Label for stats, e.g. 'categorize'
+            timeout: Deadline in seconds (defaults to the client timeout)
+            generation_config: Optional generation settings, e.g. temperature
+
+        Returns:
+            The response text
+
+        Raises:
+            LLMUnavailableError: Breaker open or no free slot
+            LLMTimeoutError: No answer before the deadline
+            LLMError: The model call raised
+        """
+        timeout = timeout or self.timeout
+        options = {'generation_config': generation_config} if generation_config else {}
+        began = time.monotonic()
+        deadline = began + timeout
+
+        if not self.breaker.allow():
+            self._count(call_site, 'rejected')
+            raise LLMUnavailableError('AI service temporarily disabled after repeated failures')
+        if not self._slots.acquire(timeout=min(self.acquire_timeout, timeout)):
+            self._count(call_site, 'busy')
+            raise LLMUnavailableError('Too many AI requests in flight')
+
+        attempts = [self._submit(model, contents, options)]
+        pending = set(attempts)
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            can_hedge = self.hedge_after is not None and len(attempts) == 1
+            wait_for = deadline - now
+            if can_hedge:
+                wait_for = min(wait_for, max(began + self.hedge_after - now, 0))
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    text, usage = future.result()
+                    self._finish(call_site, 'ok', began, usage)
+                    return text
+                error = future.exception()
+            if not done and can_hedge and self._slots.acquire(blocking=False):
+                hedge = self._submit(model, contents, options)
+                attempts.append(hedge)
+                pending.add(hedge)
+                self._count(call_site, 'hedges')
+
+        if pending:
+            self._finish(call_site, 'timeouts', began)
+            raise LLMTimeoutError(f'No AI response within {timeout:g}s')
+        self._finish(call_site, 'errors', began)
+        raise LLMError(str(error)) from error
+
+    def _stats_for(self, call_site):
+        stats = self._stats.get(call_site)
+        if stats is None:
+            stats = self._stats[call_site] = {
+                'ok': 0, 'errors': 0, 'timeouts': 0, 'rejected': 0, 'busy': 0, 'hedges': 0,
+                'prompt_tokens': 0, 'output_tokens': 0, 'estimated_tokens': 0,
+                'latency': LatencyHistogram()
+            }
+        return stats
+
+    def _count(self, call_site, outcome):
+        with self._lock:
+            self._stats_for(call_site)[outcome] += 1
+
+    def _finish(self, call_site, outcome, began, usage=None):
+        """
+        Record a finished call; usage is (prompt tokens, output tokens,
+        estimated) for answered calls. Tokens spent by the losing attempt
+        of a hedged call are not counted.
+        """
+        self.breaker.record(outcome == 'ok')
+        with self._lock:
+            stats = self._stats_for(call_site)
+            stats[outcome] += 1
+            stats['latency'].observe(time.monotonic() - began)
+            if usage is not None:
+                prompt_tokens, output_tokens, estimated = usage
+                stats['prompt_tokens'] += prompt_tokens
+                stats['output_tokens'] += output_tokens
+                stats['estimated_tokens'] += estimated
+            self._calls += 1
+            log_usage = self.usage_log_every and self._calls % self.usage_log_every == 0
+        if log_usage:
+            print(self.usage_summary())
+
+    def usage_summary(self):
+        """One log line of answered calls, average tokens and p95 latency per call site"""
+        parts = []
+        for call_site, stats in sorted(self.stats()['call_sites'].items()):
+            parts.append(
+                f"{call_site} {stats['ok']} ok, avg {stats['avg_prompt_tokens']}/{stats['avg_output_tokens']} "
+                f"tokens in/out, p95 {stats['latency']['p95_ms']} ms"
+            )
+        return 'LLM usage: ' + ('; '.join(parts) or 'no calls')
+
+    def stats(self):
+        """Breaker state and per-call-site outcome counts, tokens and latency"""
+        def average(tokens, calls):
+            return round(tokens / calls) if calls else None
+
+        with self._lock:
+            call_sites = {
+                call_site: dict(
+                    {key: value for key, value in stats.items() if key != 'latency'},
+                    avg_prompt_tokens=average(stats['prompt_tokens'], stats['ok']),
+                    avg_output_tokens=average(stats['output_tokens'], stats['ok']),
+                    latency=stats['latency'].snapshot()
+                )
+                for call_site, stats in self._stats.items()
+            }
+        return {
+            'breaker': {'state': self.breaker.state, 'trips': self.breaker.trips},
+            'max_concurrency': self.max_concurrency,
+            'timeout': self.timeout,
+            'hedge_after': self.hedge_after,
+            'call_sites': call_sites
+        }
+
+
+llm_client = LLMClient()
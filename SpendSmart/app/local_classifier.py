@@ -0,0 +1,244 @@
+"""
+Local expense classifier trained on users' own labeled expenses
+
+A multinomial naive Bayes model over hashed character n-grams (plus whole
+words) of the normalized item name. It runs on the CPU with NumPy only,
+trains offline with `flask classifier train`, and is stored as an
+uncompressed .npz that loads in milliseconds. AICategorizer consults it
+before the LLM and escalates when its confidence is below the cutoff.
+"""
+import os
+import time
+import zlib
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.models import db, Expense
+from app.text_normalize import normalize_item
+
+DEFAULT_FEATURES = 2 ** 16
+NGRAM_SIZES = (2, 3, 4)
+DEFAULT_ALPHA = 0.1
+
+# Predictions below this confidence are escalated to the LLM
+DEFAULT_CUTOFF = 0.8
+
+# Items hashed per bincount while training
+TRAIN_CHUNK_SIZE = 10000
+
+MODEL_FILENAME = 'category_model.npz'
+
+
+def item_features(item_name, n_features=DEFAULT_FEATURES):
+    """
+    Hashed feature indexes of an item name
+
+    crc32 keeps hashes stable across processes, unlike hash().
+    """
+    normalized = normalize_item(item_name)
+    if not normalized:
+        return []
+    text = f' {normalized} '
+    features = [
+        zlib.crc32(text[start:start + size].encode()) % n_features
+        for size in NGRAM_SIZES
+        for start in range(len(text) - size + 1)
+    ]
+    features.extend(zlib.crc32(b'w:' + word.encode()) % n_features for word in normalized.split())
+    return features
+
+
+class LocalClassifier:
+    """Hashed n-gram naive Bayes over expense categories"""
+
+    def __init__(self, classes, log_prior, feature_log_prob, trained_on=0):
+        """
+        Args:
+            classes: Category names, one per model row
+            log_prior: (classes,) log class frequencies
+            feature_log_prob: (classes, features) log P(feature | class)
+            trained_on: Number of labeled items the model was fitted to
+        """
+        self.classes = list(classes)
+        self.log_prior = log_prior
+        self.feature_log_prob = feature_log_prob
+        self.n_features = feature_log_prob.shape[1]
+        self.trained_on = trained_on
+
+    @classmethod
+    def train(cls, samples, classes, n_features=DEFAULT_FEATURES, alpha=DEFAULT_ALPHA):
+        """
+        Fit a model from (item_name, category) pairs
+
+        Args:
+            samples: Iterable of (item_name, category); other categories are ignored
+            classes: Category names the model can predict
+            n_features: Hash space size
+            alpha: Additive smoothing
+
+        Raises:
+            ValueError: If there are no usable samples
+        """
+        class_index = {category: index for index, category in enumerate(classes)}
+        counts = np.zeros(len(classes) * n_features, dtype=np.float64)
+        class_counts = np.zeros(len(classes), dtype=np.float64)
+        keys = []
+        total = 0
+
+        def flush():
+            if keys:
+                np.add(counts, np.bincount(np.asarray(keys, dtype=np.int64), minlength=counts.size), out=counts)
+                keys.clear()
+
+        for item_name, category in samples:
+            row = class_index.get(category)
+            if row is None:
+                continue
+            features = item_features(item_name, n_features)
+            if not features:
+                continue
+            class_counts[row] += 1
+            keys.extend(row * n_features + feature for feature in features)
+            total += 1
+            if total % TRAIN_CHUNK_SIZE == 0:
+                flush()
+        flush()
+
+        if not total:
+            raise ValueError("No labeled items to train on")
+
+        counts = counts.reshape(len(classes), n_features) + alpha
+        feature_log_prob = np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))
+        log_prior = np.log(class_counts + 1) - np.log(class_counts.sum() + len(classes))
+        return cls(classes, log_prior.astype(np.float32), feature_log_prob.astype(np.float32), total)
+
+    def predict_proba(self, item_names):
+        """
+        Class probabilities for many items at once
+
+        Feature log-likelihoods are averaged rather than summed, which keeps
+        long names from producing saturated (always ~1.0) confidences.
+
+        Returns:
+            (items, classes) array; rows of featureless items are all zero
+        """
+        feature_lists = [item_features(name, self.n_features) for name in item_names]
+        lengths = np.array([len(features) for features in feature_lists])
+        probabilities = np.zeros((len(item_names), len(self.classes)), dtype=np.float32)
+        present = lengths > 0
+        if not present.any():
+            return probabilities
+
+        flat = np.fromiter((f for features in feature_lists for f in features), dtype=np.int64, count=lengths.sum())
+        offsets = np.concatenate(([0], np.cumsum(lengths[present])[:-1]))
+        # (classes, items) sums of log P(feature | class) per item
+        sums = np.add.reduceat(self.feature_log_prob[:, flat], offsets, axis=1)
+        scores = (sums / lengths[present]).T + self.log_prior
+        scores -= scores.max(axis=1, keepdims=True)
+        exp_scores = np.exp(scores)
+        probabilities[present] = exp_scores / exp_scores.sum(axis=1, keepdims=True)
+        return probabilities
+
+    def predict(self, item_names):
+        """
+        Best category and its probability for each item
+
+        Returns:
+            List of (category, confidence); category is None when the item
+            has no usable text
+        """
+        probabilities = self.predict_proba(item_names)
+        best = probabilities.argmax(axis=1)
+        return [
+            (self.classes[index] if row[index] > 0 else None, float(row[index]))
+            for index, row in zip(best, probabilities)
+        ]
+
+    def save(self, path):
+        """
+        Write the model as an uncompressed .npz (no pickled objects)
+
+        Written through a file object, so np.savez keeps the path as given
+        instead of appending '.npz' to it.
+        """
+        with open(path, 'wb') as file:
+            np.savez(
+                file,
+                classes=np.array(self.classes),
+                log_prior=self.log_prior,
+                feature_log_prob=self.feature_log_prob,
+                trained_on=np.array(self.trained_on)
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['classes'].tolist(),
+                data['log_prior'],
+                data['feature_log_prob'],
+                int(data['trained_on'])
+            )
+
+
+_loaded = {}
+
+
+def model_path():
+    """Configured model location (instance folder by default)"""
+    return current_app.config.get('LOCAL_CLASSIFIER_PATH') or os.path.join(current_app.instance_path, MODEL_FILENAME)
+
+
+def get_local_classifier():
+    """
+    The trained model for this app, reloaded when the file changes
+
+    Returns:
+        LocalClassifier, or None if nothing is trained
+    """
+    path = model_path()
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != modified:
+        try:
+            cached = (modified, LocalClassifier.load(path))
+        except Exception as e:
+            print(f"Failed to load local classifier from {path}: {e}")
+            return None
+        _loaded[path] = cached
+    return cached[1]
+
+
+def labeled_expenses():
+    """Stream (item, category) pairs from every user's expenses"""
+    return db.session.query(Expense.item, Expense.category).yield_per(TRAIN_CHUNK_SIZE)
+
+
+classifier_cli = AppGroup('classifier', help='Train the local expense category classifier.')
+
+
+@classifier_cli.command('train')
+@click.option('--output', default=None, help='Model file (defaults to LOCAL_CLASSIFIER_PATH).')
+@click.option('--features', default=DEFAULT_FEATURES, show_default=True, help='Hash space size.')
+@click.option('--alpha', default=DEFAULT_ALPHA, show_default=True, help='Additive smoothing.')
+def train_command(output, features, alpha):
+    """Fit the classifier on all labeled expenses and save it."""
+    from app.ai_categorizer import AICategorizer
+    classes = list(AICategorizer(None).categories)
+    began = time.perf_counter()
+    try:
+        model = LocalClassifier.train(labeled_expenses(), classes, n_features=features, alpha=alpha)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    path = output or model_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    model.save(path)
+    click.echo(f'Trained on {model.trained_on} expenses in {time.perf_counter() - began:.1f}s; saved to {path}')
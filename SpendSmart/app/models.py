@@ -49,6 +49,11 @@ class Expense(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Serves per-user date range scans (date >= start AND date < end)
+        db.Index('ix_expenses_user_date', 'user_id', 'date'),
+    )
+    
     def to_dict(self):
         """Convert to dictionary"""
         return {
@@ -64,6 +69,33 @@ class Expense(db.Model):
         return f'<Expense {self.item} - Rs.{self.amount}>'
 
 
+class SpendingRollup(db.Model):
+    """Monthly spending per user and category, maintained on expense writes"""
+    __tablename__ = 'spending_rollups'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # Format: YYYY-MM
+    category = db.Column(db.String(100), primary_key=True)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SpendingRollup {self.month} {self.category} - Rs.{self.total_amount}>'
+
+
+class DailySpending(db.Model):
+    """Spending per user and day, maintained on expense writes"""
+    __tablename__ = 'daily_spending'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailySpending {self.day} - Rs.{self.total_amount}>'
+
+
 class Budget(db.Model):
     """Budget model"""
     __tablename__ = 'budgets'
@@ -94,3 +126,60 @@ class Budget(db.Model):
     
     def __repr__(self):
         return f'<Budget {self.month} - Rs.{self.amount}>'
+
+
+class EmailOutbox(db.Model):
+    """Budget alert email waiting for (or done with) background delivery"""
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    budget_id = db.Column(db.Integer, db.ForeignKey('budgets.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'warning' or 'exceeded'
+    payload = db.Column(db.Text, nullable=False)  # JSON keyword arguments for the sender
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending/sending/sent/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # One alert of each kind per budget: enforces at-most-once enqueueing
+        db.UniqueConstraint('budget_id', 'kind', name='unique_budget_alert'),
+    )
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.kind} budget={self.budget_id} {self.status}>'
+
+
+class StoredInsights(db.Model):
+    """Last AI insights per user and period, with the data fingerprint they were computed from"""
+    __tablename__ = 'stored_insights'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)  # 'week', 'month' or 'all'
+    fingerprint = db.Column(db.String(100), nullable=False)  # JSON (count, sum, latest updated_at)
+    computed_on = db.Column(db.Date, nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON result as returned by AIInsightsGenerator
+    source = db.Column(db.String(20), nullable=False, default='request')  # 'request' or 'precompute'
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StoredInsights user={self.user_id} {self.period} {self.computed_on}>'
+
+
+class CategorizationCacheEntry(db.Model):
+    """Stored AI categorization result shared across users"""
+    __tablename__ = 'categorization_cache'
+    
+    kind = db.Column(db.String(20), primary_key=True)  # 'scores' (per-category confidences)
+    item_key = db.Column(db.String(200), primary_key=True)  # Normalized item text
+    amount_bucket = db.Column(db.Integer, primary_key=True)  # -1 when no amount was given
+    result = db.Column(db.Text, nullable=False)  # JSON result as returned by AICategorizer
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_hit_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<CategorizationCacheEntry {self.kind} {self.item_key!r} bucket={self.amount_bucket}>'
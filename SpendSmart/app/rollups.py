@@ -0,0 +1,359 @@
+"""
+Incrementally maintained spending rollups
+
+Each row of SpendingRollup holds the sum and count of one user's expenses
+for one (month, category), and each row of DailySpending the same for one
+day. The expense write routes apply deltas inside their own transaction,
+so budget checks read a handful of rows instead of scanning the month's
+expenses, and daily charts read one row per day. The `flask rollups`
+commands rebuild both tables from scratch and report drift.
+"""
+from collections import defaultdict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update, delete, insert
+
+from app.daily_spend import daily_spend_store, record_daily_change
+from app.models import db, Expense, SpendingRollup, DailySpending
+
+# Amount differences below this are treated as float noise, not drift
+DRIFT_TOLERANCE = 0.005
+
+
+def _month_key(expense_date):
+    """Get rollup month key in YYYY-MM format"""
+    return expense_date.strftime('%Y-%m')
+
+
+def apply_rollup_delta(user_id, month, category, amount, count):
+    """
+    Add amount and count to one rollup bucket (negative values remove)
+
+    Runs in the caller's session and does not commit, so the rollup change
+    lands in the same transaction as the expense write.
+    """
+    key = (
+        SpendingRollup.user_id == user_id,
+        SpendingRollup.month == month,
+        SpendingRollup.category == category
+    )
+
+    result = db.session.execute(
+        update(SpendingRollup).where(*key).values(
+            total_amount=SpendingRollup.total_amount + amount,
+            expense_count=SpendingRollup.expense_count + count
+        ).execution_options(synchronize_session=False)
+    )
+
+    if count > 0 and result.rowcount == 0:
+        db.session.execute(insert(SpendingRollup).values(
+            user_id=user_id,
+            month=month,
+            category=category,
+            total_amount=amount,
+            expense_count=count
+        ))
+    elif count < 0:
+        # Drop buckets that no longer hold any expenses
+        db.session.execute(
+            delete(SpendingRollup).where(
+                *key, SpendingRollup.expense_count <= 0
+            ).execution_options(synchronize_session=False)
+        )
+
+
+def apply_daily_delta(user_id, day, amount, count):
+    """
+    Add amount and count to one day's row (negative values remove); does not commit
+
+    The change reaches the in-memory daily spending store when the
+    caller's transaction commits.
+    """
+    key = (DailySpending.user_id == user_id, DailySpending.day == day)
+
+    result = db.session.execute(
+        update(DailySpending).where(*key).values(
+            total_amount=DailySpending.total_amount + amount,
+            expense_count=DailySpending.expense_count + count
+        ).execution_options(synchronize_session=False)
+    )
+
+    if count > 0 and result.rowcount == 0:
+        db.session.execute(insert(DailySpending).values(
+            user_id=user_id,
+            day=day,
+            total_amount=amount,
+            expense_count=count
+        ))
+    elif count < 0:
+        db.session.execute(
+            delete(DailySpending).where(
+                *key, DailySpending.expense_count <= 0
+            ).execution_options(synchronize_session=False)
+        )
+    record_daily_change(user_id, day, amount)
+
+
+def apply_expense_delta(user_id, expense_date, category, amount, sign=1):
+    """Add (sign=1) or remove (sign=-1) one expense from the rollups"""
+    apply_rollup_delta(user_id, _month_key(expense_date), category, sign * amount, sign)
+    apply_daily_delta(user_id, expense_date, sign * amount, sign)
+
+
+def add_expense_to_rollup(expense):
+    """Count an expense in the rollup (call before commit)"""
+    apply_expense_delta(expense.user_id, expense.date, expense.category, expense.amount, 1)
+
+
+def remove_expense_from_rollup(expense):
+    """Remove an expense from the rollup (call before commit)"""
+    apply_expense_delta(expense.user_id, expense.date, expense.category, expense.amount, -1)
+
+
+def add_expense_rows_to_rollup(user_id, rows):
+    """
+    Count many new expenses in the rollup with one update per bucket
+
+    Args:
+        user_id: Owner of the expenses
+        rows: Iterable of dicts with 'date', 'category' and 'amount'
+    """
+    buckets = defaultdict(lambda: [0, 0.0])
+    days = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        for bucket in (buckets[(_month_key(row['date']), row['category'])], days[row['date']]):
+            bucket[0] += 1
+            bucket[1] += row['amount']
+
+    for (month, category), (count, amount) in buckets.items():
+        apply_rollup_delta(user_id, month, category, amount, count)
+    for day, (count, amount) in sorted(days.items()):
+        apply_daily_delta(user_id, day, amount, count)
+
+
+def monthly_total(user_id, month):
+    """
+    Total spent by a user in a month
+
+    Args:
+        user_id: Owner of the expenses
+        month: Month in YYYY-MM format
+
+    Returns:
+        Total amount as a float
+    """
+    total = db.session.query(
+        func.coalesce(func.sum(SpendingRollup.total_amount), 0.0)
+    ).filter(
+        SpendingRollup.user_id == user_id,
+        SpendingRollup.month == month
+    ).scalar()
+
+    return float(total)
+
+
+def category_totals(user_id, *criteria):
+    """
+    Per-category count and sum across a user's rollup rows
+
+    Args:
+        user_id: Owner of the expenses
+        *criteria: Extra SQLAlchemy filter expressions on SpendingRollup
+
+    Returns:
+        List of (category, count, total_amount) tuples, largest total first
+    """
+    total = func.sum(SpendingRollup.total_amount)
+    rows = db.session.query(
+        SpendingRollup.category,
+        func.sum(SpendingRollup.expense_count),
+        total
+    ).filter(
+        SpendingRollup.user_id == user_id, *criteria
+    ).group_by(SpendingRollup.category).order_by(total.desc()).all()
+
+    return [(category, int(count), float(amount)) for category, count, amount in rows]
+
+
+def compute_rollups(user_id=None):
+    """
+    Recompute rollup buckets from the expenses table
+
+    Groups by day in the database and folds days into months here, which
+    keeps the query portable across SQLite and PostgreSQL.
+
+    Returns:
+        Dict mapping (user_id, month, category) to [count, total_amount]
+    """
+    query = db.session.query(
+        Expense.user_id,
+        Expense.date,
+        Expense.category,
+        func.count(Expense.id),
+        func.sum(Expense.amount)
+    )
+    if user_id is not None:
+        query = query.filter(Expense.user_id == user_id)
+
+    buckets = defaultdict(lambda: [0, 0.0])
+    for owner_id, expense_date, category, count, amount in query.group_by(
+            Expense.user_id, Expense.date, Expense.category):
+        bucket = buckets[(owner_id, _month_key(expense_date), category)]
+        bucket[0] += count
+        bucket[1] += amount
+
+    return buckets
+
+
+def compute_daily_spending(user_id=None):
+    """
+    Recompute daily spending rows from the expenses table
+
+    Returns:
+        Dict mapping (user_id, day) to [count, total_amount]
+    """
+    query = db.session.query(
+        Expense.user_id,
+        Expense.date,
+        func.count(Expense.id),
+        func.sum(Expense.amount)
+    )
+    if user_id is not None:
+        query = query.filter(Expense.user_id == user_id)
+
+    return {
+        (owner_id, expense_date): [count, amount]
+        for owner_id, expense_date, count, amount in query.group_by(Expense.user_id, Expense.date)
+    }
+
+
+def rebuild_rollups(user_id=None):
+    """
+    Replace monthly and daily rollup rows with values recomputed from
+    expenses and commit
+
+    Args:
+        user_id: Only rebuild this user's rows (all users if None)
+
+    Returns:
+        Number of monthly rollup rows written
+    """
+    buckets = compute_rollups(user_id)
+    days = compute_daily_spending(user_id)
+
+    for model in (SpendingRollup, DailySpending):
+        stmt = delete(model)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        db.session.execute(stmt)
+
+    if buckets:
+        db.session.execute(insert(SpendingRollup), [
+            {
+                'user_id': owner_id,
+                'month': month,
+                'category': category,
+                'expense_count': count,
+                'total_amount': amount
+            }
+            for (owner_id, month, category), (count, amount) in buckets.items()
+        ])
+    if days:
+        db.session.execute(insert(DailySpending), [
+            {'user_id': owner_id, 'day': day, 'expense_count': count, 'total_amount': amount}
+            for (owner_id, day), (count, amount) in days.items()
+        ])
+
+    db.session.commit()
+    daily_spend_store.clear()
+    return len(buckets)
+
+
+def backfill_rollups():
+    """
+    Rebuild the rollups if their tables are empty while expenses exist
+
+    Tables that create_all adds to an existing database start empty, and
+    budget checks and charts would read zero spending from them until a
+    rebuild.
+
+    Returns:
+        True if a rebuild ran
+    """
+    if db.session.query(Expense.id).first() is None:
+        return False
+    if all(db.session.query(model.user_id).first() is not None for model in (SpendingRollup, DailySpending)):
+        return False
+    rebuild_rollups()
+    return True
+
+
+def _drift(expected, actual):
+    """Keys whose (count, total_amount) differ, with both values"""
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        want = tuple(expected.get(key, (0, 0.0)))
+        have = actual.get(key, (0, 0.0))
+        if want[0] != have[0] or abs(want[1] - have[1]) > DRIFT_TOLERANCE:
+            drift.append((*key, want, have))
+    return drift
+
+
+def verify_rollups(user_id=None):
+    """
+    Compare monthly and daily rollup rows against the expenses table
+
+    Returns:
+        List of (user_id, month, category, expected, actual) tuples for
+        monthly rows and (user_id, day, None, expected, actual) for daily
+        rows, where expected and actual are (count, total_amount); empty if
+        consistent
+    """
+    query = db.session.query(
+        SpendingRollup.user_id,
+        SpendingRollup.month,
+        SpendingRollup.category,
+        SpendingRollup.expense_count,
+        SpendingRollup.total_amount
+    )
+    daily_query = db.session.query(
+        DailySpending.user_id,
+        DailySpending.day,
+        DailySpending.expense_count,
+        DailySpending.total_amount
+    )
+    if user_id is not None:
+        query = query.filter(SpendingRollup.user_id == user_id)
+        daily_query = daily_query.filter(DailySpending.user_id == user_id)
+
+    drift = _drift(compute_rollups(user_id), {(row[0], row[1], row[2]): (row[3], row[4]) for row in query})
+    daily_drift = _drift(compute_daily_spending(user_id), {(row[0], row[1]): (row[2], row[3]) for row in daily_query})
+    return drift + [(owner_id, day, None, want, have) for owner_id, day, want, have in daily_drift]
+
+
+rollups_cli = AppGroup('rollups', help='Maintain the monthly and daily spending rollup tables.')
+
+
+@rollups_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_command(user_id):
+    """Recompute rollups from the expenses table."""
+    rows = rebuild_rollups(user_id)
+    click.echo(f'Rebuilt {rows} rollup rows')
+
+
+@rollups_cli.command('verify')
+@click.option('--user-id', type=int, default=None, help='Only verify this user.')
+def verify_command(user_id):
+    """Report rollup rows that disagree with the expenses table."""
+    drift = verify_rollups(user_id)
+    for owner_id, bucket, category, want, have in drift:
+        where = f'month={bucket} category={category}' if category is not None else f'day={bucket}'
+        click.echo(
+            f'user={owner_id} {where}: '
+            f'expected {want[0]} / Rs.{want[1]:.2f}, found {have[0]} / Rs.{have[1]:.2f}'
+        )
+    if drift:
+        raise click.ClickException(f'{len(drift)} rollup rows drifted; run "flask rollups rebuild"')
+    click.echo('Rollups are consistent')
@@ -1,34 +1,101 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, Response, stream_with_context, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
-from sqlalchemy import extract
+from sqlalchemy import insert
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 from app.ai_categorizer import AICategorizer
+from app.categorization_cache import categorization_cache
+from app.category_memory import category_memory
+from app.insights_cache import insights_cache
+from app.insights_precompute import insights_for
+from app.daily_spend import daily_spend_store
+from app.typeahead import typeahead
+from app.local_classifier import get_local_classifier, DEFAULT_CUTOFF
 from app.ai_insights import AIInsightsGenerator
+from app.gemini_models import RECEIPT_MODEL, get_model
+from app.llm_client import llm_client, LLMTimeoutError, LLMUnavailableError
 from app.models import db, User, Expense, Budget
-from app.email_service import send_budget_exceeded_email, send_budget_warning_email
+from app.aggregates import category_breakdown
+from app.date_ranges import period_range, date_range_criteria
+from app.expense_queries import (
+    parse_expense_filters, parse_page_size, newest_first, after_cursor,
+    fetch_page, stream_ndjson, stream_json
+)
+from app.expense_export import EXPORT_FORMATS, PARQUET_AVAILABLE, export_query
+from app.statement_import import open_csv_records, open_ofx_records, StatementImporter
+from app.rollups import (
+    add_expense_to_rollup, remove_expense_from_rollup, add_expense_rows_to_rollup,
+    monthly_total, category_totals
+)
+from app.email_queue import email_queue, enqueue_budget_email
 
 main = Blueprint('main', __name__)
 
 # Simple file-based storage for expenses
 DATA_FILE = 'expenses_data.json'
 
+# Bulk ingestion limits
+MAX_BULK_EXPENSES = 5000
+BULK_INSERT_CHUNK_SIZE = 500
+
+# Items accepted by /api/categorize/batch in one request
+MAX_BATCH_CATEGORIZE_ITEMS = 200
+
+# Window accepted by /api/insights/trends, in days
+MIN_TREND_DAYS = 7
+MAX_TREND_DAYS = 366
+
+# Receipt images take longer to read than text prompts
+RECEIPT_SCAN_TIMEOUT = 30
+
+RECEIPT_PROMPT = (
+    "Read this receipt. Categories: Food & Dining (restaurants, cafes, groceries), "
+    "Transportation (fuel, cabs, parking, transit), Shopping (retail, clothing, electronics), "
+    "Entertainment (movies, games, events), Bills & Utilities (electricity, water, internet, phone), "
+    "Healthcare (medical, pharmacy, fitness), Education (books, courses, tuition), Others.\n"
+    "List every visible item, with its price when shown. Unreadable fields: \"\" for text, "
+    "\"0.00\" for amount, today for date, \"Others\" for category.\n"
+    "Reply with only JSON (amount without currency symbol, confidence high/medium/low): "
+    '{"merchant":"Store Name","amount":"0.00","date":"YYYY-MM-DD","category":"Category Name",'
+    '"items":["item1 - 10.50","item2"],"confidence":"high"}'
+)
+
 # Initialize AI categorizer
 AI_CATEGORIZER = None
+RULES_CATEGORIZER = None
 AI_INSIGHTS = None
 
+def attach_local_classifier(categorizer):
+    """Give a categorizer the current trained local model (reloaded after retraining)"""
+    categorizer.classifier = get_local_classifier()
+    categorizer.classifier_cutoff = current_app.config.get('LOCAL_CLASSIFIER_CUTOFF', DEFAULT_CUTOFF)
+    return categorizer
+
 def get_ai_categorizer():
     """Get or initialize AI categorizer"""
     global AI_CATEGORIZER
     if AI_CATEGORIZER is None:
         api_key = os.environ.get('GEMINI_API_KEY')
         if api_key:
-            AI_CATEGORIZER = AICategorizer(api_key)
+            AI_CATEGORIZER = AICategorizer(api_key, cache=categorization_cache)
+    if AI_CATEGORIZER is not None:
+        attach_local_classifier(AI_CATEGORIZER)
     return AI_CATEGORIZER
 
+def get_rules_categorizer():
+    """Get the categorizer that uses only the rules and the local model"""
+    global RULES_CATEGORIZER
+    if RULES_CATEGORIZER is None:
+        RULES_CATEGORIZER = AICategorizer(None)
+    return attach_local_classifier(RULES_CATEGORIZER)
+
+def get_categorizer():
+    """Get the AI categorizer, or a rules + local model one without an API key"""
+    return get_ai_categorizer() or get_rules_categorizer()
+
 def get_ai_insights():
     """Get or initialize AI insights generator"""
     global AI_INSIGHTS
@@ -38,6 +105,15 @@ def get_ai_insights():
             AI_INSIGHTS = AIInsightsGenerator(api_key)
     return AI_INSIGHTS
 
+def expenses_changed(user_id):
+    """
+    Drop derived data held in memory for a user after an expense write commits
+
+    The daily spending store needs no call here: the rollups' daily changes
+    are applied to it when they commit (see record_daily_change).
+    """
+    insights_cache.invalidate(user_id)
+
 def load_expenses():
     """Load expenses from JSON file"""
     if os.path.exists(DATA_FILE):
@@ -113,7 +189,10 @@ def validate_expense_data(data):
 
 def check_and_send_budget_alert(user, expense_date):
     """
-    Check budget status and send email alerts if thresholds are exceeded
+    Check budget status and queue email alerts if thresholds are exceeded
+    
+    Delivery happens on the background email queue; this only writes the
+    outbox row and the budget's sent flag.
     
     Args:
         user: Current user object
@@ -141,17 +220,8 @@ def check_and_send_budget_alert(user, expense_date):
         
         print(f"   Budget: Rs. {budget.amount}, Threshold: {budget.alert_threshold}%")
         
-        # Calculate total spent for the month
-        year = expense_date.year
-        month = expense_date.month
-        
-        monthly_expenses = Expense.query.filter(
-            Expense.user_id == user.id,
-            extract('year', Expense.date) == year,
-            extract('month', Expense.date) == month
-        ).all()
-        
-        total_spent = sum(expense.amount for expense in monthly_expenses)
+        # Total spent for the month (from the rollup table)
+        total_spent = monthly_total(user.id, month_str)
         budget_amount = budget.amount
         spent_percentage = (total_spent / budget_amount) * 100 if budget_amount > 0 else 0
         
@@ -160,22 +230,24 @@ def check_and_send_budget_alert(user, expense_date):
         
         # Check if budget is exceeded and email hasn't been sent
         if spent_percentage >= 100 and not budget.exceeded_email_sent:
-            print(f"   🚨 SENDING EXCEEDED EMAIL...")
-            send_budget_exceeded_email(
+            print(f"   🚨 QUEUEING EXCEEDED EMAIL...")
+            enqueue_budget_email(
+                budget, 'exceeded',
                 user_email=user.email,
                 user_name=user.full_name or user.username,
                 budget_amount=budget_amount,
                 total_spent=total_spent,
                 month=month_str
             )
-            budget.exceeded_email_sent = True
             db.session.commit()
-            print(f"   ✓ Budget exceeded email sent to {user.email}")
+            email_queue.wake()
+            print(f"   ✓ Budget exceeded email queued for {user.email}")
         
         # Check if threshold is reached and warning email hasn't been sent
         elif spent_percentage >= budget.alert_threshold and not budget.warning_email_sent and not budget.exceeded_email_sent:
-            print(f"   ⚠️  SENDING WARNING EMAIL...")
-            send_budget_warning_email(
+            print(f"   ⚠️  QUEUEING WARNING EMAIL...")
+            enqueue_budget_email(
+                budget, 'warning',
                 user_email=user.email,
                 user_name=user.full_name or user.username,
                 budget_amount=budget_amount,
@@ -183,13 +255,14 @@ def check_and_send_budget_alert(user, expense_date):
                 threshold_percentage=budget.alert_threshold,
                 month=month_str
             )
-            budget.warning_email_sent = True
             db.session.commit()
-            print(f"   ✓ Budget warning email sent to {user.email}")
+            email_queue.wake()
+            print(f"   ✓ Budget warning email queued for {user.email}")
         else:
             print(f"   ℹ️  No email needed at this time")
             
     except Exception as e:
+        db.session.rollback()
         print(f"   ✗ Error checking budget alert: {e}")
         import traceback
         traceback.print_exc()
@@ -371,9 +444,59 @@ def favicon():
 @main.route('/api/expenses', methods=['GET'])
 @login_required
 def get_expenses():
-    """Get all expenses for current user"""
+    """
+    Get expenses for current user
+    
+    Query parameters:
+        category, start_date, end_date, min_amount, max_amount: Optional filters
+        limit, cursor: Keyset pagination (newest first); the response carries
+            next_cursor until the last page
+        stream: 'ndjson' or 'json' to stream every matching expense
+    
+    Without limit, cursor or stream the full list is returned in one payload.
+    """
     try:
-        expenses = Expense.query.filter_by(user_id=current_user.id).all()
+        criteria, errors = parse_expense_filters(request.args)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid query parameters',
+                'details': errors
+            }), 400
+        
+        query = Expense.query.filter(Expense.user_id == current_user.id, *criteria)
+        
+        # Streaming mode: rows are fetched in batches while the response is written
+        stream = request.args.get('stream')
+        if stream in ('ndjson', 'json'):
+            query = newest_first(query)
+            if stream == 'ndjson':
+                return Response(stream_with_context(stream_ndjson(query)), mimetype='application/x-ndjson')
+            return Response(stream_with_context(stream_json(query)), mimetype='application/json')
+        
+        # Keyset pagination mode
+        if 'limit' in request.args or 'cursor' in request.args:
+            cursor = request.args.get('cursor')
+            if cursor:
+                try:
+                    query = query.filter(after_cursor(cursor))
+                except ValueError as e:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Invalid query parameters',
+                        'details': [str(e)]
+                    }), 400
+            
+            expenses, next_cursor = fetch_page(newest_first(query), parse_page_size(request.args))
+            return jsonify({
+                'success': True,
+                'data': [expense.to_dict() for expense in expenses],
+                'count': len(expenses),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            })
+        
+        expenses = query.all()
         expenses_data = [expense.to_dict() for expense in expenses]
         return jsonify({
             'success': True,
@@ -387,6 +510,55 @@ def get_expenses():
             'message': str(e)
         }), 500
 
+@main.route('/api/expenses/export', methods=['GET'])
+@login_required
+def export_expenses():
+    """
+    Download current user's expenses as a streamed file
+    
+    Query parameters:
+        format: 'csv' (default), 'ndjson' or 'parquet'
+        category, start_date, end_date, min_amount, max_amount: Same
+            filters as GET /api/expenses
+    """
+    try:
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': 'Unsupported export format. Use csv, ndjson or parquet'
+            }), 400
+        
+        if export_format == 'parquet' and not PARQUET_AVAILABLE:
+            return jsonify({
+                'success': False,
+                'error': 'Parquet export not available. Please install pyarrow.'
+            }), 501
+        
+        criteria, errors = parse_expense_filters(request.args)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid query parameters',
+                'details': errors
+            }), 400
+        
+        generate, mimetype, extension = EXPORT_FORMATS[export_format]
+        query = export_query(current_user.id, criteria)
+        
+        return Response(
+            stream_with_context(generate(query)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=spendsmart-expenses.{extension}'}
+        )
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to export expenses',
+            'message': str(e)
+        }), 500
+
 @main.route('/api/expenses', methods=['POST'])
 @login_required
 def add_expense():
@@ -419,7 +591,10 @@ def add_expense():
         )
         
         db.session.add(new_expense)
+        add_expense_to_rollup(new_expense)
         db.session.commit()
+        category_memory.record(current_user.id, new_expense.item, new_expense.category)
+        expenses_changed(current_user.id)
         
         # Check budget and send email if exceeded
         check_and_send_budget_alert(current_user, new_expense.date)
@@ -438,6 +613,169 @@ def add_expense():
             'message': str(e)
         }), 500
 
+@main.route('/api/expenses/bulk', methods=['POST'])
+@login_required
+def add_expenses_bulk():
+    """
+    Add many expenses for current user in one transaction
+    
+    Accepts {"expenses": [...]} (or a bare JSON array) of objects in the same
+    format as POST /api/expenses. Nothing is inserted unless every item is
+    valid. Budget alerts are evaluated once per affected month.
+    """
+    try:
+        data = request.get_json()
+        items = data.get('expenses') if isinstance(data, dict) else data
+        
+        if not items or not isinstance(items, list):
+            return jsonify({
+                'success': False,
+                'error': 'No expenses provided'
+            }), 400
+        
+        if len(items) > MAX_BULK_EXPENSES:
+            return jsonify({
+                'success': False,
+                'error': f'Too many expenses (maximum {MAX_BULK_EXPENSES} per request)'
+            }), 400
+        
+        # Validate everything before touching the database
+        errors = []
+        for index, item in enumerate(items):
+            item_errors = validate_expense_data(item) if isinstance(item, dict) else ['Expense must be an object']
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+        
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 'Validation failed',
+                'details': errors
+            }), 400
+        
+        now = datetime.utcnow()
+        rows = [
+            {
+                'user_id': current_user.id,
+                'item': item['item'].strip(),
+                'category': item['category'],
+                'amount': float(item['amount']),
+                'date': datetime.strptime(item['date'], '%Y-%m-%d').date(),
+                'created_at': now,
+                'updated_at': now
+            }
+            for item in items
+        ]
+        
+        # Multi-row INSERT statements, all in one transaction
+        for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+            db.session.execute(insert(Expense).values(rows[start:start + BULK_INSERT_CHUNK_SIZE]))
+        add_expense_rows_to_rollup(current_user.id, rows)
+        db.session.commit()
+        category_memory.forget(current_user.id)
+        expenses_changed(current_user.id)
+        
+        # One budget check per affected month
+        months = {row['date'].replace(day=1) for row in rows}
+        for month_start in sorted(months):
+            check_and_send_budget_alert(current_user, month_start)
+        
+        return jsonify({
+            'success': True,
+            'count': len(rows),
+            'message': f'{len(rows)} expenses added successfully'
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@main.route('/api/expenses/import', methods=['POST'])
+@login_required
+def import_statement():
+    """
+    Import a CSV or OFX bank/card statement for current user
+    
+    Multipart form fields:
+        statement: The statement file
+        format: 'csv' or 'ofx' (defaults to the file extension)
+        mapping: Optional JSON object of CSV settings - column names for
+            date/item/amount/category, date_format, amount_sign, delimiter
+    
+    Rows matching an existing expense by date, amount and normalized item
+    are skipped. Pass ?progress=ndjson to receive one progress line per
+    committed chunk instead of a single summary.
+    """
+    try:
+        file = request.files.get('statement')
+        if not file or file.filename == '':
+            return jsonify({
+                'success': False,
+                'error': 'No statement file uploaded'
+            }), 400
+        
+        file_format = (request.form.get('format') or file.filename.rsplit('.', 1)[-1]).lower()
+        if file_format == 'qfx':
+            file_format = 'ofx'
+        if file_format not in ('csv', 'ofx'):
+            return jsonify({
+                'success': False,
+                'error': 'Unsupported statement format. Please upload a CSV or OFX file'
+            }), 400
+        
+        try:
+            if file_format == 'csv':
+                mapping = json.loads(request.form.get('mapping') or '{}')
+                records = open_csv_records(file.stream, mapping)
+            else:
+                records = open_ofx_records(file.stream)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid statement file',
+                'message': str(e)
+            }), 400
+        
+        categorizer = get_categorizer()
+        importer = StatementImporter(current_user.id, categorizer, memory=category_memory)
+        user = current_user._get_current_object()
+        
+        def send_alerts():
+            category_memory.forget(user.id)
+            expenses_changed(user.id)
+            for month_start in sorted(importer.affected_months):
+                check_and_send_budget_alert(user, month_start)
+        
+        if request.args.get('progress') == 'ndjson':
+            def generate():
+                for progress in importer.run(records):
+                    yield json.dumps(progress) + '\n'
+                send_alerts()
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        for progress in importer.run(records):
+            pass
+        send_alerts()
+        
+        return jsonify({
+            'success': True,
+            'data': progress,
+            'message': f"{progress['inserted']} expenses imported"
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': 'Failed to import statement',
+            'message': str(e)
+        }), 500
+
 @main.route('/api/expenses/<int:expense_id>', methods=['DELETE'])
 @login_required
 def delete_expense(expense_id):
@@ -452,8 +790,11 @@ def delete_expense(expense_id):
                 'error': 'Expense not found'
             }), 404
         
+        remove_expense_from_rollup(expense)
         db.session.delete(expense)
         db.session.commit()
+        category_memory.record(current_user.id, expense.item, expense.category, -1)
+        expenses_changed(current_user.id)
         
         return jsonify({
             'success': True,
@@ -508,7 +849,9 @@ def update_expense(expense_id):
                     'details': validation_errors
                 }), 400
         
-        # Update expense fields
+        # Update expense fields, moving the old amount out of the rollup
+        previous_item, previous_category = expense.item, expense.category
+        remove_expense_from_rollup(expense)
         if 'item' in data:
             expense.item = data['item'].strip()
         if 'category' in data:
@@ -517,9 +860,15 @@ def update_expense(expense_id):
             expense.amount = float(data['amount'])
         if 'date' in data:
             expense.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        add_expense_to_rollup(expense)
         
         db.session.commit()
         
+        # Corrections teach the user's category memory
+        category_memory.record(current_user.id, previous_item, previous_category, -1)
+        category_memory.record(current_user.id, expense.item, expense.category)
+        expenses_changed(current_user.id)
+        
         # Check budget after update (in case amount increased)
         check_and_send_budget_alert(current_user, expense.date)
         
@@ -584,9 +933,10 @@ def health_check():
 def get_statistics():
     """Get expense statistics for current user"""
     try:
-        expenses = Expense.query.filter_by(user_id=current_user.id).all()
+        # Category breakdown (from the rollup table)
+        breakdown = category_totals(current_user.id)
         
-        if not expenses:
+        if not breakdown:
             return jsonify({
                 'success': True,
                 'data': {
@@ -597,17 +947,12 @@ def get_statistics():
                 }
             })
         
-        # Calculate statistics
-        total_amount = sum(expense.amount for expense in expenses)
-        
-        # Category breakdown
-        categories = {}
-        for expense in expenses:
-            category = expense.category
-            if category not in categories:
-                categories[category] = {'count': 0, 'amount': 0.0}
-            categories[category]['count'] += 1
-            categories[category]['amount'] += expense.amount
+        categories = {
+            category: {'count': count, 'amount': amount}
+            for category, count, amount in breakdown
+        }
+        total_expenses = sum(count for _, count, _ in breakdown)
+        total_amount = sum(amount for _, _, amount in breakdown)
         
         # Recent expenses (last 5)
         recent_expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date.desc()).limit(5).all()
@@ -616,7 +961,7 @@ def get_statistics():
         return jsonify({
             'success': True,
             'data': {
-                'total_expenses': len(expenses),
+                'total_expenses': total_expenses,
                 'total_amount': round(total_amount, 2),
                 'categories': categories,
                 'recent_expenses': recent_expenses_data
@@ -646,6 +991,14 @@ def categorize_expense():
         item_name = data['item']
         amount = data.get('amount')
         
+        # What this user filed the item under before wins over any guess
+        remembered = category_memory.lookup(current_user.id, item_name)
+        if remembered:
+            return jsonify({
+                'success': True,
+                'data': remembered
+            })
+        
         # Get AI categorizer
         categorizer = get_ai_categorizer()
         
@@ -670,6 +1023,69 @@ def categorize_expense():
             'message': str(e)
         }), 500
 
+@main.route('/api/categorize/batch', methods=['POST'])
+@login_required
+def categorize_expense_batch():
+    """
+    Categorize many items at once
+    
+    Expects {"items": [...]} where each item is a name or
+    {"item": ..., "amount": ...}. Items the AI cannot answer are
+    categorized by the keyword rules.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        raw_items = data.get('items') if isinstance(data, dict) else None
+        
+        if not isinstance(raw_items, list) or not raw_items:
+            return jsonify({
+                'success': False,
+                'error': 'A non-empty items list is required'
+            }), 400
+        
+        if len(raw_items) > MAX_BATCH_CATEGORIZE_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_BATCH_CATEGORIZE_ITEMS} items per request'
+            }), 400
+        
+        items = []
+        for raw in raw_items:
+            if isinstance(raw, dict):
+                item_name, amount = raw.get('item'), raw.get('amount')
+            else:
+                item_name, amount = raw, None
+            if not isinstance(item_name, str) or not item_name.strip():
+                return jsonify({
+                    'success': False,
+                    'error': 'Every item needs a name'
+                }), 400
+            items.append((item_name.strip(), amount))
+        
+        results = [category_memory.lookup(current_user.id, item_name) for item_name, _ in items]
+        unknown = [position for position, result in enumerate(results) if result is None]
+        if unknown:
+            categorizer = get_categorizer()
+            answers = categorizer.categorize_batch([items[position] for position in unknown])
+            for position, answer in zip(unknown, answers):
+                results[position] = answer
+        
+        return jsonify({
+            'success': True,
+            'data': [
+                dict(result, item=item_name)
+                for (item_name, _), result in zip(items, results)
+            ],
+            'count': len(results)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Batch categorization failed',
+            'message': str(e)
+        }), 500
+
 @main.route('/api/categorize/suggestions', methods=['POST'])
 @login_required
 def get_category_suggestions():
@@ -684,6 +1100,24 @@ def get_category_suggestions():
             }), 400
         
         item_name = data['item']
+        amount = data.get('amount')
+        
+        # Lead with the user's own past choice; rules fill the rest
+        remembered = category_memory.lookup(current_user.id, item_name)
+        if remembered:
+            suggestions = [{
+                'category': remembered['category'],
+                'confidence': remembered['confidence'],
+                'reason': remembered['reasoning']
+            }]
+            suggestions += [
+                suggestion for suggestion in get_rules_categorizer().get_suggested_categories(item_name)
+                if suggestion['category'] != remembered['category']
+            ]
+            return jsonify({
+                'success': True,
+                'data': suggestions[:3]
+            })
         
         # Get AI categorizer
         categorizer = get_ai_categorizer()
@@ -694,8 +1128,8 @@ def get_category_suggestions():
                 'error': 'AI categorization not available. Please set GEMINI_API_KEY environment variable.'
             }), 503
         
-        # Get suggestions
-        suggestions = categorizer.get_suggested_categories(item_name)
+        # Get suggestions (same scores, and cache entry, as /api/categorize)
+        suggestions = categorizer.get_suggested_categories(item_name, amount)
         
         return jsonify({
             'success': True,
@@ -709,30 +1143,127 @@ def get_category_suggestions():
             'message': str(e)
         }), 500
 
-def filter_expenses_by_period(expenses, period):
-    """Filter expenses based on time period"""
-    from datetime import datetime, timedelta
-    
-    now = datetime.now()
-    
-    if period == 'week':
-        # Last 7 days
-        week_ago = now - timedelta(days=7)
-        cutoff_date = week_ago.strftime('%Y-%m-%d')
-    elif period == 'month':
-        # Last 30 days
-        month_ago = now - timedelta(days=30)
-        cutoff_date = month_ago.strftime('%Y-%m-%d')
-    elif period == 'year':
-        # Last 365 days
-        year_ago = now - timedelta(days=365)
-        cutoff_date = year_ago.strftime('%Y-%m-%d')
-    else:
-        # Default to week
-        week_ago = now - timedelta(days=7)
-        cutoff_date = week_ago.strftime('%Y-%m-%d')
-    
-    return [expense for expense in expenses if expense['date'] >= cutoff_date]
+@main.route('/api/categorize/scores', methods=['POST'])
+@login_required
+def get_category_scores():
+    """Get the probability of every category for an expense, most likely first"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'item' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Item name is required'
+            }), 400
+        
+        # Rules (and the local model) score items when Gemini is not configured
+        categorizer = get_categorizer()
+        scored = categorizer.score_expense(data['item'], data.get('amount'))
+        
+        return jsonify({
+            'success': True,
+            'data': scored
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Scoring failed',
+            'message': str(e)
+        }), 500
+
+@main.route('/api/categorize/typeahead', methods=['GET'])
+@login_required
+def categorize_typeahead():
+    """Instant category guess and completions for a partly typed item name"""
+    try:
+        query = request.args.get('q', '')
+        if len(query) > 200:
+            return jsonify({
+                'success': False,
+                'error': 'Query too long'
+            }), 400
+        
+        # Answered from memory; the model (if any) refines in the background
+        refiner = get_ai_categorizer() if request.args.get('refine', '1') != '0' else None
+        data = typeahead.suggest(
+            current_app._get_current_object(), current_user.id, query, get_rules_categorizer(), refiner
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': data
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Typeahead failed',
+            'message': str(e)
+        }), 500
+
+@main.route('/api/categorize/typeahead/<token>', methods=['GET', 'DELETE'])
+@login_required
+def typeahead_refinement(token):
+    """Poll (GET) or cancel (DELETE) a background refinement"""
+    try:
+        if request.method == 'DELETE':
+            found = typeahead.cancel(current_user.id, token)
+            state = {'status': 'cancelled'} if found else None
+        else:
+            state = typeahead.status(current_user.id, token)
+        
+        if state is None:
+            return jsonify({
+                'success': False,
+                'error': 'Refinement not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': state
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get refinement',
+            'message': str(e)
+        }), 500
+
+@main.route('/api/categorize/cache', methods=['GET'])
+@login_required
+def get_categorization_cache_stats():
+    """Get hit/miss/eviction counters of the categorization cache"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': dict(categorization_cache.stats(), user_memory=category_memory.stats())
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get cache statistics',
+            'message': str(e)
+        }), 500
+
+@main.route('/api/llm/stats', methods=['GET'])
+@login_required
+def get_llm_stats():
+    """Get circuit breaker state and per-call-site AI latency histograms"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': llm_client.stats()
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get AI client statistics',
+            'message': str(e)
+        }), 500
 
 def get_week_key(date_str):
     """Get week key in YYYY-WW format"""
@@ -752,11 +1283,12 @@ def get_visualization_data():
         if period not in ['week', 'month', 'year']:
             period = 'month'
         
-        expenses = Expense.query.filter_by(user_id=current_user.id).all()
-        expenses_data = [{'id': e.id, 'item': e.item, 'category': e.category, 
-                         'amount': e.amount, 'date': e.date.strftime('%Y-%m-%d')} for e in expenses]
+        # Category totals for the period (computed in the database)
+        start_date, end_date = period_range(period)
+        period_criteria = date_range_criteria(Expense.date, start_date, end_date)
+        breakdown = category_breakdown(current_user.id, *period_criteria)
         
-        if not expenses_data:
+        if not breakdown:
             # Get current budget even if no expenses
             current_month = datetime.now().strftime('%Y-%m')
             budget = Budget.query.filter_by(user_id=current_user.id, month=current_month).first()
@@ -774,63 +1306,19 @@ def get_visualization_data():
                 }
             })
         
-        # Filter expenses based on time period
-        filtered_expenses = filter_expenses_by_period(expenses_data, period)
+        pie_data = {category: amount for category, _, amount in breakdown}
+        total_amount = sum(pie_data.values())
         
-        if not filtered_expenses:
-            # Get current budget even if no filtered expenses
-            current_month = datetime.now().strftime('%Y-%m')
-            budget = Budget.query.filter_by(user_id=current_user.id, month=current_month).first()
-            budget_data = budget.to_dict() if budget else None
-            
-            return jsonify({
-                'success': True,
-                'data': {
-                    'pie_chart': [],
-                    'trends': [],
-                    'category_breakdown': {},
-                    'total_amount': 0,
-                    'period': period,
-                    'budget': budget_data
-                }
-            })
+        # Trends data: per-day totals from the user's daily spending series
+        today = datetime.now().date()
+        if period == 'week':
+            trend_start = today - timedelta(days=6)
+        elif period == 'month':
+            trend_start = today - timedelta(days=29)
+        else:  # year - months of the current year
+            trend_start = today.replace(month=1, day=1)
         
-        # Calculate pie chart data
-        pie_data = {}
-        trends_data = {}
-        total_amount = 0
-        
-        for expense in filtered_expenses:
-            category = expense['category']
-            amount = float(expense['amount'])
-            date = expense['date']
-            
-            # Pie chart data
-            if category not in pie_data:
-                pie_data[category] = 0
-            pie_data[category] += amount
-            
-            # Trends data based on period - more granular data
-            if period == 'week':
-                # Group by day for weekly view (YYYY-MM-DD format)
-                day_key = date
-                if day_key not in trends_data:
-                    trends_data[day_key] = 0
-                trends_data[day_key] += amount
-            elif period == 'month':
-                # Group by day for monthly view (YYYY-MM-DD format)
-                day_key = date
-                if day_key not in trends_data:
-                    trends_data[day_key] = 0
-                trends_data[day_key] += amount
-            elif period == 'year':
-                # Group by month for yearly view (YYYY-MM format)
-                month_key = date[:7]
-                if month_key not in trends_data:
-                    trends_data[month_key] = 0
-                trends_data[month_key] += amount
-            
-            total_amount += amount
+        series = daily_spend_store.series(current_user.id)
         
         # Format pie chart data for Chart.js
         pie_chart_data = []
@@ -851,22 +1339,9 @@ def get_visualization_data():
         trends = []
         
         if period == 'week' or period == 'month':
-            # For daily data, fill in missing days
-            from datetime import datetime, timedelta
-            
-            if period == 'week':
-                # Get last 7 days
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=6)
-            else:  # month
-                # Get last 30 days
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=29)
-            
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime('%Y-%m-%d')
-                amount = trends_data.get(date_str, 0)
+            # For daily data, days without expenses are filled with 0
+            for offset, amount in enumerate(series.filled(trend_start, today)):
+                current_date = trend_start + timedelta(days=offset)
                 
                 # Format label for display
                 if period == 'week':
@@ -875,20 +1350,16 @@ def get_visualization_data():
                     label = current_date.strftime('%d')  # 25
                 
                 trends.append({
-                    'period': date_str,
+                    'period': current_date.strftime('%Y-%m-%d'),
                     'label': label,
                     'amount': round(amount, 2)
                 })
-                current_date += timedelta(days=1)
                 
         elif period == 'year':
-            # For monthly data, fill in missing months
-            from datetime import datetime
-            
-            current_year = datetime.now().year
-            for month in range(1, 13):
+            # For monthly data, one total per month of the current year
+            current_year = today.year
+            for month, amount in enumerate(series.month_totals(current_year, until=today), start=1):
                 month_key = f"{current_year}-{month:02d}"
-                amount = trends_data.get(month_key, 0)
                 
                 # Format label for display
                 month_name = datetime(current_year, month, 1).strftime('%b')  # Jan, Feb, etc.
@@ -933,11 +1404,6 @@ def get_insights():
         if period not in ['week', 'month', 'all']:
             period = 'week'
         
-        # Load expenses
-        expenses = Expense.query.filter_by(user_id=current_user.id).all()
-        expenses_data = [{'id': e.id, 'item': e.item, 'category': e.category, 
-                         'amount': e.amount, 'date': e.date.strftime('%Y-%m-%d')} for e in expenses]
-        
         # Get AI insights generator
         insights_generator = get_ai_insights()
         
@@ -947,12 +1413,21 @@ def get_insights():
                 'error': 'AI insights not available. Please set GEMINI_API_KEY environment variable.'
             }), 503
         
-        # Generate insights
-        insights_data = insights_generator.generate_insights(expenses_data, period)
+        user_id = current_user.id
+        
+        def generate():
+            return insights_for(insights_generator, user_id, period)[0]
+        
+        # Served from the cache while the user's expenses are unchanged, else
+        # from the stored results (precomputed off-peak) before generating
+        insights_data, cache_status = insights_cache.get_or_compute(
+            current_app._get_current_object(), user_id, period, generate
+        )
         
         return jsonify({
             'success': True,
-            'data': insights_data
+            'data': insights_data,
+            'cache': cache_status
         })
         
     except Exception as e:
@@ -968,24 +1443,22 @@ def get_spending_trends():
     """Get spending trend analysis for current user"""
     try:
         # Get days parameter
-        days = int(request.args.get('days', 30))
-        
-        # Load expenses
-        expenses = Expense.query.filter_by(user_id=current_user.id).all()
-        expenses_data = [{'id': e.id, 'item': e.item, 'category': e.category, 
-                         'amount': e.amount, 'date': e.date.strftime('%Y-%m-%d')} for e in expenses]
-        
-        # Get AI insights generator
-        insights_generator = get_ai_insights()
-        
-        if not insights_generator:
+        try:
+            days = int(request.args.get('days', 30))
+        except ValueError:
             return jsonify({
                 'success': False,
-                'error': 'AI insights not available. Please set GEMINI_API_KEY environment variable.'
-            }), 503
+                'error': 'days must be a whole number'
+            }), 400
+        days = min(max(days, MIN_TREND_DAYS), MAX_TREND_DAYS)
+        
+        # Trends are computed locally, so they do not need a Gemini key
+        insights_generator = get_ai_insights() or AIInsightsGenerator()
         
-        # Generate trends
-        trends_data = insights_generator.get_spending_trends(expenses_data, days)
+        # The window's per-day totals, from the user's daily spending series
+        start = datetime.now().date() - timedelta(days=days - 1)
+        daily = daily_spend_store.series(current_user.id).filled(start, start + timedelta(days=days - 1))
+        trends_data = insights_generator.daily_trends(daily, start)
         
         return jsonify({
             'success': True,
@@ -1119,18 +1592,8 @@ def get_budget_status():
                 }
             })
         
-        # Get current month's expenses
-        from sqlalchemy import extract
-        current_year = datetime.now().year
-        current_month_num = datetime.now().month
-        
-        monthly_expenses = Expense.query.filter(
-            Expense.user_id == current_user.id,
-            extract('year', Expense.date) == current_year,
-            extract('month', Expense.date) == current_month_num
-        ).all()
-        
-        total_spent = sum(expense.amount for expense in monthly_expenses)
+        # Get current month's spending (from the rollup table)
+        total_spent = monthly_total(current_user.id, current_month)
         budget_amount = budget.amount
         alert_threshold = budget.alert_threshold
         
@@ -1240,59 +1703,25 @@ def scan_receipt():
                 'error': 'Gemini API not configured. Please add GEMINI_API_KEY to environment variables.'
             }), 500
         
-        # Import and configure Gemini
-        import google.generativeai as genai
+        # PIL is only needed here, so it is imported on first scan
         from PIL import Image
         import io
         
-        genai.configure(api_key=gemini_api_key)
-        
         # Create image from bytes
         image = Image.open(io.BytesIO(image_data))
         
-        # Create model
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Create prompt for receipt analysis
-        prompt = """
-        Analyze this receipt image and extract the following information in JSON format:
-
-        1. merchant: The store/merchant name (string)
-        2. amount: The total amount paid (number only, no currency symbols)
-        3. date: The date of purchase in YYYY-MM-DD format
-        4. category: The most appropriate category from these options:
-           - Food & Dining (restaurants, cafes, groceries)
-           - Transportation (gas, uber, parking, public transit)
-           - Shopping (retail, clothing, electronics)
-           - Entertainment (movies, games, events)
-           - Bills & Utilities (electricity, water, internet, phone)
-           - Healthcare (medical, pharmacy, fitness)
-           - Education (books, courses, tuition)
-           - Others (anything else)
-        5. items: Array of individual items purchased with their prices (if visible)
-           Format each item as "ItemName - $Price" or just "ItemName" if price not visible
-        6. confidence: Your confidence level in the extraction (high/medium/low)
-
-        Return ONLY valid JSON in this exact format:
-        {
-            "merchant": "Store Name",
-            "amount": "0.00",
-            "date": "YYYY-MM-DD",
-            "category": "Category Name",
-            "items": ["item1 - 10.50", "item2 - 5.25"],
-            "confidence": "high"
-        }
-
-        IMPORTANT:
-        - Extract ALL visible items from the receipt, not just the first one
-        - If individual item prices are visible, include them with each item
-        - If you cannot read certain fields, use empty strings for text fields, "0.00" for amount, today's date for date, and "Others" for category
-        - Be accurate and extract exactly what you see on the receipt
-        """
+        # Shared model, configured on first use
+        model = get_model(RECEIPT_MODEL, gemini_api_key)
+        if model is None:
+            return jsonify({
+                'success': False,
+                'error': 'Gemini API not available. Install google-generativeai to scan receipts.'
+            }), 500
         
         # Generate content
-        response = model.generate_content([prompt, image])
-        response_text = response.text.strip()
+        response_text = llm_client.generate(
+            model, [RECEIPT_PROMPT, image], call_site='receipt', timeout=RECEIPT_SCAN_TIMEOUT
+        ).strip()
         
         # Parse JSON response
         import json
@@ -1356,6 +1785,20 @@ def scan_receipt():
             'message': f'Could not understand the receipt format. Please try a clearer image.'
         }), 500
     
+    except LLMUnavailableError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Receipt scanning is temporarily unavailable',
+            'message': str(e)
+        }), 503
+    
+    except LLMTimeoutError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Receipt scan timed out',
+            'message': str(e)
+        }), 504
+    
     except Exception as e:
         print(f"Receipt scan error: {e}")
         return jsonify({
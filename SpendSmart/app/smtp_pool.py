@@ -0,0 +1,213 @@
+"""
+Pooled, persistent SMTP sessions for outgoing mail
+
+Flask-Mail's mail.send() opens a TCP+TLS connection, authenticates, sends a
+single message and quits. SMTPConnectionPool keeps authenticated sessions
+open between sends instead: idle sessions are NOOP-checked before reuse,
+closed once they sit idle past the timeout, and send_batch() pushes many
+messages through one session.
+"""
+import smtplib
+import threading
+import time
+
+from flask import current_app
+from flask_mail import Connection
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_KEEPALIVE_INTERVAL = 10
+DEFAULT_ACQUIRE_TIMEOUT = 30
+
+# Errors meaning the session itself is unusable (retry on a fresh one)
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def open_mail_connection():
+    """Open an authenticated Flask-Mail connection for the current app"""
+    connection = Connection(current_app.extensions['mail'])
+    connection.__enter__()
+    return connection
+
+
+class PooledConnection:
+    """One open SMTP session plus its usage timestamps"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.monotonic()
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_used
+
+    def send(self, message):
+        self.connection.send(message)
+        self.last_used = time.monotonic()
+
+    def is_alive(self):
+        """NOOP health check (suppressed connections have no host)"""
+        host = self.connection.host
+        if host is None:
+            return True
+        try:
+            return host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        host = self.connection.host
+        if host is None:
+            return
+        try:
+            host.quit()
+        except (smtplib.SMTPException, OSError):
+            host.close()
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of at most `size` SMTP sessions"""
+
+    def __init__(self, connect=open_mail_connection, size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """
+        Args:
+            connect: Callable returning an open Flask-Mail Connection
+            size: Maximum number of sessions open at once
+            idle_timeout: Seconds an idle session is kept before closing
+            keepalive_interval: Idle seconds after which a session is
+                NOOP-checked before reuse
+            acquire_timeout: Seconds to wait for a free session
+        """
+        self.connect = connect
+        self.configure(size, idle_timeout, keepalive_interval, acquire_timeout)
+        self._idle = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def configure(self, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                  keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """Change pool settings (call before the pool is used)"""
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(size)
+
+    def init_app(self, app):
+        """Configure the pool from MAIL_POOL_* app settings"""
+        self.configure(
+            size=app.config['MAIL_POOL_SIZE'],
+            idle_timeout=app.config['MAIL_POOL_IDLE_TIMEOUT'],
+            keepalive_interval=app.config['MAIL_POOL_KEEPALIVE']
+        )
+
+    def acquire(self):
+        """
+        Lease a healthy session, reusing an idle one when possible
+
+        Raises:
+            TimeoutError: If every session stays busy for acquire_timeout
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError("No SMTP connection available")
+
+        try:
+            while True:
+                with self._lock:
+                    pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    break
+                idle = pooled.idle_seconds()
+                if idle > self.idle_timeout or (idle > self.keepalive_interval and not pooled.is_alive()):
+                    pooled.close()
+                    continue
+                self.reused += 1
+                return pooled
+
+            pooled = PooledConnection(self.connect())
+            self.opened += 1
+            return pooled
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, pooled):
+        """Return a leased session to the pool"""
+        with self._lock:
+            self._idle.append(pooled)
+        self._slots.release()
+
+    def discard(self, pooled):
+        """Close a leased session that is no longer usable"""
+        pooled.close()
+        self._slots.release()
+
+    def send(self, message):
+        """
+        Send one message over a pooled session
+
+        Raises:
+            Exception: Whatever the SMTP server or Flask-Mail raised
+        """
+        error = self.send_batch([message])[0]
+        if error is not None:
+            raise error
+
+    def send_batch(self, messages):
+        """
+        Send messages in order over one session
+
+        A session that drops mid-batch is replaced and the failed message
+        retried once; other errors only fail the message that caused them.
+
+        Returns:
+            List with None for each sent message or the exception raised
+        """
+        results = []
+        pooled = None
+        try:
+            for message in messages:
+                error = None
+                for _attempt in range(2):
+                    try:
+                        if pooled is None:
+                            pooled = self.acquire()
+                        pooled.send(message)
+                        error = None
+                        break
+                    except CONNECTION_ERRORS as e:
+                        error = e
+                        if pooled is not None:
+                            self.discard(pooled)
+                            pooled = None
+                    except Exception as e:
+                        error = e
+                        break
+                results.append(error)
+        finally:
+            if pooled is not None:
+                self.release(pooled)
+        return results
+
+    def prune_idle(self):
+        """
+        Close sessions idle for longer than idle_timeout
+
+        Returns:
+            Number of sessions closed
+        """
+        with self._lock:
+            expired = [pooled for pooled in self._idle if pooled.idle_seconds() > self.idle_timeout]
+            self._idle = [pooled for pooled in self._idle if pooled not in expired]
+        for pooled in expired:
+            pooled.close()
+        return len(expired)
+
+    def close_all(self):
+        """Close every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            pooled.close()
@@ -0,0 +1,141 @@
+"""
+Columnar spending data for insights analytics
+
+SpendingColumns holds a user's expenses as three NumPy arrays -- day
+numbers (days since 1970-01-01), category codes and amounts -- so period
+filters are one comparison and totals, counts and daily series are
+bincounts.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+from app.models import db, Expense
+
+# Days covered by each insights period; 'all' has no cutoff
+PERIOD_DAYS = {'week': 7, 'month': 30}
+
+
+def day_number(value):
+    """Days since 1970-01-01 of a date"""
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+def day_string(day):
+    """YYYY-MM-DD for a day number"""
+    return str(np.datetime64(int(day), 'D'))
+
+
+def first_day_after(start):
+    """Day number of the first midnight at or after a datetime"""
+    first = start.date()
+    if datetime.combine(first, time()) < start:
+        first += timedelta(days=1)
+    return day_number(first)
+
+
+class SpendingColumns:
+    """A user's expenses as day, category code and amount arrays"""
+
+    def __init__(self, days, codes, amounts, categories):
+        """
+        Args:
+            days: int64 day numbers
+            codes: int64 indexes into categories
+            amounts: float64 amounts
+            categories: Category names in first-seen order
+        """
+        self.days = days
+        self.codes = codes
+        self.amounts = amounts
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @classmethod
+    def _build(cls, dates, category_names, amounts):
+        index = {}
+        codes = [index.setdefault(category, len(index)) for category in category_names]
+        return cls(
+            np.array(dates, dtype='datetime64[D]').astype(np.int64),
+            np.array(codes, dtype=np.int64),
+            np.array(amounts, dtype=np.float64),
+            list(index)
+        )
+
+    @classmethod
+    def from_records(cls, expenses):
+        """From expense dicts with 'date' (YYYY-MM-DD), 'category' and 'amount'"""
+        return cls._build(
+            [expense['date'] for expense in expenses],
+            [expense['category'] for expense in expenses],
+            [expense['amount'] for expense in expenses]
+        )
+
+    @classmethod
+    def for_user(cls, user_id):
+        """Load a user's expenses, reading only the three columns"""
+        rows = db.session.query(Expense.date, Expense.category, Expense.amount).filter(
+            Expense.user_id == user_id
+        ).all()
+        dates, category_names, amounts = zip(*rows) if rows else ((), (), ())
+        return cls._build(dates, category_names, amounts)
+
+    def since(self, first_day):
+        """Expenses on or after a day number"""
+        keep = self.days >= first_day
+        return SpendingColumns(self.days[keep], self.codes[keep], self.amounts[keep], self.categories)
+
+    def for_period(self, period, now=None):
+        """Expenses on or after the first midnight of a 7- or 30-day period ('all' keeps every row)"""
+        if period not in PERIOD_DAYS:
+            return self
+        now = now or datetime.now()
+        return self.since(first_day_after(now - timedelta(days=PERIOD_DAYS[period])))
+
+    def daily_totals(self):
+        """(day numbers with spending, their totals), in day order"""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        first = self.days.min()
+        totals = np.bincount(self.days - first, weights=self.amounts)
+        spent_days = np.flatnonzero(np.bincount(self.days - first))
+        return spent_days + first, totals[spent_days]
+
+    def analytics(self, period):
+        """
+        Spending analytics for AIInsightsGenerator prompts and responses
+
+        Categories are listed in the order they first appear in the loaded
+        expenses, and daily spending is keyed by date in day order.
+        """
+        size = len(self.categories)
+        totals = np.bincount(self.codes, weights=self.amounts, minlength=size)
+        counts = np.bincount(self.codes, minlength=size)
+        total_amount = float(totals.sum())
+
+        present = [code for code in range(size) if counts[code]]
+        category_totals = {self.categories[code]: float(totals[code]) for code in present}
+
+        days, day_totals = self.daily_totals()
+        daily_spending = {day_string(day): float(total) for day, total in zip(days, day_totals)}
+
+        return {
+            'total_amount': round(total_amount, 2),
+            'total_expenses': len(self),
+            'category_breakdown': category_totals,
+            'category_percentages': {
+                category: (amount / total_amount * 100) if total_amount > 0 else 0
+                for category, amount in category_totals.items()
+            },
+            'category_counts': {self.categories[code]: int(counts[code]) for code in present},
+            'daily_spending': daily_spending,
+            'avg_daily_spending': round(total_amount / len(days), 2) if len(days) else 0,
+            'top_categories': sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:3],
+            'period': period,
+            'date_range': {
+                'start': day_string(days[0]) if len(days) else None,
+                'end': day_string(days[-1]) if len(days) else None
+            }
+        }
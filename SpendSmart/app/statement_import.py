@@ -0,0 +1,357 @@
+"""
+Streaming import of bank and card statements (CSV and OFX)
+
+Statements are parsed record by record straight from the uploaded file, so
+memory use depends on the chunk size rather than the file size. Each chunk
+is deduplicated against the user's expenses from before the import by
+(date, amount, normalized item) -- each existing expense absorbs one
+matching record, so repeated transactions within a statement are kept --
+categorized with the keyword rules in one batch, and written in its own
+transaction.
+"""
+import csv
+import io
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.date_ranges import date_range_criteria
+from app.models import db, Expense
+from app.rollups import add_expense_rows_to_rollup
+from app.text_normalize import normalize_item
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+MAX_AMOUNT = 999999.99
+ITEM_MAX_LENGTH = 200
+
+# Column names used when no mapping is supplied
+DEFAULT_CSV_MAPPING = {
+    'date': 'date',
+    'item': 'item',
+    'amount': 'amount',
+    'category': 'category',
+    'date_format': '%Y-%m-%d',
+    # 'positive': expenses are positive amounts; 'negative': expenses are
+    # negative amounts (typical bank export). Other rows are skipped.
+    'amount_sign': 'positive',
+    'delimiter': ','
+}
+
+# Optional sign, optional currency token, then the first number (with
+# thousands separators, including the lakh style 1,20,000); a number
+# running on into more digits is rejected rather than cut short
+_AMOUNT = re.compile(
+    r'([-+]?)\s*(?:(?:rs\.?|inr|₹|\$|€|£)\s*)?([-+]?)\s*((?:\d{1,3}(?:,\d{2,3})+|\d+)(?:\.\d+)?|\.\d+)(?![\d,])',
+    re.IGNORECASE
+)
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+_OFX_READ_SIZE = 64 * 1024
+
+
+def parse_amount(text):
+    """
+    Parse a statement amount such as '1,234.50', 'Rs. -20' or '(12.00)'
+
+    Text after the number (e.g. a trailing currency code) is ignored.
+
+    Raises:
+        ValueError: If the text does not start with a number
+    """
+    text = (text or '').strip()
+    negative = text.startswith('(') and text.endswith(')')
+    if negative:
+        text = text[1:-1].strip()
+    match = _AMOUNT.match(text)
+    if not match:
+        raise ValueError(f'Not an amount: {text!r}')
+    sign, currency_sign, number = match.groups()
+    value = float(number.replace(',', ''))
+    return -value if negative or '-' in (sign, currency_sign) else value
+
+
+def _text_stream(binary_stream):
+    """Wrap an uploaded binary stream for line-by-line text reading"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+def open_csv_records(binary_stream, mapping=None):
+    """
+    Start parsing a CSV statement
+
+    The header row is read and checked immediately; data rows are parsed
+    lazily by the returned generator.
+
+    Args:
+        binary_stream: Readable binary file object
+        mapping: Overrides for DEFAULT_CSV_MAPPING
+
+    Returns:
+        Generator of (line_number, record, error) tuples. record is a dict
+        with date, item, amount and category (None if absent), or None when
+        the row is skipped or invalid.
+
+    Raises:
+        ValueError: If the header lacks a mapped column
+    """
+    config = dict(DEFAULT_CSV_MAPPING, **(mapping or {}))
+    text = _text_stream(binary_stream)
+    reader = csv.reader(text, delimiter=config['delimiter'])
+
+    header = next(reader, None)
+    if not header:
+        raise ValueError("CSV file is empty")
+    columns = {name.strip().lower(): index for index, name in enumerate(header)}
+
+    positions = {}
+    for field in ('date', 'item', 'amount'):
+        column = config[field].strip().lower()
+        if column not in columns:
+            raise ValueError(f"CSV header has no '{config[field]}' column for {field}")
+        positions[field] = columns[column]
+    category_position = columns.get((config.get('category') or '').strip().lower())
+    debit_sign = -1 if config['amount_sign'] == 'negative' else 1
+
+    def records():
+        try:
+            for row in reader:
+                line_number = reader.line_num
+                if not any(cell.strip() for cell in row):
+                    continue
+                try:
+                    amount = parse_amount(row[positions['amount']]) * debit_sign
+                    if amount <= 0:
+                        # Credits/refunds are not expenses
+                        yield line_number, None, None
+                        continue
+                    record = {
+                        'date': datetime.strptime(row[positions['date']].strip(), config['date_format']).date(),
+                        'item': row[positions['item']].strip(),
+                        'amount': amount,
+                        'category': row[category_position].strip() if category_position is not None and category_position < len(row) else None
+                    }
+                except (ValueError, IndexError) as e:
+                    yield line_number, None, str(e)
+                    continue
+                yield line_number, record, None
+        finally:
+            text.detach()
+
+    return records()
+
+
+def _iter_ofx_tags(text):
+    """Yield (closing, tag, value) for each OFX tag, reading in chunks"""
+    buffer = ''
+    while True:
+        chunk = text.read(_OFX_READ_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        # Keep the last (possibly incomplete) tag for the next chunk
+        cut = buffer.rfind('<')
+        if cut <= 0:
+            continue
+        complete, buffer = buffer[:cut], buffer[cut:]
+        for match in _OFX_TAG.finditer(complete):
+            yield match.group(1) == '/', match.group(2).upper(), match.group(3).strip()
+
+    for match in _OFX_TAG.finditer(buffer):
+        yield match.group(1) == '/', match.group(2).upper(), match.group(3).strip()
+
+
+def open_ofx_records(binary_stream):
+    """
+    Start parsing an OFX statement (SGML v1 or XML v2)
+
+    Returns:
+        Generator of (transaction_number, record, error) tuples in the same
+        shape as open_csv_records. Only debits (negative TRNAMT) become
+        expenses.
+    """
+    text = _text_stream(binary_stream)
+
+    def records():
+        number = 0
+        current = None
+        try:
+            for closing, tag, value in _iter_ofx_tags(text):
+                if tag == 'STMTTRN':
+                    if not closing:
+                        current = {}
+                    elif current is not None:
+                        number += 1
+                        yield (number, *_ofx_record(current))
+                        current = None
+                elif current is not None and not closing and value:
+                    current[tag] = value
+        finally:
+            text.detach()
+
+    return records()
+
+
+def _ofx_record(transaction):
+    """Convert one parsed STMTTRN into (record, error)"""
+    try:
+        amount = -parse_amount(transaction.get('TRNAMT'))
+        if amount <= 0:
+            return None, None
+        return {
+            'date': datetime.strptime(transaction.get('DTPOSTED', '')[:8], '%Y%m%d').date(),
+            'item': transaction.get('NAME') or transaction.get('MEMO') or '',
+            'amount': amount,
+            'category': None
+        }, None
+    except ValueError as e:
+        return None, str(e)
+
+
+class StatementImporter:
+    """Writes parsed statement records for one user in chunked transactions"""
+
+    def __init__(self, user_id, categorizer, chunk_size=IMPORT_CHUNK_SIZE, memory=None):
+        """
+        Args:
+            user_id: Owner of the imported expenses
+            categorizer: AICategorizer used (rules only) for rows without a
+                valid category
+            chunk_size: Records per transaction
+            memory: Optional CategoryMemory; the user's past category for
+                an item is preferred over the categorizer
+        """
+        self.user_id = user_id
+        self.categorizer = categorizer
+        self.memory = memory
+        self.chunk_size = chunk_size
+        self.valid_categories = set(categorizer.categories)
+        self.processed = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors = []
+        self.affected_months = set()
+        # Dedupe keys this import inserted, so later chunks still compare
+        # against the expenses from before the import
+        self._inserted_keys = Counter()
+
+    def run(self, records):
+        """
+        Import records, yielding a progress dict after every chunk
+
+        The last progress dict has 'done': True.
+        """
+        chunk = []
+        for line_number, record, error in records:
+            self.processed += 1
+            if error or (record is not None and not self._is_valid(record)):
+                self._record_error(line_number, error or 'Invalid item or amount')
+                continue
+            if record is None:
+                self.skipped += 1
+                continue
+
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self._write_chunk(chunk)
+                chunk = []
+                yield self.progress()
+
+        if chunk:
+            self._write_chunk(chunk)
+        yield self.progress(done=True)
+
+    def progress(self, done=False):
+        """Current counters as a JSON-serializable dict"""
+        return {
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+            'errors': list(self.errors),
+            'done': done
+        }
+
+    def _is_valid(self, record):
+        return bool(record['item']) and 0 < record['amount'] <= MAX_AMOUNT
+
+    def _record_error(self, line_number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    @staticmethod
+    def _dedupe_key(day, amount, item):
+        """Key of an expense as stored (amount rounded, item truncated)"""
+        return day, round(amount, 2), normalize_item(item[:ITEM_MAX_LENGTH])
+
+    def _existing_keys(self, chunk):
+        """Counts per dedupe key of the user's expenses from before the import, in the chunk's date span"""
+        dates = [record['date'] for record in chunk]
+        existing = db.session.query(Expense.date, Expense.amount, Expense.item).filter(
+            Expense.user_id == self.user_id,
+            *date_range_criteria(Expense.date, min(dates), max(dates) + timedelta(days=1))
+        )
+        counts = Counter(self._dedupe_key(day, amount, item) for day, amount, item in existing)
+        counts.subtract(self._inserted_keys)
+        return counts
+
+    def _write_chunk(self, chunk):
+        existing = self._existing_keys(chunk)
+        rows = []
+        keys = []
+        for record in chunk:
+            key = self._dedupe_key(record['date'], record['amount'], record['item'])
+            if existing[key] > 0:
+                existing[key] -= 1
+                self.duplicates += 1
+                continue
+            rows.append(record)
+            keys.append(key)
+
+        if not rows:
+            return
+
+        # Categorize each distinct uncategorized item once, preferring the
+        # category the user chose for it before
+        pending = sorted({row['item'] for row in rows if row['category'] not in self.valid_categories})
+        categories = {}
+        if self.memory:
+            for item in pending:
+                remembered = self.memory.lookup(self.user_id, item)
+                if remembered:
+                    categories[item] = remembered['category']
+            pending = [item for item in pending if item not in categories]
+        results = self.categorizer.categorize_with_rules(pending)
+        categories.update((item, result['category']) for item, result in zip(pending, results))
+
+        now = datetime.utcnow()
+        values = [
+            {
+                'user_id': self.user_id,
+                'item': row['item'][:ITEM_MAX_LENGTH],
+                'category': row['category'] if row['category'] in self.valid_categories else categories[row['item']],
+                'amount': round(row['amount'], 2),
+                'date': row['date'],
+                'created_at': now,
+                'updated_at': now
+            }
+            for row in rows
+        ]
+
+        try:
+            # executemany form: compiled once and batched by SQLAlchemy
+            db.session.execute(insert(Expense), values)
+            add_expense_rows_to_rollup(self.user_id, values)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.inserted += len(values)
+        self._inserted_keys.update(keys)
+        self.affected_months.update(value['date'].replace(day=1) for value in values)
@@ -21,6 +21,15 @@ document.addEventListener('DOMContentLoaded', function() {
     const itemNameInput = document.getElementById('itemName');
     if (itemNameInput && typeof handleAutoCategorization === 'function') {
         itemNameInput.addEventListener('blur', handleAutoCategorization);
+        // Instant suggestions while typing
+        itemNameInput.addEventListener('input', handleItemNameInput);
+        // A category chosen by hand is never replaced by a suggestion
+        const categorySelect = document.getElementById('category');
+        if (categorySelect) {
+            categorySelect.addEventListener('change', () => {
+                delete categorySelect.dataset.autoSelected;
+            });
+        }
         // Also trigger on Enter key
         itemNameInput.addEventListener('keyup', function(e) {
             if (e.key === 'Enter') {
@@ -139,6 +148,7 @@ async function handleFormSubmit(e) {
             
             // Reset form
             document.getElementById('expenseForm').reset();
+            delete document.getElementById('category').dataset.autoSelected;
             document.getElementById('date').valueAsDate = new Date();
             
             // Hide AI suggestions if visible
@@ -402,6 +412,109 @@ function showAlert(message, type) {
     }, 3000);
 }
 
+// Typeahead categorization: debounced, stale requests aborted, model
+// refinements polled until they arrive
+const TYPEAHEAD_DELAY_MS = 150;
+const REFINEMENT_POLL_MS = 800;
+const REFINEMENT_MAX_POLLS = 15;
+let typeaheadTimer = null;
+let typeaheadController = null;
+let refinementToken = null;
+
+function handleItemNameInput() {
+    clearTimeout(typeaheadTimer);
+    typeaheadTimer = setTimeout(runTypeahead, TYPEAHEAD_DELAY_MS);
+}
+
+async function runTypeahead() {
+    const itemNameInput = document.getElementById('itemName');
+    const query = itemNameInput.value.trim();
+    
+    // Only the latest query matters
+    if (typeaheadController) {
+        typeaheadController.abort();
+    }
+    refinementToken = null;
+    if (query.length < 2) return;
+    
+    typeaheadController = new AbortController();
+    try {
+        const response = await fetch(`/api/categorize/typeahead?q=${encodeURIComponent(query)}`, {
+            signal: typeaheadController.signal
+        });
+        const result = await response.json();
+        if (!result.success) return;
+        
+        showItemCompletions(result.data.completions);
+        if (result.data.result) {
+            applySuggestedCategory(result.data.result, false);
+        }
+        if (result.data.refinement) {
+            pollRefinement(result.data.refinement, query);
+        }
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Typeahead error:', error);
+        }
+    }
+}
+
+function showItemCompletions(completions) {
+    const list = document.getElementById('itemSuggestions');
+    if (!list) return;
+    list.innerHTML = '';
+    completions.forEach(completion => {
+        const option = document.createElement('option');
+        option.value = completion.item;
+        option.label = completion.category;
+        list.appendChild(option);
+    });
+}
+
+function applySuggestedCategory(suggestion, fromAI) {
+    const categorySelect = document.getElementById('category');
+    const aiHint = document.getElementById('aiHint');
+    
+    // Never override a category the user picked themselves
+    if (categorySelect.value && categorySelect.dataset.autoSelected !== 'true') return;
+    
+    categorySelect.value = suggestion.category;
+    categorySelect.dataset.autoSelected = 'true';
+    if (aiHint) {
+        const source = fromAI ? 'AI suggested' : 'Suggested';
+        aiHint.textContent = `✓ ${source} (${Math.round(suggestion.confidence * 100)}% confidence)`;
+        aiHint.style.display = 'inline';
+        aiHint.style.color = 'var(--color-accent)';
+    }
+}
+
+async function pollRefinement(token, query) {
+    refinementToken = token;
+    for (let poll = 0; poll < REFINEMENT_MAX_POLLS; poll++) {
+        await new Promise(resolve => setTimeout(resolve, REFINEMENT_POLL_MS));
+        
+        // A newer query replaced this one
+        if (refinementToken !== token) return;
+        
+        try {
+            const response = await fetch(`/api/categorize/typeahead/${token}`);
+            const result = await response.json();
+            if (!result.success || refinementToken !== token) return;
+            
+            if (result.data.status === 'done') {
+                if (document.getElementById('itemName').value.trim() === query) {
+                    applySuggestedCategory(result.data.result, true);
+                }
+                return;
+            }
+            if (result.data.status !== 'pending') return;
+        } catch (error) {
+            console.error('Refinement poll error:', error);
+            return;
+        }
+    }
+}
+
 // Auto-Categorization Function (Built-in)
 async function handleAutoCategorization() {
     const itemNameInput = document.getElementById('itemName');
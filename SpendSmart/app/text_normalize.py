@@ -0,0 +1,16 @@
+"""
+Normalization of free-text expense item names
+"""
+import re
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_item(text):
+    """
+    Normalize an item name for matching and deduplication
+
+    Lowercases, replaces punctuation with spaces and collapses whitespace,
+    so 'UBER *Trip', 'uber trip' and 'Uber  Trip.' all compare equal.
+    """
+    return _NON_WORD.sub(' ', (text or '').lower()).strip()
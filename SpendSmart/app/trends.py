@@ -0,0 +1,162 @@
+"""
+Spending trend analysis over a day-filled daily series
+
+trend_report takes one total per calendar day of a window (zero for days
+without expenses) and derives, in linear passes over that array, trailing
+7- and 30-day means, a least-squares slope, average spending per weekday
+and unusually high days by z-score or median absolute deviation.
+"""
+import numpy as np
+
+ROLLING_WINDOWS = (7, 30)
+
+# Change over the window (percent of the daily average) that counts as a trend
+TREND_THRESHOLD = 10
+
+# Flag days above either score
+ANOMALY_Z_SCORE = 3.0
+ANOMALY_ROBUST_Z_SCORE = 3.5
+
+# For normally distributed data, MAD = 0.6745 and mean absolute deviation
+# = 1 / 1.2533 standard deviations
+MAD_SCALE = 0.6745
+MEAN_AD_SCALE = 1.2533
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+def rolling_mean(values, window):
+    """Trailing mean over up to window values (fewer at the start)"""
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+def least_squares_slope(values):
+    """Slope of the least-squares line through (index, value)"""
+    if len(values) < 2:
+        return 0.0
+    offsets = np.arange(len(values)) - (len(values) - 1) / 2
+    return float(np.dot(offsets, values - values.mean()) / np.dot(offsets, offsets))
+
+
+def weekday_profile(first_day, values):
+    """Average spending per weekday and its ratio to the overall daily average"""
+    # Day 0 (1970-01-01) was a Thursday
+    weekdays = (np.arange(first_day, first_day + len(values)) + 3) % 7
+    totals = np.bincount(weekdays, weights=values, minlength=7)
+    counts = np.bincount(weekdays, minlength=7)
+    overall = values.mean() if len(values) else 0
+    profile = []
+    for weekday, name in enumerate(WEEKDAYS):
+        average = totals[weekday] / counts[weekday] if counts[weekday] else 0.0
+        profile.append({
+            'day': name,
+            'average': round(float(average), 2),
+            'index': round(float(average / overall), 2) if overall else None
+        })
+    return profile
+
+
+def anomaly_scores(values):
+    """
+    (z-scores, robust z-scores) per day
+
+    The robust score uses the median absolute deviation; when most days are
+    zero that is zero too, and the mean absolute deviation stands in.
+    """
+    std = values.std()
+    z_scores = (values - values.mean()) / std if std else np.zeros(len(values))
+    median = np.median(values)
+    deviations = np.abs(values - median)
+    mad = np.median(deviations)
+    if mad:
+        robust = MAD_SCALE * (values - median) / mad
+    elif deviations.mean():
+        robust = (values - median) / (MEAN_AD_SCALE * deviations.mean())
+    else:
+        robust = np.zeros(len(values))
+    return z_scores, robust
+
+
+def trend_report(values, first_day):
+    """
+    Trend report for a zero-filled daily series
+
+    Args:
+        values: Spending per day, oldest first
+        first_day: Day number of values[0]
+
+    Returns:
+        Dict with trend/change/message, the half totals, the
+        regression slope, a per-day series with rolling means and anomaly
+        flags, a weekday profile and the anomalous days
+    """
+    values = np.asarray(values, dtype=np.float64)
+    days = len(values)
+    last_day = first_day + days - 1
+    spending_days = int(np.count_nonzero(values))
+
+    if spending_days < 2:
+        return {
+            'trend': 'stable',
+            'change': 0,
+            'days': days,
+            'message': 'No data available' if not spending_days else 'Insufficient data for trend analysis'
+        }
+
+    average = float(values.mean())
+    slope = least_squares_slope(values)
+    # Change of the fitted line across the window, relative to the average day
+    change_percent = slope * (days - 1) / average * 100
+
+    if change_percent > TREND_THRESHOLD:
+        trend = 'increasing'
+        message = f'Spending increased by {change_percent:.1f}% over the last {days} days'
+    elif change_percent < -TREND_THRESHOLD:
+        trend = 'decreasing'
+        message = f'Spending decreased by {abs(change_percent):.1f}% over the last {days} days'
+    else:
+        trend = 'stable'
+        message = f'Spending is relatively stable ({change_percent:.1f}% change over {days} days)'
+
+    rolling = {window: rolling_mean(values, window) for window in ROLLING_WINDOWS}
+    z_scores, robust = anomaly_scores(values)
+    flagged = (values > 0) & ((z_scores > ANOMALY_Z_SCORE) | (robust > ANOMALY_ROBUST_Z_SCORE))
+
+    dates = np.arange(first_day, last_day + 1).astype('datetime64[D]').astype(str).tolist()
+    totals = np.round(values, 2).tolist()
+    rolling_columns = {f'rolling_{window}': np.round(means, 2).tolist() for window, means in rolling.items()}
+    series = [
+        {
+            'date': dates[offset],
+            'total': totals[offset],
+            **{key: column[offset] for key, column in rolling_columns.items()},
+            'anomaly': bool(flagged[offset])
+        }
+        for offset in range(days)
+    ]
+    anomalies = [
+        {
+            'date': dates[offset],
+            'total': totals[offset],
+            'z_score': round(float(z_scores[offset]), 2),
+            'robust_z_score': round(float(robust[offset]), 2)
+        }
+        for offset in np.flatnonzero(flagged)
+    ]
+
+    mid_point = days // 2
+    return {
+        'trend': trend,
+        'change': round(change_percent, 1),
+        'message': message,
+        'days': days,
+        'first_half_total': round(float(values[:mid_point].sum()), 2),
+        'second_half_total': round(float(values[mid_point:].sum()), 2),
+        'average_daily': round(average, 2),
+        'slope_per_day': round(slope, 2),
+        'series': series,
+        'weekday': weekday_profile(first_day, values),
+        'anomalies': anomalies
+    }
@@ -0,0 +1,351 @@
+"""
+Typeahead categorization answered from in-memory indexes
+
+As the user types an item name the page asks for a category on every
+pause. Those answers must be immediate, so they come only from memory: the
+user's own category memory, the categorization cache's memory tier, a
+prefix index over common merchants and the category keywords, and the
+keyword rules. When Gemini is configured, a refinement job scores the item
+out of band; the page polls for it by token, and later lookups find the
+result in the cache. Each user has at most one queued refinement; a newer
+query cancels the older one if it has not started yet.
+"""
+import bisect
+import heapq
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from app.categorization_cache import categorization_cache
+from app.category_memory import category_memory
+from app.models import db, Expense
+from app.text_normalize import normalize_item
+
+DEFAULT_BUDGET_MS = 5
+DEFAULT_REFRESH_SECONDS = 600
+DEFAULT_MIN_USERS = 3
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_JOBS = 1000
+
+MAX_COMPLETIONS = 5
+PHRASE_LENGTH = 100
+
+# Queries shorter than this are not worth a model call
+MIN_REFINE_LENGTH = 3
+
+
+class PrefixIndex:
+    """
+    Phrases searchable by prefix: a trie flattened into a sorted list
+
+    A prefix's phrases are one contiguous bisect range. Prefixes of up to
+    SHORT_PREFIX characters match too many phrases to rank per keystroke,
+    so their best completions are computed when the index is built.
+    """
+
+    SHORT_PREFIX = 3
+
+    # Longer prefixes rank at most this many phrases from their range
+    MAX_SCAN = 1000
+
+    def __init__(self, entries, max_completions=MAX_COMPLETIONS):
+        """
+        Args:
+            entries: Iterable of (normalized phrase, category, weight); the
+                heaviest entry wins for duplicate phrases
+            max_completions: Completions returned per prefix
+        """
+        best = {}
+        for phrase, category, weight in entries:
+            if phrase and weight > best.get(phrase, (None, float('-inf')))[1]:
+                best[phrase] = (category, weight)
+        self.phrases = sorted(best)
+        self.values = [best[phrase] for phrase in self.phrases]
+        self.max_completions = max_completions
+
+        groups = defaultdict(list)
+        for position, phrase in enumerate(self.phrases):
+            for length in range(1, min(len(phrase), self.SHORT_PREFIX) + 1):
+                groups[phrase[:length]].append(position)
+        self._short = {prefix: self._best(positions) for prefix, positions in groups.items()}
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def _best(self, positions):
+        best = heapq.nlargest(self.max_completions, positions, key=lambda position: self.values[position][1])
+        return [(self.phrases[position],) + self.values[position] for position in best]
+
+    def get(self, phrase):
+        """(category, weight) of an exact phrase, or None"""
+        position = bisect.bisect_left(self.phrases, phrase)
+        if position < len(self.phrases) and self.phrases[position] == phrase:
+            return self.values[position]
+        return None
+
+    def complete(self, prefix):
+        """Heaviest (phrase, category, weight) entries starting with prefix"""
+        if len(prefix) <= self.SHORT_PREFIX:
+            return self._short.get(prefix, [])
+        start = bisect.bisect_left(self.phrases, prefix)
+        end = bisect.bisect_left(self.phrases, prefix + '\uffff', start)
+        return self._best(range(start, min(end, start + self.MAX_SCAN)))
+
+
+def load_merchants(min_users):
+    """
+    (phrase, category, expense count) for items used by at least min_users
+
+    Only items several users share are offered to everyone, so one user's
+    private item names never show up in another user's completions.
+    """
+    rows = db.session.query(
+        Expense.item, Expense.category, Expense.user_id, func.count(Expense.id)
+    ).group_by(Expense.item, Expense.category, Expense.user_id).yield_per(5000)
+
+    users = defaultdict(set)
+    counts = defaultdict(int)
+    for item, category, user_id, count in rows:
+        phrase = normalize_item(item)[:PHRASE_LENGTH]
+        if phrase:
+            users[phrase].add(user_id)
+            counts[phrase, category] += count
+
+    return [
+        (phrase, category, count)
+        for (phrase, category), count in counts.items()
+        if len(users[phrase]) >= min_users
+    ]
+
+
+class Typeahead:
+    """In-memory category answers per keystroke, refined in the background"""
+
+    def __init__(self):
+        self.budget_ms = DEFAULT_BUDGET_MS
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        self.min_users = DEFAULT_MIN_USERS
+        self.workers = DEFAULT_WORKERS
+        self.max_jobs = DEFAULT_MAX_JOBS
+        self.index = None
+        self.index_built_at = None
+        self._building = False
+        self._executor = None
+        # Reentrant: cancelling a future under the lock runs its done callback
+        self._lock = threading.RLock()
+        self._jobs = OrderedDict()
+        # user_id -> token of their latest refinement still running
+        self._pending = {}
+        self._warming = set()
+
+    def init_app(self, app):
+        """Read TYPEAHEAD_* app settings"""
+        self.budget_ms = app.config.setdefault('TYPEAHEAD_BUDGET_MS', DEFAULT_BUDGET_MS)
+        self.refresh_seconds = app.config.setdefault('TYPEAHEAD_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+        self.min_users = app.config.setdefault('TYPEAHEAD_MIN_USERS', DEFAULT_MIN_USERS)
+        self.workers = app.config.setdefault('TYPEAHEAD_WORKERS', DEFAULT_WORKERS)
+        self.max_jobs = app.config.setdefault('TYPEAHEAD_MAX_JOBS', DEFAULT_MAX_JOBS)
+
+    def _submit(self, app, function, *args):
+        """Run function(*args) in an app context on the background pool"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='typeahead')
+            executor = self._executor
+
+        def run():
+            with app.app_context():
+                return function(*args)
+        return executor.submit(run)
+
+    def rebuild_index(self, categorizer):
+        """Build the prefix index from common merchants and the category keywords"""
+        entries = load_merchants(self.min_users)
+        entries.extend(
+            (keyword, category, 1)
+            for category, keywords in categorizer.categories.items()
+            for keyword in keywords
+        )
+        index = PrefixIndex(entries)
+        with self._lock:
+            self.index = index
+            self.index_built_at = time.monotonic()
+            self._building = False
+        return index
+
+    def _refresh_index(self, app, categorizer):
+        """Start a background rebuild if the index is missing or stale"""
+        with self._lock:
+            fresh = self.index_built_at is not None and time.monotonic() - self.index_built_at < self.refresh_seconds
+            if fresh or self._building:
+                return
+            self._building = True
+        future = self._submit(app, self.rebuild_index, categorizer)
+
+        def done(finished):
+            if finished.exception() is not None:
+                print(f"Typeahead index build failed: {finished.exception()}")
+                with self._lock:
+                    self._building = False
+        future.add_done_callback(done)
+
+    def _warm_memory(self, app, user_id):
+        """Load a user's category memory in the background, once at a time"""
+        with self._lock:
+            if user_id in self._warming:
+                return
+            self._warming.add(user_id)
+        future = self._submit(app, category_memory.warm, user_id)
+        future.add_done_callback(lambda _future: self._warmed(user_id))
+
+    def _warmed(self, user_id):
+        """Allow another warm-up for a user once theirs completes"""
+        with self._lock:
+            self._warming.discard(user_id)
+
+    def suggest(self, app, user_id, query, rules, refiner=None):
+        """
+        Best category for a partial item name, from memory only
+
+        Args:
+            app: Flask app, for background work
+            user_id: Current user
+            query: Item name typed so far
+            rules: Rules-only AICategorizer (may hold the local classifier)
+            refiner: AICategorizer with a model, or None to skip refinement
+
+        Returns:
+            Dict with 'result' (categorize_expense shape, or None),
+            'completions' ([{item, category}]), 'refinement' (poll token
+            or None) and 'elapsed_ms'
+        """
+        began = time.perf_counter()
+        key = normalize_item(query)[:PHRASE_LENGTH]
+        self._refresh_index(app, rules)
+        index = self.index
+        if not category_memory.loaded(user_id):
+            self._warm_memory(app, user_id)
+
+        result = category_memory.lookup(user_id, key, load=False)
+        final = result is not None
+        if result is None:
+            cached = categorization_cache.peek('scores', key)
+            if cached is not None:
+                result = rules.top_category(cached)
+                final = True
+        if result is None and index is not None:
+            merchant = index.get(key)
+            if merchant is not None and merchant[1] > 1:
+                result = {
+                    'category': merchant[0],
+                    'confidence': 0.75,
+                    'reasoning': 'Common merchant',
+                    'method': 'merchant'
+                }
+        if result is None and key:
+            result = rules.categorize_with_rules([key])[0]
+
+        completions = []
+        if key and (time.perf_counter() - began) * 1000 < self.budget_ms:
+            seen = set()
+            own = category_memory.complete(user_id, key, MAX_COMPLETIONS)
+            shared = [(phrase, category) for phrase, category, _ in index.complete(key)] if index else []
+            for phrase, category in own + shared:
+                if phrase != key and phrase not in seen:
+                    seen.add(phrase)
+                    completions.append({'item': phrase, 'category': category})
+            completions = completions[:MAX_COMPLETIONS]
+
+            # Only a partial word so far: guess from the best completion
+            if result and result['method'] == 'fallback' and completions:
+                result = {
+                    'category': completions[0]['category'],
+                    'confidence': 0.5,
+                    'reasoning': f'Completes "{completions[0]["item"]}"',
+                    'method': 'prefix'
+                }
+
+        refinement = None
+        if not final and refiner is not None and len(key) >= MIN_REFINE_LENGTH:
+            refinement = self.refine(app, user_id, key, refiner)
+
+        return {
+            'result': result,
+            'completions': completions,
+            'refinement': refinement,
+            'elapsed_ms': round((time.perf_counter() - began) * 1000, 3)
+        }
+
+    def refine(self, app, user_id, key, refiner):
+        """
+        Queue a model categorization of key for user_id
+
+        The user's previous refinement is cancelled if it has not started.
+
+        Returns:
+            Token to poll with status()
+        """
+        token = uuid.uuid4().hex
+        with self._lock:
+            previous = self._jobs.get(self._pending.get(user_id))
+            if previous and previous['key'] == key:
+                return self._pending[user_id]
+            if previous:
+                previous['future'].cancel()
+            # Submitted under the lock so no caller sees the job without its future
+            job = {'user_id': user_id, 'key': key, 'future': self._submit(app, refiner.categorize_expense, key)}
+            self._jobs[token] = job
+            self._pending[user_id] = token
+            job['future'].add_done_callback(lambda _future: self._finished(user_id, token))
+            while len(self._jobs) > self.max_jobs:
+                _evicted_token, evicted = self._jobs.popitem(last=False)
+                self._finished(evicted['user_id'], _evicted_token)
+        return token
+
+    def _finished(self, user_id, token):
+        """Forget a user's pending refinement once it completes or is dropped"""
+        with self._lock:
+            if self._pending.get(user_id) == token:
+                del self._pending[user_id]
+
+    def status(self, user_id, token):
+        """
+        State of a refinement job
+
+        Returns:
+            {'status': 'pending'|'done'|'cancelled'|'failed', 'item', 'result'},
+            or None for unknown tokens and other users' jobs
+        """
+        with self._lock:
+            job = self._jobs.get(token)
+        if job is None or job['user_id'] != user_id:
+            return None
+
+        future = job['future']
+        state = {'item': job['key']}
+        if future is not None and future.cancelled():
+            state['status'] = 'cancelled'
+        elif future is None or not future.done():
+            state['status'] = 'pending'
+        elif future.exception() is not None:
+            state['status'] = 'failed'
+        else:
+            state.update(status='done', result=future.result())
+        return state
+
+    def cancel(self, user_id, token):
+        """Cancel a queued refinement; returns False for unknown tokens"""
+        with self._lock:
+            job = self._jobs.get(token)
+            if job is None or job['user_id'] != user_id:
+                return False
+            if job['future'] is not None:
+                job['future'].cancel()
+            return True
+
+
+typeahead = Typeahead()
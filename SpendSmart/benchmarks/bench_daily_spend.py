@@ -0,0 +1,104 @@
+"""
+Benchmark: chart trend windows from SQL per request vs the daily spending store
+
+Fills an in-memory database with one user's expenses spread over three
+years and builds the daily_spending rows, then times the trend series of
+the visualization chart for each period: the old path (per-day SUM over
+the expenses in the window, then filling missing days in Python) against
+DailySpendStore, both on a cold load of the user's series and once cached.
+The two paths' series are checked to agree.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_daily_spend [--rows 100000] [--repeat 50]
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import func
+
+from app.daily_spend import DailySpendStore
+from app.date_ranges import date_range_criteria
+from app.models import db, User, Expense
+from app.rollups import rebuild_rollups
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Shopping', 'Entertainment',
+              'Bills & Utilities', 'Healthcare', 'Education', 'Others']
+
+
+def populate(user_id, rows):
+    rng = random.Random(24)
+    start = date.today() - timedelta(days=3 * 365)
+    db.session.execute(Expense.__table__.insert(), [
+        {
+            'user_id': user_id,
+            'item': f'item {n}',
+            'category': rng.choice(CATEGORIES),
+            'amount': round(rng.uniform(10, 2000), 2),
+            'date': start + timedelta(days=rng.randint(0, 3 * 365))
+        }
+        for n in range(rows)
+    ])
+    db.session.commit()
+    rebuild_rollups(user_id)
+
+
+def sql_series(user_id, start, end):
+    """The visualization route's previous trend series"""
+    totals = dict(db.session.query(Expense.date, func.sum(Expense.amount)).filter(
+        Expense.user_id == user_id, *date_range_criteria(Expense.date, start, end + timedelta(days=1))
+    ).group_by(Expense.date).all())
+    return [totals.get(start + timedelta(days=offset), 0) for offset in range((end - start).days + 1)]
+
+
+def timed(function, repeat):
+    began = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - began) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        populate(user.id, args.rows)
+
+        store = DailySpendStore()
+        today = date.today()
+        windows = {
+            'week': today - timedelta(days=6),
+            'month': today - timedelta(days=29),
+            'year': today.replace(month=1, day=1)
+        }
+        print(f'{args.rows} expenses over 3 years, {len(store.series(user.id))} spending days')
+        print(f'{"period":<7}{"days":>6}{"sql ms":>10}{"cold ms":>10}{"cached ms":>11}')
+        for period, start in windows.items():
+            expected, sql_ms = timed(lambda: sql_series(user.id, start, today), args.repeat)
+
+            def cold():
+                store.clear()
+                return store.series(user.id).filled(start, today)
+
+            _, cold_ms = timed(cold, args.repeat)
+            series, cached_ms = timed(lambda: store.series(user.id).filled(start, today), args.repeat)
+
+            assert all(abs(a - b) < 0.01 for a, b in zip(series, expected)) and len(series) == len(expected)
+            print(f'{period:<7}{len(series):>6}{sql_ms:>10.2f}{cold_ms:>10.2f}{cached_ms:>11.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: monthly expense filter with extract() vs half-open date range
+
+Builds a throwaway SQLite database with the expenses table, then prints the
+query plan and timing for the old extract()-based month filter (single
+column indexes only) and the half-open range filter on the composite
+(user_id, date) index.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_date_index [--users 50] [--rows 200000]
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, extract, func, select, text
+from sqlalchemy.dialects import sqlite
+
+from app.date_ranges import date_range_criteria
+from app.models import db, User, Expense
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Shopping', 'Entertainment',
+              'Bills & Utilities', 'Healthcare', 'Education', 'Others']
+
+
+def populate(engine, users, rows):
+    """Create tables and insert random expenses spread over three years"""
+    db.metadata.create_all(engine, tables=[User.__table__, Expense.__table__])
+    start = date.today() - timedelta(days=3 * 365)
+    rng = random.Random(42)
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(Expense.__table__.insert(), [
+            {
+                'user_id': rng.randint(1, users),
+                'item': f'item {n}',
+                'category': rng.choice(CATEGORIES),
+                'amount': round(rng.uniform(10, 2000), 2),
+                'date': start + timedelta(days=rng.randint(0, 3 * 365))
+            }
+            for n in range(rows)
+        ])
+
+
+def explain(conn, stmt):
+    """Return SQLite's query plan lines for a statement"""
+    compiled = stmt.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+
+def timed(conn, stmt, repeat):
+    """Average wall time of a statement in milliseconds"""
+    began = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(stmt).all()
+    return (time.perf_counter() - began) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    populate(engine, args.users, args.rows)
+    today = date.today()
+    start = today.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    total = func.sum(Expense.amount)
+
+    old_stmt = select(total).where(
+        Expense.user_id == 1,
+        extract('year', Expense.date) == today.year,
+        extract('month', Expense.date) == today.month
+    )
+    new_stmt = select(total).where(
+        Expense.user_id == 1,
+        *date_range_criteria(Expense.date, start, end)
+    )
+
+    with engine.connect() as conn:
+        # Old schema: only the single-column indexes exist
+        conn.execute(text('DROP INDEX ix_expenses_user_date'))
+        print('extract() filter, single-column indexes:')
+        for line in explain(conn, old_stmt):
+            print(f'    {line}')
+        print(f'    {timed(conn, old_stmt, args.repeat):.3f} ms/query')
+
+        conn.execute(text('CREATE INDEX ix_expenses_user_date ON expenses (user_id, date)'))
+        print('half-open range filter, (user_id, date) index:')
+        for line in explain(conn, new_stmt):
+            print(f'    {line}')
+        print(f'    {timed(conn, new_stmt, args.repeat):.3f} ms/query')
+
+
+if __name__ == '__main__':
+    main()
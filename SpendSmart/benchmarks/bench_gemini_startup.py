@@ -0,0 +1,81 @@
+"""
+Benchmark: app startup time and per-request Gemini model setup
+
+Startup: imports the app and builds it in fresh interpreters, once as is
+(the SDK is imported on first use) and once with google.generativeai
+imported up front, as the categorizer and insights modules used to.
+
+Per request: times the receipt scanner's old setup (import, configure,
+construct a GenerativeModel, plus the gRPC client that configure discards
+and the first generate_content rebuilds) against a registry lookup, whose
+model keeps its client. No network calls are made; a dummy key is used,
+so the TLS handshake a fresh channel also costs is not included.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_gemini_startup [--runs 5] [--requests 2000]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from app import gemini_models
+
+STARTUP = 'import time; began = time.perf_counter(); {prelude}from app import create_app; create_app(); ' \
+          'print(time.perf_counter() - began)'
+
+
+def startup_seconds(prelude, runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP.format(prelude=prelude)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def per_request_setup(requests):
+    def old_setup():
+        import google.generativeai as genai
+        from google.generativeai import client
+        genai.configure(api_key='benchmark-key')
+        model = genai.GenerativeModel(gemini_models.RECEIPT_MODEL)
+        model._client = client.get_default_generative_client()
+        return model
+
+    def registry_lookup():
+        return gemini_models.get_model(gemini_models.RECEIPT_MODEL, 'benchmark-key')
+
+    results = {}
+    for label, setup in (('configure + new model and client', old_setup), ('registry lookup', registry_lookup)):
+        setup()
+        began = time.perf_counter()
+        for _ in range(requests):
+            setup()
+        results[label] = (time.perf_counter() - began) / requests
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    if not gemini_models.GEMINI_AVAILABLE:
+        sys.exit('google-generativeai is not installed')
+
+    eager = startup_seconds('import google.generativeai; ', args.runs)
+    lazy = startup_seconds('', args.runs)
+    print(f'startup (median of {args.runs}): eager SDK import {eager * 1000:.0f} ms, '
+          f'lazy {lazy * 1000:.0f} ms, saved {(eager - lazy) * 1000:.0f} ms per worker')
+
+    for label, seconds in per_request_setup(args.requests).items():
+        print(f'per-request model setup, {label}: {seconds * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
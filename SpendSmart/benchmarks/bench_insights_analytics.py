@@ -0,0 +1,105 @@
+"""
+Benchmark: insights analytics over expense dicts vs NumPy columns
+
+For each size, generates expenses spread over two years and times the
+analytics behind /api/insights for the 'month' and 'all' periods and the
+daily series behind /api/insights/trends: the previous dict path (a
+strptime period filter and per-row totals) against SpendingColumns, both
+converted from the same dicts and already in columns (as loaded by
+SpendingColumns.for_user). The two paths' results are checked to agree.
+The trends row times the old per-date dict aggregation against the full
+trend report (rolling means, slope, weekday profile and anomalies) over a
+filled series of the last 365 days.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_insights_analytics [--sizes 10000 100000 1000000]
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from app.spending_columns import SpendingColumns, day_number
+from app.trends import trend_report
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Shopping', 'Entertainment',
+              'Bills & Utilities', 'Healthcare', 'Education', 'Others']
+
+
+def make_expenses(rng, count, span_days=730):
+    today = date.today()
+    return [
+        {
+            'id': index,
+            'item': 'item',
+            'category': rng.choice(CATEGORIES),
+            'amount': round(rng.uniform(10, 3000), 2),
+            'date': (today - timedelta(days=rng.randrange(span_days))).strftime('%Y-%m-%d')
+        }
+        for index in range(count)
+    ]
+
+
+def dict_analytics(expenses, period):
+    """The insights analytics' previous per-row path (the fields checked below)"""
+    if period in ('week', 'month'):
+        start = datetime.now() - timedelta(days=7 if period == 'week' else 30)
+        expenses = [e for e in expenses if datetime.strptime(e['date'], '%Y-%m-%d') >= start]
+    category_counts = defaultdict(int)
+    daily_spending = defaultdict(float)
+    for expense in expenses:
+        category_counts[expense['category']] += 1
+        daily_spending[expense['date']] += expense['amount']
+    return {
+        'total_amount': round(sum(expense['amount'] for expense in expenses), 2),
+        'total_expenses': len(expenses),
+        'category_counts': dict(category_counts),
+        'daily_spending': dict(daily_spending)
+    }
+
+
+def timed(function):
+    began = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - began) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    rng = random.Random(22)
+    print(f'{"rows":>9} {"period":<7}{"dicts ms":>10}{"columns ms":>12}{"prebuilt ms":>13}')
+    for size in args.sizes:
+        expenses = make_expenses(rng, size)
+        columns, build_ms = timed(lambda: SpendingColumns.from_records(expenses))
+
+        for period in ('month', 'all'):
+            expected, dict_ms = timed(lambda: dict_analytics(expenses, period))
+            converted, column_ms = timed(lambda: SpendingColumns.from_records(expenses).for_period(period).analytics(period))
+            _, prebuilt_ms = timed(lambda: columns.for_period(period).analytics(period))
+
+            assert converted['total_expenses'] == expected['total_expenses']
+            assert abs(converted['total_amount'] - expected['total_amount']) < 0.01
+            assert converted['category_counts'] == expected['category_counts']
+            assert sorted(converted['daily_spending']) == sorted(expected['daily_spending'])
+            print(f'{size:>9} {period:<7}{dict_ms:>10.1f}{column_ms:>12.1f}{prebuilt_ms:>13.2f}')
+
+        daily = {}
+        _, trend_dict_ms = timed(lambda: [daily.__setitem__(e['date'], daily.get(e['date'], 0) + e['amount'])
+                                          for e in expenses] and sorted(daily))
+        first_day = day_number(date.today()) - 364
+        recent = columns.since(first_day)
+        filled = np.bincount(recent.days - first_day, weights=recent.amounts, minlength=365)
+        trend_report(filled, first_day)  # np.median imports numpy.ma on first use
+        _, trend_column_ms = timed(lambda: trend_report(filled, first_day))
+        print(f'{size:>9} {"trends":<7}{trend_dict_ms:>10.1f}{"":>12}{trend_column_ms:>13.2f}'
+              f'   (columns built from dicts in {build_ms:.1f} ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: local expense classifier accuracy, latency and load time
+
+Generates labeled expense names the way users write them (merchants,
+dishes and bills mixed with noise words, typos and reference numbers),
+trains the hashed n-gram naive Bayes model on most of them and scores the
+rest. Reports accuracy overall and above each confidence cutoff (the
+share above the cutoff is what no longer reaches the LLM), plus training
+time, single-item and batch latency, file size and load time.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_local_classifier [--items 200000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.ai_categorizer import AICategorizer
+from app.local_classifier import LocalClassifier
+
+EXTRA_VOCABULARY = {
+    'Food & Dining': ['swiggy order', 'zomato', 'dominos pizza', 'haldiram', 'chai point', 'bigbasket',
+                      'blinkit', 'dmart grocery', 'masala dosa', 'veg thali', 'cold coffee', 'momos'],
+    'Transportation': ['ola ride', 'uber trip', 'rapido', 'irctc ticket', 'indian oil', 'hp petrol',
+                       'fastag recharge', 'namma metro', 'indigo', 'redbus'],
+    'Shopping': ['amazon in', 'flipkart', 'myntra', 'ajio', 'decathlon', 'croma', 'reliance trends',
+                 'nykaa', 'ikea', 'lenskart'],
+    'Entertainment': ['netflix', 'bookmyshow', 'pvr cinemas', 'spotify', 'hotstar', 'steam games',
+                      'inox', 'playstation'],
+    'Bills & Utilities': ['airtel postpaid', 'jio recharge', 'bescom', 'act fibernet', 'tata power',
+                          'house rent', 'lic premium', 'gas cylinder'],
+    'Healthcare': ['apollo pharmacy', 'medplus', 'practo', 'pharmeasy', '1mg', 'dr lal pathlabs',
+                   'dental clinic', 'eye checkup'],
+    'Education': ['udemy', 'coursera', 'byjus', 'unacademy', 'exam fee', 'school fees', 'notebooks',
+                  'kindle book'],
+    'Others': ['atm withdrawal', 'gift', 'donation', 'laundry', 'salon', 'misc charges']
+}
+NOISE = ['upi', 'payment', 'pos', 'txn', 'ref', 'online', 'order', 'bill', 'pvt ltd', 'india', 'com']
+
+
+def make_name(rng, phrase):
+    """Decorate a phrase with casing, noise words, digits and occasional typos"""
+    words = phrase.split()
+    if rng.random() < 0.15 and len(words[0]) > 4:
+        cut = rng.randrange(1, len(words[0]) - 1)
+        words[0] = words[0][:cut] + words[0][cut + 1:]
+    if rng.random() < 0.5:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(NOISE))
+    if rng.random() < 0.4:
+        words.append(f'#{rng.randrange(100000)}')
+    name = ' '.join(words)
+    return name.upper() if rng.random() < 0.3 else name.title()
+
+
+def build_corpus(categories, size, seed=3):
+    rng = random.Random(seed)
+    phrases = [(category, phrase)
+               for category, keywords in categories.items()
+               for phrase in keywords + EXTRA_VOCABULARY.get(category, [])]
+    corpus = []
+    for _ in range(size):
+        category, phrase = rng.choice(phrases)
+        corpus.append((make_name(rng, phrase), category))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=200000)
+    parser.add_argument('--test-share', type=float, default=0.1)
+    args = parser.parse_args()
+
+    classes = list(AICategorizer(None).categories)
+    corpus = build_corpus(AICategorizer(None).categories, args.items)
+    split = int(len(corpus) * (1 - args.test_share))
+    train, test = corpus[:split], corpus[split:]
+
+    began = time.perf_counter()
+    model = LocalClassifier.train(train, classes)
+    print(f'trained on {model.trained_on} items in {time.perf_counter() - began:.2f}s')
+
+    names = [name for name, _ in test]
+    began = time.perf_counter()
+    predictions = model.predict(names)
+    batch_seconds = time.perf_counter() - began
+
+    sample = names[:2000]
+    began = time.perf_counter()
+    for name in sample:
+        model.predict([name])
+    single_seconds = (time.perf_counter() - began) / len(sample)
+
+    correct = [predicted == label for (predicted, _), (_, label) in zip(predictions, test)]
+    print(f'holdout accuracy: {sum(correct) / len(correct):.1%} on {len(test)} items')
+    for cutoff in (0.5, 0.7, 0.8, 0.9, 0.95):
+        kept = [ok for ok, (_, confidence) in zip(correct, predictions) if confidence >= cutoff]
+        if kept:
+            print(f'  cutoff {cutoff:.2f}: answers {len(kept) / len(test):.1%} locally, '
+                  f'{sum(kept) / len(kept):.1%} of those correct')
+    print(f'latency: {single_seconds * 1e6:.0f} us/item single, '
+          f'{batch_seconds / len(test) * 1e6:.1f} us/item in one batch of {len(test)}')
+
+    fd, path = tempfile.mkstemp(suffix='.npz')
+    os.close(fd)
+    try:
+        model.save(path)
+        began = time.perf_counter()
+        LocalClassifier.load(path)
+        print(f'model file {os.path.getsize(path) / 1e6:.1f} MB, '
+              f'load {(time.perf_counter() - began) * 1000:.1f} ms')
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
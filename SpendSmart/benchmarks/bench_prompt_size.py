@@ -0,0 +1,81 @@
+"""
+Benchmark: prompt size per Gemini call site against a token budget
+
+Builds the prompt each call site sends (single-item scoring, a full
+categorization batch, spending insights over every category, and the
+receipt scan's text plus one image) and reports characters and estimated
+input tokens, using the same estimate /api/llm/stats falls back to when the
+SDK reports no usage. Exits non-zero when a prompt outgrows its budget, so
+a template change that bloats a prompt fails here before it shows up on
+the bill.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_prompt_size [--batch 25]
+"""
+import argparse
+import random
+import sys
+
+from app.ai_categorizer import AICategorizer
+from app.ai_insights import AIInsightsGenerator
+from app.llm_client import estimate_tokens, IMAGE_TOKENS
+from app.routes import RECEIPT_PROMPT
+from benchmarks.bench_local_classifier import NOISE
+
+# Estimated input tokens allowed per call site
+TOKEN_BUDGETS = {
+    'categorize': 250,
+    'categorize_batch': 800,
+    'insights': 200,
+    'receipt': 500
+}
+
+
+def sample_items(rng, categories, count):
+    """(item name, amount) pairs built from the category keywords"""
+    keywords = [keyword for words in categories.values() for keyword in words]
+    return [(f'{rng.choice(keywords)} {rng.choice(NOISE)}', round(rng.uniform(20, 5000), 2)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--batch', type=int, default=AICategorizer.BATCH_SIZE, help='Items per batch prompt')
+    args = parser.parse_args()
+
+    rng = random.Random(20)
+    categorizer = AICategorizer(None)
+    items = sample_items(rng, categorizer.categories, args.batch)
+
+    shares = [rng.random() for _ in categorizer.categories]
+    percentages = {category: share / sum(shares) * 100 for category, share in zip(categorizer.categories, shares)}
+    analytics = {
+        'total_amount': 48213.5,
+        'avg_daily_spending': 1607.12,
+        'category_percentages': percentages,
+        'top_categories': sorted(percentages.items(), key=lambda entry: -entry[1])[:3]
+    }
+
+    prompts = {
+        'categorize': categorizer._create_categorization_prompt(*items[0]),
+        'categorize_batch': categorizer._create_batch_prompt(items),
+        'insights': AIInsightsGenerator()._create_insights_prompt(analytics, 'month'),
+        'receipt': [RECEIPT_PROMPT, object()]
+    }
+
+    over = []
+    print(f'{"call site":<18}{"chars":>8}{"tokens":>8}{"budget":>8}')
+    for call_site, contents in prompts.items():
+        text = contents if isinstance(contents, str) else contents[0]
+        tokens = estimate_tokens(contents)
+        budget = TOKEN_BUDGETS[call_site]
+        print(f'{call_site:<18}{len(text):>8}{tokens:>8}{budget:>8}')
+        if tokens > budget:
+            over.append(call_site)
+    print(f'(receipt includes {IMAGE_TOKENS} tokens for the image; batch of {args.batch} items)')
+
+    if over:
+        sys.exit(f'over budget: {", ".join(over)}')
+
+
+if __name__ == '__main__':
+    main()
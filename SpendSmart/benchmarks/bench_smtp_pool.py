@@ -0,0 +1,100 @@
+"""
+Benchmark: per-message SMTP connections vs the pooled session
+
+Starts a minimal SMTP sink on localhost whose greeting is delayed to stand
+in for the TCP+TLS+AUTH handshake of a real provider, then sends the same
+alerts with Flask-Mail's mail.send() (one connection each) and with
+smtp_pool.send_batch() (one session for the whole batch).
+
+Any SMTP server can be used instead, e.g. `python -m aiosmtpd -n -l
+localhost:8025` with --port 8025 --external.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_smtp_pool [--messages 200] [--handshake-ms 150]
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+from flask import Flask
+from flask_mail import Message
+
+from app.email_service import mail, smtp_pool
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Accepts and discards mail, speaking just enough SMTP"""
+
+    handshake_seconds = 0.0
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        time.sleep(self.handshake_seconds)
+        self.reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-sink')
+                self.reply('250 8BITMIME')
+            elif command == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.reply('250 OK')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--handshake-ms', type=float, default=150)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--external', action='store_true', help='Use a server already listening on --port')
+    args = parser.parse_args()
+
+    port = args.port
+    if not args.external:
+        SinkHandler.handshake_seconds = args.handshake_ms / 1000
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', args.port), SinkHandler)
+        server.daemon_threads = True
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False,
+                      MAIL_DEFAULT_SENDER='alerts@example.com')
+    mail.init_app(app)
+
+    with app.app_context():
+        messages = [Message(subject=f'Budget alert {n}', recipients=[f'user{n}@example.com'],
+                            body='You have exceeded your budget.')
+                    for n in range(args.messages)]
+
+        began = time.perf_counter()
+        for message in messages:
+            mail.send(message)
+        single = time.perf_counter() - began
+
+        began = time.perf_counter()
+        errors = [error for error in smtp_pool.send_batch(messages) if error is not None]
+        pooled = time.perf_counter() - began
+        smtp_pool.close_all()
+
+    print(f'{args.messages} messages, simulated handshake {args.handshake_ms:.0f} ms')
+    print(f'mail.send per message: {single:.2f}s ({args.messages / single:,.0f} msg/s)')
+    print(f'pooled send_batch:     {pooled:.2f}s ({args.messages / pooled:,.0f} msg/s), '
+          f'{smtp_pool.opened} session(s), {len(errors)} errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: streaming CSV statement import
+
+Writes a synthetic bank statement to a temporary file, imports it into an
+in-memory database through StatementImporter, then imports it again to
+measure the all-duplicates path. Reports rows/second and peak process RSS.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_statement_import [--rows 100000]
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+
+from app.ai_categorizer import AICategorizer
+from app.models import db, User
+from app.statement_import import open_csv_records, StatementImporter
+
+MERCHANTS = ['SWIGGY', 'Uber Trip', 'Amazon Pay', 'Airtel Recharge', 'Apollo Pharmacy',
+             'Netflix', 'BigBasket Grocery', 'Indian Oil Fuel', 'Udemy Course', 'POS 4411 MISC']
+
+MAPPING = {'date': 'Txn Date', 'item': 'Description', 'amount': 'Debit',
+           'date_format': '%d/%m/%Y', 'amount_sign': 'negative'}
+
+
+def write_statement(path, rows):
+    """Write a bank-style CSV with negative debits"""
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=730)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Txn Date', 'Description', 'Debit'])
+        for n in range(rows):
+            day = start + timedelta(days=n * 730 // rows)
+            writer.writerow([day.strftime('%d/%m/%Y'), f'{rng.choice(MERCHANTS)} #{n}',
+                             f'-{rng.uniform(10, 5000):,.2f}'])
+
+
+def run_import(path, user_id, categorizer):
+    """Import the file once; returns (final progress, seconds)"""
+    began = time.perf_counter()
+    with open(path, 'rb') as f:
+        importer = StatementImporter(user_id, categorizer)
+        for progress in importer.run(open_csv_records(f, MAPPING)):
+            pass
+    return progress, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        write_statement(path, args.rows)
+        print(f'statement: {args.rows} rows, {os.path.getsize(path) / 1e6:.1f} MB')
+
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            categorizer = AICategorizer(None)
+
+            for label in ('first import', 're-import (all duplicates)'):
+                progress, elapsed = run_import(path, user.id, categorizer)
+                peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                print(f'{label}: inserted={progress["inserted"]} duplicates={progress["duplicates"]} '
+                      f'{elapsed:.2f}s ({progress["processed"] / elapsed:,.0f} rows/s), '
+                      f'peak RSS {peak_rss:.0f} MB')
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
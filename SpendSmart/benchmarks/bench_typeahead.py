@@ -0,0 +1,106 @@
+"""
+Benchmark: typeahead categorization latency against its 5 ms budget
+
+Builds the prefix index from a synthetic set of shared merchants, loads a
+user's category memory with their own items, then replays typing: every
+prefix of sampled item names is sent through Typeahead.suggest, as the page
+does after each debounced pause. Reports p50/p99/max latency, the share of
+keystrokes over budget, index build time and, for comparison, the full
+rules categorize_expense path per keystroke.
+
+Run from the SpendSmart directory:
+    python -m benchmarks.bench_typeahead [--merchants 20000] [--items 500]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date
+
+from flask import Flask
+
+from app.ai_categorizer import AICategorizer
+from app.category_memory import category_memory
+from app.models import db, User, Expense
+from app.typeahead import PrefixIndex, Typeahead, DEFAULT_BUDGET_MS
+from benchmarks.bench_local_classifier import EXTRA_VOCABULARY, NOISE
+
+
+def merchant_names(rng, categories, count):
+    """Distinct merchant-like names with a category and a popularity weight"""
+    phrases = [(category, phrase)
+               for category, keywords in categories.items()
+               for phrase in keywords + EXTRA_VOCABULARY.get(category, [])]
+    names = {}
+    while len(names) < count:
+        category, phrase = rng.choice(phrases)
+        name = f'{phrase} {rng.choice(NOISE)} {rng.randrange(1000)}'
+        names[name] = (category, int(rng.paretovariate(1.2)))
+    return [(name, category, weight) for name, (category, weight) in names.items()]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--merchants', type=int, default=20000)
+    parser.add_argument('--items', type=int, default=500, help='Items in the user\'s own history')
+    parser.add_argument('--typed', type=int, default=500, help='Item names typed out')
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    rules = AICategorizer(None)
+    merchants = merchant_names(rng, rules.categories, args.merchants)
+
+    began = time.perf_counter()
+    index = PrefixIndex(merchants + [(keyword, category, 1)
+                                     for category, keywords in rules.categories.items()
+                                     for keyword in keywords])
+    print(f'prefix index: {len(index)} phrases built in {(time.perf_counter() - began) * 1000:.0f} ms')
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    typeahead = Typeahead()
+    typeahead.index = index
+    typeahead.index_built_at = time.monotonic()
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        own = rng.sample(merchants, args.items)
+        db.session.add_all([
+            Expense(user_id=user.id, item=name, category=category, amount=100, date=date.today())
+            for name, category, _ in own
+        ])
+        db.session.commit()
+        category_memory.warm(user.id)
+
+        typed = [name for name, _, _ in rng.sample(merchants, args.typed // 2) + rng.sample(own, args.typed // 2)]
+        keystrokes = [name[:length] for name in typed for length in range(2, len(name) + 1)]
+
+        latencies = []
+        for query in keystrokes:
+            began = time.perf_counter()
+            typeahead.suggest(app, user.id, query, rules)
+            latencies.append((time.perf_counter() - began) * 1000)
+
+        began = time.perf_counter()
+        for query in keystrokes:
+            rules.categorize_expense(query)
+        full_ms = (time.perf_counter() - began) * 1000 / len(keystrokes)
+
+    over = sum(1 for latency in latencies if latency > DEFAULT_BUDGET_MS)
+    print(f'typeahead over {len(keystrokes)} keystrokes: p50 {statistics.median(latencies):.3f} ms, '
+          f'p99 {percentile(latencies, 0.99):.3f} ms, max {max(latencies):.2f} ms, '
+          f'{over / len(latencies):.2%} over the {DEFAULT_BUDGET_MS} ms budget')
+    print(f'rules-only categorize_expense per keystroke: {full_ms:.3f} ms (no completions)')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,9 @@ import pytest
 import os
 import tempfile
 from app import create_app
-from app.models import db, User, Expense, Budget
+from app.models import db, User, Expense, Budget, SpendingRollup, DailySpending, EmailOutbox, StoredInsights
+from app.rollups import rebuild_rollups
+from app.daily_spend import daily_spend_store
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 
@@ -48,6 +50,10 @@ def init_database(app):
     with app.app_context():
         # Clear existing data first
         db.session.query(Expense).delete()
+        db.session.query(SpendingRollup).delete()
+        db.session.query(DailySpending).delete()
+        db.session.query(StoredInsights).delete()
+        db.session.query(EmailOutbox).delete()
         db.session.query(Budget).delete()
         db.session.query(User).delete()
         db.session.commit()
@@ -105,6 +111,11 @@ def init_database(app):
         db.session.add(budget1)
         db.session.commit()
         
+        # Fixture rows bypass the API, so derive their rollups directly
+        # and drop daily series cached for earlier tests' users
+        rebuild_rollups()
+        daily_spend_store.clear()
+        
         yield db
         
         # Cleanup happens automatically with temporary database
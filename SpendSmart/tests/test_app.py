@@ -3,7 +3,8 @@ Comprehensive test suite for SpendSmart application
 Tests all existing features: Auth, Expenses, Budget, Stats, AI Features
 """
 import pytest
-from datetime import datetime
+import smtplib
+from datetime import datetime, timedelta
 import json
 
 # ============================================================================
@@ -100,6 +101,222 @@ class TestExpenses:
             assert response.status_code == 200
 
 
+class TestExpenseListing:
+    """Test keyset pagination, filters and streaming on GET /api/expenses"""
+    
+    def _add_expenses(self, client):
+        for day, amount in [('2025-01-05', 10.0), ('2025-01-05', 20.0), ('2025-02-10', 30.0)]:
+            client.post('/api/expenses', json={
+                'item': 'Bus', 'amount': amount, 'category': 'Transportation', 'date': day
+            })
+    
+    def test_keyset_pages(self, authenticated_client):
+        """Test walking every page returns each expense once, newest first"""
+        self._add_expenses(authenticated_client)
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/expenses?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            page = json.loads(authenticated_client.get(url).data)
+            assert page['count'] <= 2
+            seen.extend(page['data'])
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                break
+        assert len(seen) == 5
+        assert len({expense['id'] for expense in seen}) == 5
+        keys = [(expense['date'], expense['id']) for expense in seen]
+        assert keys == sorted(keys, reverse=True)
+    
+    def test_filters(self, authenticated_client):
+        """Test category, date range and amount filters"""
+        self._add_expenses(authenticated_client)
+        url = '/api/expenses?category=Transportation&start_date=2025-01-01&end_date=2025-01-31&min_amount=15'
+        data = json.loads(authenticated_client.get(url).data)['data']
+        assert [expense['amount'] for expense in data] == [20.0]
+        
+        response = authenticated_client.get('/api/expenses?start_date=01-2025')
+        assert response.status_code == 400
+        response = authenticated_client.get('/api/expenses?cursor=not-a-cursor')
+        assert response.status_code == 400
+    
+    def test_streaming(self, authenticated_client):
+        """Test NDJSON and chunked JSON streaming modes"""
+        self._add_expenses(authenticated_client)
+        response = authenticated_client.get('/api/expenses?stream=ndjson')
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert len(lines) == 5
+        assert json.loads(lines[0])['item']
+        
+        body = json.loads(authenticated_client.get('/api/expenses?stream=json').data)
+        assert body['success'] and body['count'] == 5
+
+
+class TestBulkExpenses:
+    """Test bulk expense ingestion"""
+    
+    def test_bulk_insert(self, app, authenticated_client, mocker):
+        """Test a batch is inserted with one budget check per month"""
+        from app.rollups import verify_rollups
+        alert = mocker.patch('app.routes.check_and_send_budget_alert')
+        payload = {'expenses': [
+            {'item': 'Rent', 'amount': 900, 'category': 'Bills & Utilities', 'date': '2025-01-01'},
+            {'item': 'Chai', 'amount': 20, 'category': 'Food & Dining', 'date': '2025-01-15'},
+            {'item': 'Metro', 'amount': 40, 'category': 'Transportation', 'date': '2025-02-03'}
+        ]}
+        response = authenticated_client.post('/api/expenses/bulk', json=payload)
+        assert response.status_code == 201
+        assert json.loads(response.data)['count'] == 3
+        assert alert.call_count == 2
+        
+        data = json.loads(authenticated_client.get('/api/expenses').data)
+        assert data['count'] == 5
+        with app.app_context():
+            assert verify_rollups() == []
+    
+    def test_bulk_rejects_invalid_batch(self, authenticated_client):
+        """Test one invalid item rejects the whole batch"""
+        payload = [
+            {'item': 'Rent', 'amount': 900, 'category': 'Bills & Utilities', 'date': '2025-01-01'},
+            {'item': 'Bad', 'amount': -5, 'category': 'Food & Dining', 'date': '2025-01-15'}
+        ]
+        response = authenticated_client.post('/api/expenses/bulk', json=payload)
+        assert response.status_code == 400
+        assert json.loads(response.data)['details'][0]['index'] == 1
+        
+        data = json.loads(authenticated_client.get('/api/expenses').data)
+        assert data['count'] == 2
+
+
+class TestStatementImport:
+    """Test CSV/OFX statement import"""
+    
+    CSV = (
+        'Txn Date,Description,Debit\n'
+        '03/01/2025,SWIGGY Order,-250.00\n'
+        '04/01/2025,Salary,50000\n'
+        '05/01/2025,Uber Trip,"-1,120.50"\n'
+        'bad-date,Something,-10\n'
+    )
+    MAPPING = json.dumps({
+        'date': 'Txn Date', 'item': 'Description', 'amount': 'Debit',
+        'date_format': '%d/%m/%Y', 'amount_sign': 'negative'
+    })
+    
+    def _upload(self, client, content, filename, query='', **form):
+        import io
+        form['statement'] = (io.BytesIO(content.encode()), filename)
+        return client.post(f'/api/expenses/import{query}', data=form, content_type='multipart/form-data')
+    
+    def test_csv_import_and_dedupe(self, app, authenticated_client):
+        """Test mapped CSV import, rule categorization and re-import dedupe"""
+        from app.rollups import verify_rollups
+        response = self._upload(authenticated_client, self.CSV, 'bank.csv', mapping=self.MAPPING)
+        assert response.status_code == 201
+        summary = json.loads(response.data)['data']
+        assert summary['inserted'] == 2
+        assert summary['skipped'] == 1
+        assert summary['invalid'] == 1
+        
+        expenses = json.loads(authenticated_client.get('/api/expenses?start_date=2025-01-01&end_date=2025-01-31').data)['data']
+        categories = {expense['item']: expense['category'] for expense in expenses}
+        assert categories == {'SWIGGY Order': 'Food & Dining', 'Uber Trip': 'Transportation'}
+        assert 1120.5 in [expense['amount'] for expense in expenses]
+        
+        again = json.loads(self._upload(authenticated_client, self.CSV, 'bank.csv', mapping=self.MAPPING).data)['data']
+        assert again['inserted'] == 0
+        assert again['duplicates'] == 2
+        with app.app_context():
+            assert verify_rollups() == []
+    
+    def test_ofx_import_with_progress(self, authenticated_client):
+        """Test SGML OFX parsing with streamed progress"""
+        ofx = (
+            'OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+            '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250210120000<TRNAMT>-499.00<NAME>Netflix</STMTTRN>\n'
+            '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250211<TRNAMT>100.00<NAME>Refund</STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>'
+        )
+        response = self._upload(authenticated_client, ofx, 'card.ofx', query='?progress=ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[-1]['done'] is True
+        assert lines[-1]['inserted'] == 1
+        assert lines[-1]['skipped'] == 1
+    
+    def test_missing_column(self, authenticated_client):
+        """Test an unmapped header is rejected up front"""
+        response = self._upload(authenticated_client, 'when,what\n', 'bank.csv')
+        assert response.status_code == 400
+
+    def test_parse_amount(self):
+        """Test currency tokens, signs and thousands separators"""
+        import pytest
+        from app.statement_import import parse_amount
+        assert parse_amount('Rs.500') == 500.0
+        assert parse_amount('Rs. -20') == -20.0
+        assert parse_amount('INR 1,200.00') == 1200.0
+        assert parse_amount('(12.00)') == -12.0
+        assert parse_amount('₹ 1,20,000') == 120000.0
+        for text in ('Rs.', 'n/a', '1,2345'):
+            with pytest.raises(ValueError):
+                parse_amount(text)
+
+    def test_repeated_rows_and_long_items(self, authenticated_client):
+        """Test identical rows in one file are all kept and truncated items dedupe on re-import"""
+        long_item = 'Coffee ' + 'x' * 250
+        content = (
+            'date,item,amount\n'
+            '2025-03-01,Coffee,120\n'
+            '2025-03-01,Coffee,120\n'
+            f'2025-03-02,{long_item},80\n'
+        )
+        first = json.loads(self._upload(authenticated_client, content, 'bank.csv').data)['data']
+        assert (first['inserted'], first['duplicates']) == (3, 0)
+
+        again = json.loads(self._upload(authenticated_client, content, 'bank.csv').data)['data']
+        assert (again['inserted'], again['duplicates']) == (0, 3)
+
+        # A third coffee that day is new
+        extra = json.loads(self._upload(authenticated_client, content + '2025-03-01,Coffee,120\n', 'bank.csv').data)['data']
+        assert (extra['inserted'], extra['duplicates']) == (1, 3)
+
+
+class TestExpenseExport:
+    """Test streaming expense export"""
+    
+    def test_csv_export_with_filters(self, authenticated_client):
+        """Test CSV export honours the list filters"""
+        import csv
+        import io
+        response = authenticated_client.get('/api/expenses/export?format=csv&category=Transportation')
+        assert response.status_code == 200
+        assert 'attachment' in response.headers['Content-Disposition']
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        assert rows[0] == ['id', 'date', 'item', 'category', 'amount']
+        assert [row[2:] for row in rows[1:]] == [['Uber Ride', 'Transportation', '15.50']]
+    
+    def test_ndjson_export(self, authenticated_client):
+        """Test NDJSON export emits one object per expense"""
+        response = authenticated_client.get('/api/expenses/export?format=ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        assert sorted(json.loads(line)['amount'] for line in lines) == [15.5, 50.0]
+    
+    def test_parquet_export(self, authenticated_client):
+        """Test Parquet export round-trips when pyarrow is installed"""
+        pq = pytest.importorskip('pyarrow.parquet')
+        import io
+        response = authenticated_client.get('/api/expenses/export?format=parquet')
+        table = pq.read_table(io.BytesIO(response.data))
+        assert table.num_rows == 2
+        assert sorted(table.column('amount').to_pylist()) == [15.5, 50.0]
+    
+    def test_unknown_format(self, authenticated_client):
+        """Test unsupported formats are rejected"""
+        response = authenticated_client.get('/api/expenses/export?format=xlsx')
+        assert response.status_code == 400
+
+
 # ============================================================================
 # BUDGET TESTS
 # ============================================================================
@@ -127,6 +344,165 @@ class TestBudget:
         assert response.status_code == 200
 
 
+class TestBudgetAlertQueue:
+    """Test queued budget alert emails"""
+    
+    def _expense(self, amount):
+        return {'item': 'Laptop Bag', 'amount': amount, 'category': 'Shopping',
+                'date': datetime.now().strftime('%Y-%m-%d')}
+    
+    def test_alert_queued_once(self, app, authenticated_client, mocker):
+        """Test the request only enqueues and the worker sends exactly once"""
+        from app.models import db, Budget, EmailOutbox
+        from app.email_queue import email_queue
+        from app.email_service import smtp_pool
+        sender = mocker.patch.object(smtp_pool, 'send_batch', side_effect=lambda messages: [None] * len(messages))
+        mocker.patch.object(email_queue, 'wake')
+        
+        authenticated_client.post('/api/expenses', json=self._expense(350))
+        authenticated_client.post('/api/expenses', json=self._expense(10))
+        assert sender.call_count == 0
+        
+        with app.app_context():
+            entries = EmailOutbox.query.all()
+            assert [(e.kind, e.status) for e in entries] == [('warning', 'pending')]
+            assert db.session.get(Budget, entries[0].budget_id).warning_email_sent
+            assert email_queue.process_due() == (1, 1)
+            assert email_queue.process_due() == (0, 0)
+            assert EmailOutbox.query.one().status == 'sent'
+        [message] = sender.call_args.args[0]
+        assert message.recipients == ['test@example.com']
+        assert 'Rs. 415.50' in message.body
+    
+    def test_failed_send_backs_off(self, app, authenticated_client, mocker):
+        """Test failed deliveries are retried later, then marked failed"""
+        import smtplib
+        from app.models import db, EmailOutbox
+        from app.email_queue import email_queue
+        from app.email_service import smtp_pool
+        refused = smtplib.SMTPRecipientsRefused({})
+        mocker.patch.object(smtp_pool, 'send_batch', side_effect=lambda messages: [refused] * len(messages))
+        mocker.patch.object(email_queue, 'wake')
+        mocker.patch.dict(app.config, {'MAIL_QUEUE_MAX_ATTEMPTS': 2})
+        
+        authenticated_client.post('/api/expenses', json=self._expense(600))
+        with app.app_context():
+            assert email_queue.process_due() == (0, 1)
+            entry = EmailOutbox.query.one()
+            assert entry.status == 'pending' and entry.attempts == 1
+            assert entry.next_attempt_at > datetime.utcnow()
+            assert email_queue.process_due() == (0, 0)
+            
+            entry.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            assert email_queue.process_due() == (0, 1)
+            assert EmailOutbox.query.one().status == 'failed'
+
+    def test_claimed_rows_recovered(self, app, authenticated_client, mocker):
+        """Test a raising delivery releases its rows and expired 'sending' leases are reclaimed"""
+        import pytest
+        from app.models import db, EmailOutbox
+        from app.email_queue import email_queue
+        from app.email_service import smtp_pool
+        mocker.patch.object(email_queue, 'wake')
+        mocker.patch.object(smtp_pool, 'send_batch', side_effect=RuntimeError('pool closed'))
+
+        authenticated_client.post('/api/expenses', json=self._expense(600))
+        with app.app_context():
+            with pytest.raises(RuntimeError):
+                email_queue.process_due()
+            assert EmailOutbox.query.one().status == 'pending'
+
+            # A process that crashed after claiming leaves the row in 'sending'
+            assert len(email_queue.claim_due()) == 1
+            assert email_queue.claim_due() == []
+            entry = EmailOutbox.query.one()
+            entry.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+            mocker.patch.object(smtp_pool, 'send_batch', side_effect=lambda messages: [None] * len(messages))
+            assert email_queue.process_due() == (1, 1)
+            assert EmailOutbox.query.one().status == 'sent'
+
+
+
+class FakeSMTPHost:
+    """Stands in for smtplib.SMTP inside a Flask-Mail Connection"""
+    
+    def __init__(self, alive=True):
+        self.sent = []
+        self.alive = alive
+        self.closed = False
+    
+    def sendmail(self, sender, recipients, message, *options):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(recipients)
+    
+    def noop(self):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return (250, b'OK')
+    
+    def quit(self):
+        self.closed = True
+    
+    close = quit
+
+
+class TestSMTPPool:
+    """Test pooled SMTP sessions"""
+    
+    def _pool(self, app, hosts, **settings):
+        from flask_mail import Connection
+        from app.smtp_pool import SMTPConnectionPool
+        
+        def connect():
+            connection = Connection(app.extensions['mail'])
+            connection.host = FakeSMTPHost()
+            connection.num_emails = 0
+            hosts.append(connection.host)
+            return connection
+        return SMTPConnectionPool(connect=connect, **settings)
+    
+    def _messages(self, count):
+        from flask_mail import Message
+        return [Message(subject=f'Alert {n}', sender='alerts@example.com',
+                        recipients=[f'user{n}@example.com'], body='Budget alert')
+                for n in range(count)]
+    
+    def test_batch_reuses_session(self, app):
+        """Test a batch and later sends share one authenticated session"""
+        hosts = []
+        pool = self._pool(app, hosts, size=2)
+        with app.app_context():
+            assert pool.send_batch(self._messages(3)) == [None, None, None]
+            pool.send(self._messages(1)[0])
+        assert len(hosts) == 1 and len(hosts[0].sent) == 4
+        assert (pool.opened, pool.reused) == (1, 1)
+    
+    def test_dead_sessions_replaced(self, app):
+        """Test dropped, idle-expired and NOOP-failing sessions are not reused"""
+        hosts = []
+        pool = self._pool(app, hosts, size=1, idle_timeout=60, keepalive_interval=60)
+        with app.app_context():
+            pool.send_batch(self._messages(1))
+            # Drops mid-batch: the message is retried on a fresh session
+            hosts[0].alive = False
+            assert pool.send_batch(self._messages(2)) == [None, None]
+            assert hosts[0].closed and len(hosts[1].sent) == 2
+            
+            # Fails the NOOP check before reuse
+            pool.keepalive_interval = 0
+            hosts[1].alive = False
+            pool.send(self._messages(1)[0])
+            assert hosts[1].closed and len(hosts[2].sent) == 1
+            
+            pool.idle_timeout = 0
+            assert pool.prune_idle() == 1
+            assert hosts[2].closed
+
+
 # ============================================================================
 # STATISTICS TESTS
 # ============================================================================
@@ -144,6 +520,200 @@ class TestStatistics:
         assert 'total_expenses' in stats or 'total_amount' in stats
 
 
+class TestAggregates:
+    """Test database-side expense aggregation"""
+    
+    def test_stats_breakdown_values(self, authenticated_client):
+        """Test stats totals come from the grouped query"""
+        response = authenticated_client.get('/api/stats')
+        stats = json.loads(response.data)['data']
+        assert stats['total_expenses'] == 2
+        assert stats['total_amount'] == 65.5
+        assert stats['categories']['Food & Dining'] == {'count': 1, 'amount': 50.0}
+        assert stats['categories']['Transportation'] == {'count': 1, 'amount': 15.5}
+    
+    def test_category_breakdown(self, app, init_database):
+        """Test grouped helper for users with and without expenses"""
+        with app.app_context():
+            from app.aggregates import category_breakdown
+            from app.models import User
+            user = User.query.filter_by(username='testuser').first()
+            other = User.query.filter_by(username='testuser2').first()
+            assert category_breakdown(user.id) == [('Food & Dining', 1, 50.0), ('Transportation', 1, 15.5)]
+            assert category_breakdown(other.id) == []
+
+
+class TestRollups:
+    """Test the incrementally maintained monthly rollup table"""
+    
+    def test_rollup_follows_expense_writes(self, app, authenticated_client):
+        """Test add, update and delete keep rollups consistent"""
+        from app.rollups import monthly_total, verify_rollups
+        from app.models import User
+        today = datetime.now().strftime('%Y-%m-%d')
+        month = today[:7]
+        
+        response = authenticated_client.post('/api/expenses', json={
+            'item': 'Movie', 'amount': 100.0, 'category': 'Entertainment', 'date': today
+        })
+        expense_id = json.loads(response.data)['data']['id']
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            assert monthly_total(user.id, month) == 165.5
+            assert verify_rollups() == []
+        
+        authenticated_client.put(f'/api/expenses/{expense_id}', json={
+            'amount': 40.0, 'category': 'Shopping'
+        })
+        with app.app_context():
+            assert monthly_total(user.id, month) == 105.5
+            assert verify_rollups() == []
+        
+        authenticated_client.delete(f'/api/expenses/{expense_id}')
+        with app.app_context():
+            assert monthly_total(user.id, month) == 65.5
+            assert verify_rollups() == []
+    
+    def test_budget_status_total(self, authenticated_client):
+        """Test budget status reads the month total"""
+        response = authenticated_client.get('/api/budget/status')
+        data = json.loads(response.data)['data']
+        assert data['total_spent'] == 65.5
+    
+    def test_verify_and_rebuild_commands(self, app, runner, init_database):
+        """Test drift is reported by verify and fixed by rebuild"""
+        from app.models import db, SpendingRollup
+        with app.app_context():
+            row = SpendingRollup.query.first()
+            row.total_amount += 10
+            db.session.commit()
+        
+        result = runner.invoke(args=['rollups', 'verify'])
+        assert result.exit_code != 0
+        assert 'drifted' in result.output
+        
+        result = runner.invoke(args=['rollups', 'rebuild'])
+        assert result.exit_code == 0
+        result = runner.invoke(args=['rollups', 'verify'])
+        assert result.exit_code == 0
+    
+    def test_backfill_empty_tables(self, app, init_database):
+        """Test rollup tables left empty by an upgrade are rebuilt from expenses"""
+        from app.models import db, SpendingRollup, User
+        from app.rollups import backfill_rollups, monthly_total, verify_rollups
+        month = datetime.now().strftime('%Y-%m')
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            assert backfill_rollups() is False
+            SpendingRollup.query.delete()
+            db.session.commit()
+            assert monthly_total(user.id, month) == 0
+            
+            assert backfill_rollups() is True
+            assert monthly_total(user.id, month) == 65.5
+            assert verify_rollups() == []
+
+
+class TestDailySpend:
+    """Test the daily spending table and the prefix-sum store"""
+
+    def test_series_windows(self):
+        """Test window totals, zero-filled days and month totals"""
+        from datetime import date
+        from app.daily_spend import DailySeries
+        series = DailySeries([(date(2024, 1, 30), 10.0), (date(2024, 2, 1), 5.0), (date(2024, 2, 3), 2.5)])
+        assert series.total(date(2024, 1, 31), date(2024, 2, 3)) == 7.5
+        assert series.total(date(2024, 3, 1), date(2024, 3, 31)) == 0
+        assert series.filled(date(2024, 1, 31), date(2024, 2, 3)) == [0.0, 5.0, 0.0, 2.5]
+        assert series.month_totals(2024, until=date(2024, 2, 2))[:3] == [10.0, 5.0, 0]
+
+    def test_store_follows_expense_writes(self, app, authenticated_client, runner):
+        """Test the daily rows stay consistent and committed writes update the store in place"""
+        from datetime import date, timedelta
+        from app.daily_spend import daily_spend_store
+        from app.models import db, DailySpending, User
+        from app.rollups import apply_daily_delta, verify_rollups
+        yesterday = date.today() - timedelta(days=1)
+
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            assert daily_spend_store.series(user.id).filled(yesterday, date.today()) == [0.0, 65.5]
+            loads = daily_spend_store.loads
+
+        response = authenticated_client.post('/api/expenses', json={
+            'item': 'Movie', 'amount': 100.0, 'category': 'Entertainment', 'date': yesterday.isoformat()
+        })
+        expense_id = json.loads(response.data)['data']['id']
+        with app.app_context():
+            assert daily_spend_store.series(user.id).filled(yesterday, date.today()) == [100.0, 65.5]
+            assert daily_spend_store.loads == loads
+            assert verify_rollups() == []
+
+            # Rolled back changes never reach the store
+            apply_daily_delta(user.id, yesterday, 50.0, 1)
+            db.session.rollback()
+            assert daily_spend_store.series(user.id).filled(yesterday, date.today()) == [100.0, 65.5]
+
+            DailySpending.query.filter_by(user_id=user.id, day=yesterday).first().total_amount = 1
+            db.session.commit()
+
+        result = runner.invoke(args=['rollups', 'verify'])
+        assert result.exit_code != 0
+        assert f'day={yesterday.isoformat()}' in result.output
+
+        week = json.loads(authenticated_client.get('/api/visualization/data?period=week').data)['data']
+        assert [point['amount'] for point in week['trends'][-2:]] == [100.0, 65.5]
+
+        authenticated_client.delete(f'/api/expenses/{expense_id}')
+        with app.app_context():
+            series = daily_spend_store.series(user.id)
+            assert series.filled(yesterday, date.today()) == [0.0, 65.5] and len(series) == 1
+            assert daily_spend_store.loads == loads
+
+    def test_history_bound_and_backfill(self, app, init_database):
+        """Test only recent days are loaded and an empty daily table is rebuilt at startup"""
+        from datetime import date, timedelta
+        from app.daily_spend import DailySpendStore
+        from app.models import db, DailySpending, Expense, User
+        from app.rollups import backfill_rollups, rebuild_rollups, verify_rollups
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            db.session.add(Expense(user_id=user.id, item='Rent', amount=900.0, category='Bills & Utilities',
+                                   date=date.today() - timedelta(days=40)))
+            db.session.commit()
+            rebuild_rollups()
+
+            series = DailySpendStore(history_days=30).series(user.id)
+            assert len(series) == 1 and series.total(date.today() - timedelta(days=29), date.today()) == 65.5
+
+            DailySpending.query.delete()
+            db.session.commit()
+            assert backfill_rollups() is True
+            assert verify_rollups() == []
+            assert len(DailySpendStore().series(user.id)) == 2
+
+
+class TestDateRanges:
+    """Test half-open date range helpers and the composite index"""
+    
+    def test_period_range(self):
+        """Test rolling period bounds end the day after today"""
+        from datetime import date
+        from app.date_ranges import period_range
+        today = date(2025, 3, 10)
+        assert period_range('week', today) == (date(2025, 3, 3), date(2025, 3, 11))
+        assert period_range('year', today) == (date(2024, 3, 10), date(2025, 3, 11))
+        assert period_range('unknown', today) == period_range('week', today)
+    
+    def test_user_date_index(self, app):
+        """Test the composite (user_id, date) index exists"""
+        from sqlalchemy import inspect
+        from app.models import db
+        with app.app_context():
+            indexes = {index['name']: index['column_names'] for index in inspect(db.engine).get_indexes('expenses')}
+            assert indexes['ix_expenses_user_date'] == ['user_id', 'date']
+
+
 # ============================================================================
 # AI FEATURES TESTS
 # ============================================================================
@@ -171,6 +741,823 @@ class TestAIFeatures:
         assert response.status_code in [200, 503]
 
 
+class TestInsightsCache:
+    """Test AI insights cached on a fingerprint of the user's expenses"""
+    
+    def test_insights_served_until_expenses_change(self, authenticated_client, mocker):
+        """Test repeated requests reuse one model call until an expense is written"""
+        from app.ai_insights import AIInsightsGenerator
+        from app.insights_cache import insights_cache
+        insights_cache.clear()
+        generator = AIInsightsGenerator()
+        generator.model = FakeGeminiModel(text='{"insights": ["a"], "recommendations": ["b"], "patterns": ["c"]}')
+        mocker.patch('app.routes.get_ai_insights', return_value=generator)
+        
+        statuses = [json.loads(authenticated_client.get('/api/insights?period=month').data)['cache'] for _ in range(3)]
+        assert statuses == ['miss', 'hit', 'hit']
+        assert generator.model.calls == 1
+        assert json.loads(authenticated_client.get('/api/insights?period=week').data)['cache'] == 'miss'
+        
+        authenticated_client.post('/api/expenses', json={
+            'item': 'Movie', 'category': 'Entertainment', 'amount': 300,
+            'date': datetime.now().strftime('%Y-%m-%d')
+        })
+        response = json.loads(authenticated_client.get('/api/insights?period=month').data)
+        assert response['cache'] == 'miss'
+        assert response['data']['analytics']['total_expenses'] == 3
+        assert generator.model.calls == 3
+    
+    def test_fingerprint_and_stale_while_revalidate(self, app, init_database, mocker):
+        """Test writes from elsewhere are detected and stale results refresh in the background"""
+        import time
+        from app.insights_cache import InsightsCache, data_fingerprint
+        from app.models import db, Expense, User
+        cache = InsightsCache(stale_while_revalidate=True)
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            
+            def compute():
+                total = sum(e.amount for e in Expense.query.filter_by(user_id=user.id))
+                return {'total': total, 'generated_at': 'now'}
+            
+            assert cache.get_or_compute(app, user.id, 'all', compute) == ({'total': 65.5, 'generated_at': 'now'}, 'miss')
+            assert cache.get_or_compute(app, user.id, 'all', compute)[1] == 'hit'
+            
+            # Another worker's write, never invalidated here
+            Expense.query.filter_by(user_id=user.id, item='Uber Ride').first().amount = 20.0
+            db.session.commit()
+            result, status = cache.get_or_compute(app, user.id, 'all', compute)
+            assert (result['total'], status) == (65.5, 'stale')
+            for _ in range(50):
+                if cache.get_or_compute(app, user.id, 'all', compute)[1] == 'hit':
+                    break
+                time.sleep(0.02)
+            assert cache.get_or_compute(app, user.id, 'all', compute) == ({'total': 70.0, 'generated_at': 'now'}, 'hit')
+            assert cache.stats()['refreshes'] >= 1
+            
+            # Fallback answers are not cached
+            fallback = {'insights': [], 'source': 'fallback', 'generated_at': 'now'}
+            assert cache.get_or_compute(app, user.id, 'week', lambda: fallback)[1] == 'miss'
+            assert cache.get_or_compute(app, user.id, 'week', lambda: fallback)[1] == 'miss'
+            
+            # An outdated entry's miss reads the fingerprint once
+            plain = InsightsCache()
+            plain.get_or_compute(app, user.id, 'all', compute)
+            Expense.query.filter_by(user_id=user.id, item='Uber Ride').first().amount = 30.0
+            db.session.commit()
+            fingerprints = mocker.patch('app.insights_cache.data_fingerprint', wraps=data_fingerprint)
+            assert plain.get_or_compute(app, user.id, 'all', compute) == ({'total': 80.0, 'generated_at': 'now'}, 'miss')
+            assert fingerprints.call_count == 1
+    
+    def test_model_failure_not_cached(self, app, init_database):
+        """Test insights from a failed model call are served but not cached"""
+        from app.ai_insights import AIInsightsGenerator
+        from app.insights_cache import InsightsCache
+        from app.insights_precompute import load_insights_expenses
+        from app.llm_client import LLMClient
+        from app.models import User
+        cache = InsightsCache()
+        generator = AIInsightsGenerator(llm=LLMClient(timeout=1))
+        generator.model = FakeGeminiModel(text='{"insights": ["a"], "recommendations": ["b"], "patterns": ["c"]}',
+                                          failures=1)
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            
+            def compute():
+                return generator.generate_insights(load_insights_expenses(user.id), 'month')
+            
+            result, status = cache.get_or_compute(app, user.id, 'month', compute)
+            assert (status, result['source']) == ('miss', 'fallback')
+            result, status = cache.get_or_compute(app, user.id, 'month', compute)
+            assert (status, result['source'], result['insights']) == ('miss', 'ai', ['a'])
+            assert cache.get_or_compute(app, user.id, 'month', compute)[1] == 'hit'
+            assert generator.model.calls == 2
+
+
+class TestInsightsPrecompute:
+    """Test stored insights and their off-peak precomputation"""
+
+    def test_due_users_and_window(self, app, init_database):
+        """Test changed users come before outdated ones and the window wraps midnight"""
+        from datetime import date, time, timedelta
+        from app.ai_insights import AIInsightsGenerator
+        from app.insights_precompute import InsightsPrecomputer, due_jobs, in_window, parse_window
+        from app.models import db, Expense, StoredInsights, User
+        generator = AIInsightsGenerator()
+        generator.model = FakeGeminiModel(text='{"insights": ["a"], "recommendations": ["b"], "patterns": ["c"]}')
+        precomputer = InsightsPrecomputer()
+        precomputer.periods = ('week',)
+        with app.app_context():
+            user, user2 = User.query.order_by(User.id).all()
+            db.session.add(Expense(user_id=user2.id, item='Tea', amount=10.0, category='Food & Dining',
+                                   date=date.today()))
+            db.session.commit()
+
+            assert precomputer.run_once(generator)['generated'] == 2
+            assert generator.model.calls == 2
+            assert due_jobs(('week',), 30) == []
+
+            StoredInsights.query.filter_by(user_id=user2.id).first().computed_on = date.today() - timedelta(days=1)
+            Expense.query.filter_by(user_id=user.id, item='Uber Ride').first().amount = 20.0
+            db.session.commit()
+            assert due_jobs(('week',), 30) == [(user.id, 'week'), (user2.id, 'week')]
+            assert due_jobs(('week',), 30, limit=1) == [(user.id, 'week')]
+
+        window = parse_window('23:30-05:00')
+        assert in_window(window, datetime.combine(date.today(), time(1, 0)))
+        assert not in_window(window, datetime.combine(date.today(), time(12, 0)))
+        assert in_window(None, datetime.now())
+
+    def test_cli_precompute_then_route_reads(self, authenticated_client, runner, mocker):
+        """Test the cron command stores results that /api/insights serves without a model call"""
+        from app.ai_insights import AIInsightsGenerator
+        from app.insights_cache import insights_cache
+        generator = AIInsightsGenerator()
+        generator.model = FakeGeminiModel(text='{"insights": ["a"], "recommendations": ["b"], "patterns": ["c"]}')
+        mocker.patch('app.routes.get_ai_insights', return_value=generator)
+
+        result = runner.invoke(args=['insights', 'precompute'])
+        assert result.exit_code == 0
+        assert 'Generated 2 of 2' in result.output
+        assert generator.model.calls == 2
+
+        insights_cache.clear()
+        response = json.loads(authenticated_client.get('/api/insights?period=month').data)
+        assert response['data']['insights'] == ['a']
+        assert generator.model.calls == 2
+        assert 'Generated 0 of 0' in runner.invoke(args=['insights', 'precompute']).output
+
+    def test_model_failure_not_stored(self, app, init_database):
+        """Test a pass against a failing model stores nothing and leaves the pair due"""
+        from app.ai_insights import AIInsightsGenerator
+        from app.insights_precompute import InsightsPrecomputer, due_jobs
+        from app.llm_client import LLMClient
+        from app.models import StoredInsights, User
+        generator = AIInsightsGenerator(llm=LLMClient(timeout=1))
+        generator.model = FakeGeminiModel(text='{"insights": ["a"], "recommendations": ["b"], "patterns": ["c"]}',
+                                          failures=1)
+        precomputer = InsightsPrecomputer()
+        precomputer.periods = ('month',)
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            summary = precomputer.run_once(generator)
+            assert (summary['due'], summary['fallback'], summary['generated']) == (1, 1, 0)
+            assert StoredInsights.query.count() == 0
+            assert due_jobs(('month',), 30) == [(user.id, 'month')]
+
+            assert precomputer.run_once(generator)['generated'] == 1
+            assert StoredInsights.query.filter_by(user_id=user.id, period='month').first().source == 'precompute'
+            assert due_jobs(('month',), 30) == []
+            assert generator.model.calls == 2
+
+
+class TestSpendingColumns:
+    """Test the NumPy analytics kernel behind AI insights"""
+    
+    def test_column_analytics(self):
+        """Test column analytics and period cutoffs"""
+        from app.spending_columns import SpendingColumns
+        today = datetime.now().date()
+        
+        def day(days_ago):
+            return (today - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+        
+        expenses = [
+            {'date': day(days_ago), 'category': category, 'amount': amount}
+            for days_ago, category, amount in [
+                (0, 'Food & Dining', 120.5), (0, 'Shopping', 999.0), (3, 'Food & Dining', 80.25),
+                (6, 'Transportation', 45.0), (7, 'Shopping', 300.0), (29, 'Others', 12.0), (45, 'Healthcare', 500.0)
+            ]
+        ]
+        columns = SpendingColumns.from_records(expenses)
+        assert [len(columns.for_period(period)) for period in ('week', 'month', 'all')] == [4, 6, 7]
+        
+        month = columns.for_period('month').analytics('month')
+        assert (month['total_amount'], month['total_expenses'], month['period']) == (1556.75, 6, 'month')
+        assert month['category_breakdown'] == {'Food & Dining': 200.75, 'Shopping': 1299.0,
+                                               'Transportation': 45.0, 'Others': 12.0}
+        assert month['category_counts'] == {'Food & Dining': 2, 'Shopping': 2, 'Transportation': 1, 'Others': 1}
+        assert month['category_percentages']['Shopping'] == pytest.approx(1299.0 / 1556.75 * 100)
+        assert month['daily_spending'] == {day(29): 12.0, day(7): 300.0, day(6): 45.0, day(3): 80.25, day(0): 1119.5}
+        assert month['avg_daily_spending'] == 311.35
+        assert month['top_categories'] == [('Shopping', 1299.0), ('Food & Dining', 200.75), ('Transportation', 45.0)]
+        assert month['date_range'] == {'start': day(29), 'end': day(0)}
+    
+    def test_insights_routes_use_columns(self, authenticated_client, app, mocker):
+        """Test the insights and trends routes read the user's expenses as columns"""
+        from app.ai_insights import AIInsightsGenerator
+        from app.insights_cache import insights_cache
+        from app.models import User
+        from app.spending_columns import SpendingColumns
+        insights_cache.clear()
+        generator = AIInsightsGenerator()
+        generator.model = FakeGeminiModel(text='{"insights": [], "recommendations": [], "patterns": []}')
+        mocker.patch('app.routes.get_ai_insights', return_value=generator)
+        with app.app_context():
+            columns = SpendingColumns.for_user(User.query.filter_by(username='testuser').first().id)
+        assert len(columns) == 2 and sorted(columns.categories) == ['Food & Dining', 'Transportation']
+        
+        analytics = json.loads(authenticated_client.get('/api/insights?period=all').data)['data']['analytics']
+        assert analytics['total_amount'] == 65.5
+        assert analytics['category_counts'] == {'Food & Dining': 1, 'Transportation': 1}
+        trends = json.loads(authenticated_client.get('/api/insights/trends').data)['data']
+        assert trends['message'] == 'Insufficient data for trend analysis'
+
+
+class TestTrends:
+    """Test the day-filled trend engine behind /api/insights/trends"""
+    
+    def test_slope_rolling_means_and_anomalies(self):
+        """Test a rising series with one spike, and the window cutoff"""
+        from datetime import date
+        from app.daily_spend import DailySeries
+        from app.spending_columns import day_number
+        from app.trends import trend_report
+        today = date(2024, 3, 31)  # a Sunday
+        start = today - timedelta(days=29)
+        days = [(today - timedelta(days=30 - offset), 100 + 5 * offset) for offset in range(31) if offset % 7 != 3]
+        days.append((date(2024, 3, 20), 5000))
+        days.append((date(2023, 1, 1), 99999))
+        totals = {}
+        for day, amount in days:
+            totals[day] = totals.get(day, 0) + amount
+        
+        report = trend_report(DailySeries(sorted(totals.items())).filled(start, today), day_number(start))
+        assert report['trend'] == 'increasing' and report['slope_per_day'] > 0
+        assert len(report['series']) == 30 and report['series'][-1]['date'] == '2024-03-31'
+        # Last 7 days are offsets 24-30, with offset 24 skipped
+        assert report['series'][-1]['rolling_7'] == pytest.approx(sum(100 + 5 * o for o in range(25, 31)) / 7, abs=0.01)
+        assert [a['date'] for a in report['anomalies']] == ['2024-03-20']
+        assert report['weekday'][6]['day'] == 'Sunday' and report['weekday'][6]['index'] < 2
+        # Days without expenses are zero in the filled series
+        assert min(entry['total'] for entry in report['series']) == 0
+    
+    def test_trends_route_honors_days(self, authenticated_client):
+        """Test the days window bounds the series and is validated"""
+        for days_ago, amount in [(1, 40), (3, 60), (20, 5000)]:
+            authenticated_client.post('/api/expenses', json={
+                'item': 'Chai', 'category': 'Food & Dining', 'amount': amount,
+                'date': (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+            })
+        
+        week = json.loads(authenticated_client.get('/api/insights/trends?days=7').data)['data']
+        assert week['days'] == 7 and len(week['series']) == 7
+        assert week['first_half_total'] + week['second_half_total'] == 165.5
+        assert week['series'][0]['date'] == (datetime.now() - timedelta(days=6)).strftime('%Y-%m-%d')
+        assert json.loads(authenticated_client.get('/api/insights/trends?days=5000').data)['data']['days'] == 366
+        assert authenticated_client.get('/api/insights/trends?days=week').status_code == 400
+
+
+class TestKeywordMatcher:
+    """Test the compiled rule-based keyword matcher"""
+    
+    def test_word_boundaries_and_weights(self):
+        """Test keywords match whole words (plurals allowed) with weighted hits"""
+        from app.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher(
+            {'Food & Dining': ['dal', 'tea', 'ice cream'], 'Education': ['book']},
+            weights={'Food & Dining': 1.2}
+        )
+        assert matcher.find('Gold medal for the team') == []
+        hits = matcher.find('Dal and ice cream, two books')
+        assert [(hit.keyword, hit.category, hit.weight) for hit in hits] == [
+            ('dal', 'Food & Dining', 1.2), ('ice cream', 'Food & Dining', 1.2), ('book', 'Education', 1.0)
+        ]
+        assert [entry.category for entry in matcher.rank('books and tea')] == ['Food & Dining', 'Education']
+    
+    def test_categorizer_fallbacks(self):
+        """Test rule-based categorization and suggestions use the matcher"""
+        from app.ai_categorizer import AICategorizer
+        categorizer = AICategorizer(None)
+        assert categorizer._fallback_categorization('Gold medal')['category'] == 'Others'
+        assert categorizer._fallback_categorization('Uber Eats order')['category'] == 'Food & Dining'
+        assert categorizer._fallback_categorization('Uber ride')['category'] == 'Transportation'
+        suggestions = categorizer._fallback_suggestions('Grocery shopping')
+        assert [s['category'] for s in suggestions] == ['Food & Dining', 'Shopping']
+        extracted = categorizer._extract_category_from_text('Looks like electricity')
+        assert categorizer.top_category(extracted)['category'] == 'Bills & Utilities'
+
+
+class TestCategorizationCache:
+    """Test the two-tier AI categorization cache"""
+    
+    def test_buckets_and_lru(self):
+        """Test amount buckets and LRU eviction/expiry counters"""
+        from app.categorization_cache import amount_bucket, LRUCache
+        assert amount_bucket(None) == -1
+        assert amount_bucket(20) == amount_bucket(25) != amount_bucket(40)
+        
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert (cache.get('a'), cache.get('b'), cache.evictions) == (1, None, 1)
+        cache.ttl = -1
+        cache.put('d', 4)
+        assert cache.get('d') is None and cache.expirations == 1
+    
+    def test_model_called_once_per_item(self, app, authenticated_client, mocker):
+        """Test repeated and differently written items are served from cache"""
+        from app.ai_categorizer import AICategorizer
+        from app.categorization_cache import categorization_cache
+        categorizer = AICategorizer(None, cache=categorization_cache)
+        categorizer.model = mocker.Mock()
+        categorizer.model.generate_content.side_effect = [
+            mocker.Mock(text='{"category": "Food & Dining", "confidence": 0.97, "reasoning": "Tea"}'),
+            mocker.Mock(text='[{"category": "Food & Dining", "confidence": 0.9, "reason": "Tea"}]')
+        ]
+        
+        with app.test_request_context():
+            categorization_cache.clear()
+            first = categorizer.categorize_expense('Chai', 20)
+            assert categorizer.categorize_expense('  CHAI! ', 25) == first
+            categorization_cache.memory.clear()
+            assert categorizer.categorize_expense('chai', 30)['confidence'] == 0.97
+            
+            suggestions = categorizer.get_suggested_categories('Chai')
+            assert categorizer.get_suggested_categories('chai') == suggestions
+        
+        assert categorizer.model.generate_content.call_count == 2
+        stats = json.loads(authenticated_client.get('/api/categorize/cache').data)['data']
+        assert stats['db_hits'] >= 1 and stats['memory_hits'] >= 2
+
+    def test_db_hit_leaves_session_alone(self, app, init_database):
+        """Test a database hit does not commit the caller's work and its count is written later"""
+        from app.categorization_cache import categorization_cache
+        from app.models import db, CategorizationCacheEntry, Expense, User
+        result = {'category': 'Food & Dining', 'confidence': 0.9}
+        with app.app_context():
+            categorization_cache.clear()
+            categorization_cache.put('scores', 'Samosa', None, result)
+            categorization_cache.memory.clear()
+
+            user = User.query.filter_by(username='testuser').first()
+            db.session.add(Expense(user_id=user.id, item='Half done', amount=1.0,
+                                   category='Others', date=datetime.now().date()))
+            assert categorization_cache.get('scores', 'samosa') == result
+            db.session.rollback()
+            assert Expense.query.filter_by(item='Half done').count() == 0
+
+            categorization_cache.put('scores', 'Vada Pav', None, result)
+            key = categorization_cache.make_key('scores', 'Samosa')
+            assert db.session.get(CategorizationCacheEntry, key).hit_count == 1
+
+
+class TestBatchCategorization:
+    """Test categorizing many items per model call"""
+    
+    def test_batches_with_per_item_fallback(self, mocker):
+        """Test items are packed per prompt and bad answers fall back to rules"""
+        from app.ai_categorizer import AICategorizer
+        categorizer = AICategorizer(None)
+        categorizer.model = mocker.Mock()
+        categorizer.model.generate_content.side_effect = [
+            mocker.Mock(text='Sure! [{"index": 0, "category": "Healthcare", "confidence": 0.9},'
+                             ' {"index": 1, "category": "Snacks"}]'),
+            RuntimeError('quota exceeded')
+        ]
+        
+        results = categorizer.categorize_batch(
+            [('Crocin strip', 40), ('Chai', None), ('Uber ride', 120)], batch_size=2
+        )
+        assert categorizer.model.generate_content.call_count == 2
+        assert [(r['category'], r['method']) for r in results] == [
+            ('Healthcare', 'ai'), ('Food & Dining', 'rule_based'), ('Transportation', 'rule_based')
+        ]
+        assert '"Crocin strip"' in categorizer.model.generate_content.call_args_list[0].args[0]
+    
+    def test_batch_endpoint(self, authenticated_client, mocker):
+        """Test the batch endpoint answers in order and validates input"""
+        mocker.patch('app.routes.get_ai_categorizer', return_value=None)
+        response = authenticated_client.post('/api/categorize/batch', json={
+            'items': ['Netflix plan', {'item': 'Dal fry', 'amount': 180}]
+        })
+        assert response.status_code == 200
+        data = json.loads(response.data)['data']
+        assert [(d['item'], d['category']) for d in data] == [
+            ('Netflix plan', 'Entertainment'), ('Dal fry', 'Food & Dining')
+        ]
+        
+        response = authenticated_client.post('/api/categorize/batch', json={'items': ['ok', '']})
+        assert response.status_code == 400
+
+
+class TestCategoryScores:
+    """Test categorization and suggestions as views of one scoring pass"""
+    
+    def test_one_model_call_serves_both_endpoints(self, app, authenticated_client, mocker):
+        """Test /api/categorize and /suggestions share one scored, cached answer"""
+        from app.ai_categorizer import AICategorizer
+        from app.categorization_cache import categorization_cache
+        categorizer = AICategorizer(None, cache=categorization_cache)
+        categorizer.model = FakeGeminiModel(text=json.dumps({
+            'scores': {'Food & Dining': 0.7, 'Shopping': 0.2, 'Others': 0.1},
+            'reasons': {'Food & Dining': 'Sweets shop', 'Shopping': 'Gift box'},
+            'reasoning': 'Sweets shop'
+        }))
+        mocker.patch('app.routes.get_ai_categorizer', return_value=categorizer)
+        with app.app_context():
+            categorization_cache.clear()
+        
+        result = json.loads(authenticated_client.post('/api/categorize', json={'item': 'Haldiram Kaju Katli'}).data)['data']
+        suggestions = json.loads(authenticated_client.post(
+            '/api/categorize/suggestions', json={'item': 'haldiram kaju katli'}
+        ).data)['data']
+        assert categorizer.model.calls == 1
+        assert (result['category'], result['confidence'], result['method']) == ('Food & Dining', 0.7, 'ai')
+        assert suggestions == [
+            {'category': 'Food & Dining', 'confidence': 0.7, 'reason': 'Sweets shop'},
+            {'category': 'Shopping', 'confidence': 0.2, 'reason': 'Gift box'},
+            {'category': 'Others', 'confidence': 0.1, 'reason': 'Sweets shop'}
+        ]
+    
+    def test_distributions(self, authenticated_client):
+        """Test scores cover every category, are normalized and ranked deterministically"""
+        from app.ai_categorizer import AICategorizer
+        categorizer = AICategorizer(None)
+        scored = categorizer._parse_ai_response(
+            '{"scores": {"Healthcare": 3, "Education": 1, "Travel": 5, "Others": -1}}'
+        )
+        assert [entry['category'] for entry in scored['scores']][:3] == ['Healthcare', 'Education', 'Food & Dining']
+        assert [entry['probability'] for entry in scored['scores']][:2] == [0.75, 0.25]
+        assert len(scored['scores']) == len(categorizer.categories)
+        
+        # Without an API key the scores endpoint ranks by the keyword rules
+        response = authenticated_client.post('/api/categorize/scores', json={'item': 'Grocery shopping'})
+        scores = json.loads(response.data)['data']['scores']
+        assert [(s['category'], s['probability']) for s in scores[:2]] == [('Food & Dining', 0.85), ('Shopping', 0.15)]
+        assert sum(s['probability'] for s in scores) == pytest.approx(1.0)
+
+
+class TestTypeahead:
+    """Test instant typeahead answers and background refinement"""
+    
+    def _wait_for(self, condition, timeout=2.0):
+        import time
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+    
+    def test_prefix_index_and_shared_merchants(self, app, init_database):
+        """Test prefix completion ranking and that rare items stay private"""
+        from app.typeahead import PrefixIndex, load_merchants
+        index = PrefixIndex([
+            ('swiggy', 'Food & Dining', 40), ('swiggy instamart', 'Food & Dining', 12),
+            ('swift dzire service', 'Transportation', 3), ('sweets', 'Food & Dining', 1),
+            ('swiggy', 'Others', 2)
+        ], max_completions=2)
+        assert [phrase for phrase, _, _ in index.complete('sw')] == ['swiggy', 'swiggy instamart']
+        assert [phrase for phrase, _, _ in index.complete('swif')] == ['swift dzire service']
+        assert index.get('swiggy') == ('Food & Dining', 40) and index.get('swig') is None
+        
+        with app.app_context():
+            assert load_merchants(min_users=3) == []
+            assert ('grocery shopping', 'Food & Dining', 1) in load_merchants(min_users=1)
+    
+    def test_instant_answer_then_refinement(self, app, authenticated_client, init_database, mocker):
+        """Test rules answer at once, the model refines out of band into the cache"""
+        from app.ai_categorizer import AICategorizer
+        from app.categorization_cache import categorization_cache
+        from app.category_memory import category_memory
+        from app.models import User
+        categorizer = AICategorizer(None, cache=categorization_cache)
+        categorizer.model = FakeGeminiModel(delays=[0.05])
+        mocker.patch('app.routes.get_ai_categorizer', return_value=categorizer)
+        with app.app_context():
+            categorization_cache.clear()
+            user_id = User.query.filter_by(username='testuser').first().id
+        category_memory.forget(user_id)
+        
+        data = json.loads(authenticated_client.get('/api/categorize/typeahead?q=Kaju katli box').data)['data']
+        assert data['result']['method'] == 'fallback'
+        assert data['elapsed_ms'] < 50
+        token = data['refinement']
+        
+        assert self._wait_for(lambda: json.loads(
+            authenticated_client.get(f'/api/categorize/typeahead/{token}').data
+        )['data']['status'] == 'done')
+        refined = json.loads(authenticated_client.get(f'/api/categorize/typeahead/{token}').data)['data']
+        assert (refined['result']['category'], refined['result']['method']) == ('Food & Dining', 'ai')
+        
+        # Later keystrokes find the refined answer in the cache; no new model call
+        again = json.loads(authenticated_client.get('/api/categorize/typeahead?q=kaju katli box').data)['data']
+        assert again['result']['category'] == 'Food & Dining' and again['refinement'] is None
+        assert categorizer.model.calls == 1
+        
+        # The user's own items complete once their memory has loaded
+        assert self._wait_for(lambda: category_memory.loaded(user_id))
+        data = json.loads(authenticated_client.get('/api/categorize/typeahead?q=groc&refine=0').data)['data']
+        assert data['completions'][0] == {'item': 'grocery shopping', 'category': 'Food & Dining'}
+        assert data['refinement'] is None
+        assert authenticated_client.delete('/api/categorize/typeahead/unknown').status_code == 404
+    
+    def test_refinements_replace_and_clean_up(self, app):
+        """Test a new keystroke cancels the queued refinement and finished ones are forgotten"""
+        import threading
+        from app.typeahead import Typeahead
+        release = threading.Event()
+        
+        class SlowRefiner:
+            def categorize_expense(self, key):
+                release.wait(5)
+                return {'category': 'Others', 'item': key}
+        
+        typeahead = Typeahead()
+        typeahead.workers = 1
+        running = typeahead.refine(app, 7, 'chai', SlowRefiner())
+        assert self._wait_for(lambda: typeahead._jobs[running]['future'].running())
+        queued = typeahead.refine(app, 7, 'chai t', SlowRefiner())
+        latest = typeahead.refine(app, 7, 'chai tea', SlowRefiner())
+        assert typeahead.refine(app, 7, 'chai tea', SlowRefiner()) == latest
+        assert typeahead.status(7, queued)['status'] == 'cancelled'
+        
+        release.set()
+        assert self._wait_for(lambda: typeahead.status(7, latest)['status'] == 'done')
+        assert typeahead.status(7, running)['status'] == 'done'
+        assert typeahead._pending == {}
+
+
+class TestLocalClassifier:
+    """Test the local naive Bayes category classifier"""
+    
+    SAMPLES = [
+        ('Swiggy order', 'Food & Dining'), ('Zomato dinner', 'Food & Dining'), ('Swiggy instamart', 'Food & Dining'),
+        ('Ola ride', 'Transportation'), ('Rapido bike', 'Transportation'), ('Ola outstation', 'Transportation'),
+        ('Airtel postpaid', 'Bills & Utilities'), ('Bescom bill', 'Bills & Utilities')
+    ] * 5
+    
+    def test_train_predict_and_reload(self, tmp_path):
+        """Test training, prediction and .npz round trip"""
+        from app.local_classifier import LocalClassifier
+        classes = ['Food & Dining', 'Transportation', 'Bills & Utilities', 'Others']
+        model = LocalClassifier.train(self.SAMPLES, classes)
+        (food, food_confidence), (ride, _), (empty, _) = model.predict(['SWIGGY #4411', 'ola cabs', '!!'])
+        assert (food, ride, empty) == ('Food & Dining', 'Transportation', None)
+        
+        path = str(tmp_path / 'model.npz')
+        model.save(path)
+        loaded = LocalClassifier.load(path)
+        assert loaded.predict(['SWIGGY #4411'])[0] == (food, food_confidence)
+        assert loaded.trained_on == len(self.SAMPLES)
+        
+        # Saved where asked even without the .npz extension
+        path = str(tmp_path / 'model')
+        model.save(path)
+        assert LocalClassifier.load(path).predict(['ola cabs'])[0][0] == 'Transportation'
+    
+    def test_confident_predictions_skip_llm(self, app, runner, init_database, tmp_path, mocker):
+        """Test the trained model answers before the LLM and unsure items escalate"""
+        from app.ai_categorizer import AICategorizer
+        from app.local_classifier import LocalClassifier
+        from app.models import db, Expense, User
+        mocker.patch.dict(app.config, {'LOCAL_CLASSIFIER_PATH': str(tmp_path / 'model.npz')})
+        
+        with app.app_context():
+            user = User.query.filter_by(username='testuser2').first()
+            db.session.add_all([
+                Expense(user_id=user.id, item=item, category=category, amount=10, date=datetime.now().date())
+                for item, category in self.SAMPLES
+            ])
+            db.session.commit()
+        result = runner.invoke(args=['classifier', 'train'])
+        assert 'Trained on' in result.output
+        
+        categorizer = AICategorizer(None, classifier=LocalClassifier.load(str(tmp_path / 'model.npz')))
+        categorizer.model = mocker.Mock()
+        categorizer.model.generate_content.return_value = mocker.Mock(
+            text='{"category": "Others", "confidence": 0.6, "reasoning": "Unknown"}'
+        )
+        local = categorizer.categorize_expense('Swiggy order #88')
+        assert (local['category'], local['method']) == ('Food & Dining', 'local_model')
+        assert categorizer.model.generate_content.call_count == 0
+        
+        categorizer.classifier_cutoff = 1.1
+        assert categorizer.categorize_expense('Swiggy order #88')['method'] == 'ai'
+
+
+
+class TestCategoryMemory:
+    """Test the per-user memory of past categorizations"""
+    
+    def test_past_choice_answers_first(self, authenticated_client, init_database, mocker):
+        """Test remembered and corrected categories win over rules and the LLM"""
+        get_categorizer = mocker.patch('app.routes.get_ai_categorizer')
+        response = authenticated_client.post('/api/categorize', json={'item': 'GROCERY shopping!'})
+        result = json.loads(response.data)['data']
+        assert (result['category'], result['method']) == ('Food & Dining', 'user_history')
+        assert get_categorizer.call_count == 0
+        get_categorizer.return_value = None
+        
+        # Correcting the category retrains the memory immediately
+        expense = json.loads(authenticated_client.get('/api/expenses').data)['data']
+        expense_id = next(e['id'] for e in expense if e['item'] == 'Uber Ride')
+        authenticated_client.put(f'/api/expenses/{expense_id}', json={'category': 'Others'})
+        result = json.loads(authenticated_client.post('/api/categorize', json={'item': 'uber ride'}).data)['data']
+        assert result['category'] == 'Others'
+        
+        suggestions = json.loads(authenticated_client.post(
+            '/api/categorize/suggestions', json={'item': 'Uber Ride'}
+        ).data)['data']
+        assert suggestions[0]['category'] == 'Others'
+        assert 'Transportation' in [s['category'] for s in suggestions[1:]]
+        
+        batch = json.loads(authenticated_client.post(
+            '/api/categorize/batch', json={'items': ['uber ride', 'netflix']}
+        ).data)['data']
+        assert [r['method'] for r in batch] == ['user_history', 'rule_based']
+        
+        # Once deleted it is no longer remembered, so the (absent) AI is asked
+        authenticated_client.delete(f'/api/expenses/{expense_id}')
+        response = authenticated_client.post('/api/categorize', json={'item': 'uber ride'})
+        assert response.status_code == 503
+    
+    def test_bounded_with_eviction(self, app, init_database):
+        """Test item and user limits evict the least recently used entries"""
+        from app.category_memory import CategoryMemory
+        from app.models import User
+        memory = CategoryMemory(max_users=1, max_items_per_user=2)
+        with app.app_context():
+            first = User.query.filter_by(username='testuser').first()
+            second = User.query.filter_by(username='testuser2').first()
+            assert memory.lookup(first.id, 'uber ride')['category'] == 'Transportation'
+            memory.record(first.id, 'Chai', 'Food & Dining')
+            memory.record(first.id, 'Chai', 'Food & Dining')
+            memory.record(first.id, 'Chai', 'Others')
+            chai = memory.lookup(first.id, 'chai')
+            assert (chai['category'], chai['confidence']) == ('Food & Dining', 0.67)
+            assert memory.lookup(first.id, 'grocery shopping') is None
+            
+            assert memory.lookup(second.id, 'chai') is None
+            assert memory.stats()['users'] == 1
+            assert memory.stats()['user_evictions'] == 1
+
+
+
+class FakeGeminiModel:
+    """Stands in for a Gemini GenerativeModel with scripted latency and failures"""
+    
+    def __init__(self, text='{"category": "Food & Dining", "confidence": 0.9, "reasoning": "Food"}',
+                 delays=(), failures=0, usage=None):
+        import threading
+        self.text = text
+        self.usage = usage
+        self.delays = list(delays)
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def generate_content(self, contents, **options):
+        import time
+        from types import SimpleNamespace
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+        if call < len(self.delays):
+            time.sleep(self.delays[call])
+        if call < self.failures:
+            raise ConnectionError('503 Service Unavailable')
+        if self.usage:
+            prompt_tokens, output_tokens = self.usage
+            return SimpleNamespace(text=self.text, usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens, candidates_token_count=output_tokens
+            ))
+        return SimpleNamespace(text=self.text)
+
+
+class TestLLMClient:
+    """Test deadlines, hedging and the circuit breaker around model calls"""
+    
+    def test_deadline_and_hedging(self):
+        """Test a stalled call times out and a slow one is won by its hedge"""
+        import time
+        from app.llm_client import LLMClient, LLMTimeoutError, LLMUnavailableError
+        client = LLMClient(timeout=0.2, max_concurrency=2, acquire_timeout=0.05)
+        began = time.monotonic()
+        with pytest.raises(LLMTimeoutError):
+            client.generate(FakeGeminiModel(delays=[0.5]), 'prompt', call_site='categorize')
+        assert time.monotonic() - began < 0.4
+        
+        # The stalled call still holds its slot; with the other taken too, new calls are shed
+        client._slots.acquire()
+        with pytest.raises(LLMUnavailableError):
+            client.generate(FakeGeminiModel(), 'prompt')
+        client._slots.release()
+        time.sleep(0.4)
+        
+        hedged = LLMClient(timeout=1, max_concurrency=2, hedge_after=0.05)
+        model = FakeGeminiModel(text='ok', delays=[0.5, 0])
+        assert hedged.generate(model, 'prompt', call_site='insights') == 'ok'
+        assert model.calls == 2
+        stats = hedged.stats()['call_sites']['insights']
+        assert (stats['ok'], stats['hedges']) == (1, 1)
+        assert stats['latency']['count'] == 1 and stats['latency']['p99_ms'] < 500
+    
+    def test_breaker_trips_to_rule_fallback(self):
+        """Test repeated failures open the breaker and callers use the rules"""
+        import time
+        from app.ai_categorizer import AICategorizer
+        from app.llm_client import LLMClient, CircuitBreaker
+        client = LLMClient(timeout=1, breaker=CircuitBreaker(min_calls=3, reset_seconds=0.1))
+        categorizer = AICategorizer(None, llm=client)
+        categorizer.model = FakeGeminiModel(failures=3)
+        
+        for _ in range(4):
+            result = categorizer.categorize_expense('Pizza Hut')
+            assert result['category'] == 'Food & Dining'
+            assert result['method'] != 'ai'
+        assert categorizer.model.calls == 3
+        assert client.stats()['breaker'] == {'state': 'open', 'trips': 1}
+        assert client.stats()['call_sites']['categorize']['rejected'] == 1
+        
+        # After the reset period one probe goes through and closes it
+        time.sleep(0.1)
+        assert categorizer.categorize_expense('Pizza Hut')['method'] == 'ai'
+        assert client.breaker.state == 'closed'
+
+
+
+class TestGeminiModels:
+    """Test the lazily imported, shared Gemini model registry"""
+    
+    def test_app_startup_skips_sdk_import(self):
+        """Test building the app does not import google.generativeai"""
+        import subprocess
+        import sys
+        output = subprocess.run(
+            [sys.executable, '-c', 'import sys; from app import create_app; create_app(); '
+                                   'print("google.generativeai" in sys.modules)'],
+            capture_output=True, text=True, check=True
+        ).stdout
+        assert output.strip().splitlines()[-1] == 'False'
+        
+        # Without the parent google package the SDK is just unavailable
+        output = subprocess.run(
+            [sys.executable, '-c', 'import sys; sys.modules["google"] = None; '
+                                   'from app.gemini_models import GEMINI_AVAILABLE; print(GEMINI_AVAILABLE)'],
+            capture_output=True, text=True, check=True
+        ).stdout
+        assert output.strip().splitlines()[-1] == 'False'
+    
+    def test_models_reused_until_key_changes(self, mocker):
+        """Test one configure and model per name, redone for a new key"""
+        pytest.importorskip('google.generativeai')
+        from app import gemini_models
+        configure = mocker.patch('google.generativeai.configure')
+        model_class = mocker.patch('google.generativeai.GenerativeModel', side_effect=lambda name: mocker.Mock(name=name))
+        gemini_models.reset()
+        
+        first = gemini_models.get_model(gemini_models.RECEIPT_MODEL, 'key-1')
+        assert gemini_models.get_model(gemini_models.RECEIPT_MODEL, 'key-1') is first
+        gemini_models.get_model(gemini_models.CATEGORIZATION_MODEL, 'key-1')
+        assert (configure.call_count, model_class.call_count) == (1, 2)
+        
+        assert gemini_models.get_model(gemini_models.RECEIPT_MODEL, 'key-2') is not first
+        assert configure.call_count == 2
+        gemini_models.reset()
+
+
+class TestPromptAccounting:
+    """Test compact prompts and per-call-site token accounting"""
+    
+    def test_prompts_share_compact_instructions(self):
+        """Test single and batch prompts open with the same compact category guide"""
+        from app.ai_categorizer import AICategorizer
+        from app.llm_client import estimate_tokens
+        categorizer = AICategorizer(None)
+        single = categorizer._create_categorization_prompt('Paneer Tikka', 250)
+        batch = categorizer._create_batch_prompt([('Paneer Tikka', 250), ('Uber ride', None)])
+        
+        assert single.startswith(AICategorizer.INSTRUCTIONS)
+        assert batch.startswith(AICategorizer.INSTRUCTIONS)
+        assert all(category in AICategorizer.INSTRUCTIONS for category in categorizer.categories)
+        assert '  ' not in single and '\n\n' not in single
+        assert estimate_tokens(single) < 250
+        assert '[{"index":0,"item":"Paneer Tikka","amount":250}' in batch
+    
+    def test_token_accounting_per_call_site(self, authenticated_client, mocker):
+        """Test reported and estimated tokens are totalled per call site and logged"""
+        from app.llm_client import LLMClient, IMAGE_TOKENS
+        client = LLMClient(timeout=1)
+        client.usage_log_every = 2
+        log = mocker.patch('builtins.print')
+        
+        client.generate(FakeGeminiModel(text='ok', usage=(120, 30)), 'prompt', call_site='categorize')
+        client.generate(FakeGeminiModel(text='12345678'), ['a' * 40, object()], call_site='receipt')
+        stats = client.stats()['call_sites']
+        assert (stats['categorize']['prompt_tokens'], stats['categorize']['output_tokens']) == (120, 30)
+        assert stats['categorize']['estimated_tokens'] == 0
+        assert stats['receipt']['prompt_tokens'] == 10 + IMAGE_TOKENS
+        assert stats['receipt']['avg_output_tokens'] == 2
+        assert stats['receipt']['estimated_tokens'] == 1
+        assert 'categorize 1 ok, avg 120/30 tokens' in log.call_args[0][0]
+        
+        response = authenticated_client.get('/api/llm/stats')
+        assert response.status_code == 200
+        assert 'call_sites' in response.get_json()['data']
+
+
 # ============================================================================
 # VISUALIZATION TESTS
 # ============================================================================
@@ -184,6 +1571,38 @@ class TestVisualization:
         assert response.status_code == 200
 
 
+class TestVisualizationPeriods:
+    """Test period filtering and trend buckets computed in the query"""
+    
+    def test_period_cutoff_and_buckets(self, authenticated_client):
+        """Test older expenses fall out of the week view but not the month view"""
+        from datetime import timedelta
+        older = (datetime.now() - timedelta(days=20)).strftime('%Y-%m-%d')
+        authenticated_client.post('/api/expenses', json={
+            'item': 'Books', 'amount': 30.0, 'category': 'Education', 'date': older
+        })
+        
+        week = json.loads(authenticated_client.get('/api/visualization/data?period=week').data)['data']
+        assert week['total_amount'] == 65.5
+        assert len(week['trends']) == 7
+        assert week['trends'][-1]['amount'] == 65.5
+        
+        month = json.loads(authenticated_client.get('/api/visualization/data?period=month').data)['data']
+        assert month['total_amount'] == 95.5
+        assert len(month['trends']) == 30
+        assert {'period': older, 'label': older[-2:], 'amount': 30.0} in month['trends']
+        
+        year = json.loads(authenticated_client.get('/api/visualization/data?period=year').data)['data']
+        assert len(year['trends']) == 12
+    
+    def test_empty_user(self, client, init_database):
+        """Test a user without expenses gets empty chart data"""
+        client.post('/login', data={'username': 'testuser2', 'password': 'password123'})
+        response = client.get('/api/visualization/data?period=week')
+        assert response.status_code == 200
+        assert json.loads(response.data)['data']['pie_chart'] == []
+
+
 # ============================================================================
 # MODEL TESTS
 # ============================================================================